@@ -1,5 +1,5 @@
 import apiService from './apiService';
-import { Chat, Message } from '@/types';
+import { Chat, Message, MessagePage } from '@/types';
 
 class ChatService {
   private baseEndpoint = '/chats';
@@ -26,8 +26,12 @@ class ChatService {
     });
   }
 
-  async getMessages(chatId: string) {
-    return apiService.get<Message[]>(`${this.baseEndpoint}/${chatId}/messages`);
+  async getMessages(chatId: string, cursor?: string, limit = 50) {
+    const params: Record<string, string> = { limit: String(limit) };
+    if (cursor) {
+      params.cursor = cursor;
+    }
+    return apiService.get<MessagePage>(`${this.baseEndpoint}/${chatId}/messages`, params);
   }
 
   async deleteMessage(chatId: string, messageId: string) {
@@ -17,6 +17,12 @@ export interface Message {
   toolCalls?: ToolCall[];
 }
 
+// Messages newest first; pass next_cursor back as `cursor` for older messages
+export interface MessagePage {
+  messages: Message[];
+  next_cursor: string | null;
+}
+
 export interface Chat {
   id: string;
   title: string;
@@ -15,6 +15,9 @@ from .tools.timeline_generation_tool import TimelineGenerationTool
 from .tools.budget_generation_tool import BudgetGenerationTool
 from .tools.image_generation_tool import ImageGenerationTool
 from .tools.tool_router import ToolRouter
+from .tracing import traced
+from .deadline import DeadlineExceeded
+from .logging_config import SAMPLED, LazyJson
 
 
 class AgentHandler:
@@ -88,6 +91,7 @@ class AgentHandler:
         
         return StorageClientPlaceholder()
         
+    @traced("process_request")
     async def process_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
         """
         Process a user request using the appropriate tools.
@@ -103,15 +107,15 @@ class AgentHandler:
             user_id = request.get("user_id", "")
             project_id = request.get("project_id", "")
             
-            logging.info(f"Processing request: {task}")
+            logging.info("Processing request: %s", task, extra=SAMPLED)
             
             # Select appropriate tools for the task
             selected_tools = await self.tool_router.select_tools(task)
-            logging.info(f"Selected tools: {selected_tools}")
+            logging.info("Selected tools: %s", selected_tools, extra=SAMPLED)
             
             # Determine tool calls
             tool_calls = await self._determine_tool_calls(task, selected_tools)
-            logging.info(f"Determined tool calls: {json.dumps(tool_calls)}")
+            logging.info("Determined tool calls: %s", LazyJson(tool_calls), extra=SAMPLED)
             
             # Execute the tools
             context = {
@@ -124,14 +128,18 @@ class AgentHandler:
             response = self._format_response(results)
             return response
             
+        except DeadlineExceeded:
+            # The caller has given up; let the endpoint answer 504
+            raise
         except Exception as e:
-            logging.error(f"Error processing request: {str(e)}")
+            logging.error("Error processing request: %s", e)
             return {
                 "status": "error",
                 "error": str(e),
                 "message": "Failed to process request"
             }
     
+    @traced("determine_tool_calls")
     async def _determine_tool_calls(self, task: str, selected_tools: List[str]) -> List[Dict[str, Any]]:
         """
         Determine the specific tool calls to make for the task.
@@ -0,0 +1,236 @@
+# Shared module, copied into each service. Edit shared/libs/python/deadline.py
+# and run `python shared/libs/sync_python.py` to update the copies.
+"""
+Request deadlines for GrantCraft services.
+
+The gateway gives every request a time budget and passes what is left of
+it to backend services in the `X-Request-Timeout-Ms` header. A relative
+budget is sent rather than an absolute time so clock skew between services
+does not matter. Clients may send the header to the gateway as well to ask
+for a shorter budget.
+
+The deadline of the current request is kept in a context variable:
+
+    with deadline_scope(30):
+        remaining()                                   # seconds left
+        await run_with_deadline(call(), "vertex")     # cancelled when the budget is gone
+
+DeadlineMiddleware reads the header and answers 504 if the request has not
+started its response when its deadline passes. Responses that have started,
+like streams, are not cut off. Work cut short by a deadline
+is counted in the `deadline_exceeded_total` metric by operation.
+"""
+import asyncio
+import contextvars
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = "x-request-timeout-ms"
+
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "deadline_exceeded",
+    "Requests and calls cut short because the request deadline passed, by operation",
+    ("operation",),
+)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request deadline has passed"""
+
+    def __init__(self, operation: str = "request"):
+        super().__init__(f"Deadline exceeded during {operation}")
+        self.operation = operation
+
+
+# Absolute deadline of the current request on the monotonic clock
+_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar("deadline", default=None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the current deadline, or None if there is no deadline"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[None]:
+    """
+    Run the block with a deadline `timeout` seconds from now, or the current
+    deadline if that is sooner. A timeout of None keeps the current deadline.
+    """
+    current = _deadline.get()
+    deadline = current
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+        if current is not None:
+            deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def parse_timeout_header(value: Optional[str]) -> Optional[float]:
+    """
+    Parse an X-Request-Timeout-Ms header.
+
+    Returns:
+        The budget in seconds, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        milliseconds = float(value)
+    except ValueError:
+        return None
+    if milliseconds != milliseconds:
+        return None
+    return max(0.0, milliseconds / 1000)
+
+
+def with_timeout_header(headers: Sequence[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """
+    Headers for an outgoing call carrying the remaining budget. Any timeout
+    header already in `headers` is replaced.
+    """
+    result = [(key, value) for key, value in headers if key.lower() != DEADLINE_HEADER]
+    left = remaining()
+    if left is not None:
+        result.append((DEADLINE_HEADER, str(max(0, int(left * 1000)))))
+    return result
+
+
+def effective_timeout(timeout: Optional[float]) -> Optional[float]:
+    """The smaller of `timeout` and the time left until the deadline"""
+    left = remaining()
+    if left is None:
+        return timeout
+    left = max(0.0, left)
+    return left if timeout is None else min(timeout, left)
+
+
+def check(operation: str) -> None:
+    """Raise DeadlineExceeded if the deadline has already passed"""
+    if expired():
+        DEADLINE_EXCEEDED.labels(operation).inc()
+        raise DeadlineExceeded(operation)
+
+
+async def run_with_deadline(awaitable: Awaitable[Any], operation: str, timeout: Optional[float] = None) -> Any:
+    """
+    Await `awaitable`, cancelling it when the deadline passes.
+
+    Args:
+        awaitable: The call to run
+        operation: Name of the call, used as the metric label
+        timeout: The call's own timeout in seconds; asyncio.TimeoutError is raised
+            if it runs out before the deadline
+
+    Raises:
+        DeadlineExceeded: If the deadline passed before or during the call
+    """
+    try:
+        check(operation)
+    except DeadlineExceeded:
+        if inspect.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+
+    try:
+        return await asyncio.wait_for(awaitable, effective_timeout(timeout))
+    except asyncio.TimeoutError:
+        if expired():
+            DEADLINE_EXCEEDED.labels(operation).inc()
+            raise DeadlineExceeded(operation)
+        raise
+
+
+class DeadlineMiddleware:
+    """
+    Applies the deadline from the X-Request-Timeout-Ms header to each request.
+    """
+
+    def __init__(self, app: ASGIApp, default_timeout: Optional[float] = None):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application
+            default_timeout: Budget in seconds for requests without the header (None for no deadline)
+        """
+        self.app = app
+        self.default_timeout = default_timeout
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timeout = parse_timeout_header(Headers(scope=scope).get(DEADLINE_HEADER))
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout is None:
+            await self.app(scope, receive, send)
+            return
+
+        task = asyncio.current_task()
+        started = False
+        timed_out = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        def on_deadline() -> None:
+            nonlocal timed_out
+            # A response that has started, like a stream, is left to finish
+            if not started:
+                timed_out = True
+                task.cancel()
+
+        with deadline_scope(timeout):
+            # A timer rather than a task per request: the request is only
+            # cancelled if no response has started when the deadline passes
+            timer = asyncio.get_running_loop().call_later(timeout, on_deadline) if timeout > 0 else None
+            try:
+                if timer is None:
+                    timed_out = True
+                else:
+                    await self.app(scope, receive, send_wrapper)
+            except (asyncio.CancelledError, Exception):
+                if not timed_out or started:
+                    raise
+                # The request was cancelled by on_deadline, not by the server
+                uncancel = getattr(task, "uncancel", None)
+                if uncancel is not None:
+                    uncancel()
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+            if timed_out and not started:
+                DEADLINE_EXCEEDED.labels("request").inc()
+                logger.warning("Deadline exceeded for %s %s", scope["method"], scope["path"])
+                response = JSONResponse({"detail": "Deadline exceeded"}, status_code=504)
+                await response(scope, receive, send)
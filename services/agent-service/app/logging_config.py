@@ -0,0 +1,196 @@
+# Shared module, copied into each service. Edit shared/libs/python/logging_config.py
+# and run `python shared/libs/sync_python.py` to update the copies.
+"""
+Logging setup for GrantCraft services.
+
+`configure_logging(service)` replaces the synchronous stream handler with a
+queue: request handlers only put log records on an in-memory queue, and a
+background thread formats and writes them. Formatting happens on that
+thread too, so log calls should pass arguments instead of building the
+message themselves, and wrap expensive values in `LazyJson`:
+
+    logger.info("Routing request to %s: %s", service, path, extra=SAMPLED)
+    logger.info("Determined tool calls: %s", LazyJson(tool_calls))
+
+Values are formatted after the call returns, so only pass objects that are
+not modified afterwards.
+
+Output is configured with environment variables:
+
+* LOG_LEVEL       - minimum level (default INFO)
+* LOG_FORMAT      - "json" for one JSON object per line (default), "text" for
+                    the classic "time - logger - level - message" lines
+* LOG_SAMPLE_RATE - fraction of high-volume records that are kept (default 0.1)
+
+High-volume records are the INFO and DEBUG records logged with
+`extra=SAMPLED`. Records of a request whose trace is sampled are always
+kept, so the logs of a recorded trace are complete. Kept records carry the
+sample rate, so log aggregations can scale their counts back up. Records
+logged inside a span carry its trace and span ids.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Any, Callable, Optional
+
+from .tracing import current_span
+
+# Pass as `extra=SAMPLED` on high-volume INFO and DEBUG logs
+SAMPLED = {"sampled": True}
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class LazyJson:
+    """Serializes a value to JSON only when the log record is formatted"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        try:
+            return json.dumps(self.value, default=str)
+        except (TypeError, ValueError, RuntimeError):
+            return repr(self.value)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the records marked with `extra=SAMPLED` at INFO and below.
+    """
+
+    def __init__(self, rate: float, rand: Callable[[], float] = random.random):
+        """
+        Initialize the filter.
+
+        Args:
+            rate: Fraction of marked records kept (0 to 1)
+            rand: Source of random numbers in [0, 1)
+        """
+        super().__init__()
+        self.rate = rate
+        self._rand = rand
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or record.levelno > logging.INFO:
+            return True
+        span = current_span()
+        if span is not None and span.context.sampled:
+            record.sample_rate = 1.0
+            return True
+        if self._rand() < self.rate:
+            record.sample_rate = self.rate
+            return True
+        return False
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    The standard QueueHandler formats the message before queueing it. This one
+    only captures what must be read on the calling thread (the current span)
+    and queues the record as is.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        span = current_span()
+        if span is not None and not hasattr(record, "trace_id"):
+            record.trace_id = span.context.trace_id
+            record.span_id = span.context.span_id
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects"""
+
+    converter = time.gmtime
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "severity": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sampled":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def create_formatter(service: str, log_format: str) -> logging.Formatter:
+    if log_format == "text":
+        return logging.Formatter(TEXT_FORMAT)
+    return JsonFormatter(service)
+
+
+def configure_logging(
+    service: str,
+    level: Optional[str] = None,
+    log_format: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    stream: Any = None,
+) -> logging.handlers.QueueListener:
+    """
+    Route the root logger through a background queue, reading LOG_LEVEL,
+    LOG_FORMAT and LOG_SAMPLE_RATE for anything not given.
+
+    Calling it again replaces the previous setup.
+
+    Returns:
+        The listener writing the queued records
+    """
+    global _listener
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    log_format = (log_format or os.getenv("LOG_FORMAT", "json")).lower()
+    if sample_rate is None:
+        sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(create_formatter(service, log_format))
+
+    handler = ContextQueueHandler(queue.SimpleQueue())
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    stop_logging()
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Write out the queued records and stop the background thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -14,13 +14,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from .agent_handler import AgentHandler
+from .metrics import MetricsMiddleware, metrics_response
+from .tracing import TracingMiddleware, configure_tracing
+from .deadline import DeadlineExceeded, DeadlineMiddleware
+from .lazy import start_warm_up
+from .logging_config import configure_logging
 
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging: JSON lines written by a background thread
+configure_logging("agent-service")
+
+# Continue traces started by the gateway
+configure_tracing("agent-service")
 
 # Create FastAPI app
 app = FastAPI(
@@ -38,6 +43,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Honour request deadlines set by the gateway, trace requests and record
+# per-route latency, in-flight requests and status codes
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 # Load configuration
 def load_config() -> Dict[str, Any]:
     """
@@ -83,12 +94,13 @@ agent_handler = None
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the agent handler on startup."""
+    """Initialize the agent handler on startup and warm up its clients."""
     global agent_handler
     try:
         config = load_config()
         agent_handler = AgentHandler(config)
         logging.info("Agent handler initialized successfully")
+        await start_warm_up()
     except Exception as e:
         logging.error(f"Failed to initialize agent handler: {str(e)}")
         # Don't raise the exception, just log it
@@ -125,7 +137,10 @@ async def process_request(request: AgentRequest):
         **request.parameters
     }
     
-    response = await agent_handler.process_request(request_dict)
+    try:
+        response = await agent_handler.process_request(request_dict)
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Deadline exceeded")
     return response
 
 @app.get("/api/agent/health")
@@ -138,6 +153,16 @@ async def health_check():
     """
     return {"status": "healthy", "agent_handler_initialized": agent_handler is not None}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics.
+    
+    Returns:
+        Metrics in the Prometheus text format
+    """
+    return metrics_response()
+
 @app.get("/api/agent/tools")
 async def list_tools():
     """
@@ -3,18 +3,62 @@ Vertex AI Service for GrantCraft.
 
 This service provides a wrapper around the Vertex AI API for the AI tools.
 """
+import asyncio
+import functools
 import json
 import os
 import logging
-from typing import Dict, Any, List, Optional, Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Union
 
-# Import the required Google Cloud libraries
-try:
-    from google.cloud import aiplatform
-    from google.protobuf import json_format
-    from google.protobuf.struct_pb2 import Value
-except ImportError:
-    logging.warning("Google Cloud libraries not installed. VertexService will not function properly.")
+from ..metrics import REGISTRY
+from ..tracing import SPAN_KIND_CLIENT, start_span
+from ..deadline import DeadlineExceeded, check, effective_timeout, run_with_deadline
+from ..lazy import Lazy, lazy_import
+
+# The Vertex AI SDK takes seconds to import, so it is imported when the client is first needed
+aiplatform = lazy_import("google.cloud.aiplatform")
+
+
+# Prediction calls block a thread for as long as the model takes. They get threads of
+# their own so slow calls cannot starve the Firebase and Firestore calls that share
+# the default executor.
+_predict_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("VERTEX_MAX_CONCURRENT_CALLS", "8")),
+    thread_name_prefix="vertex-predict",
+)
+
+
+# Vertex AI call metrics, labelled by operation and model (both fixed by configuration)
+VERTEX_LATENCY = REGISTRY.histogram(
+    "vertex_request_duration_seconds",
+    "Latency of Vertex AI prediction calls in seconds",
+    ("operation", "model", "outcome"),
+)
+VERTEX_TOKENS = REGISTRY.counter(
+    "vertex_tokens",
+    "Tokens sent to and generated by Vertex AI (estimated when the response carries no token metadata)",
+    ("operation", "model", "kind"),
+)
+
+
+def _token_counts(response: Any, prompt: str, output: str) -> Tuple[int, int]:
+    """
+    Input and output token counts of a prediction.
+    
+    Uses the token metadata of the response when present, otherwise estimates
+    roughly four characters per token.
+    """
+    metadata = getattr(response, "metadata", None)
+    token_metadata = metadata.get("tokenMetadata", {}) if isinstance(metadata, dict) else {}
+    input_tokens = token_metadata.get("inputTokenCount", {}).get("totalTokens")
+    output_tokens = token_metadata.get("outputTokenCount", {}).get("totalTokens")
+    if input_tokens is None:
+        input_tokens = len(prompt) // 4
+    if output_tokens is None:
+        output_tokens = len(output) // 4
+    return int(input_tokens), int(output_tokens)
 
 
 class VertexService:
@@ -39,32 +83,104 @@ class VertexService:
         self.project_id = project_id
         self.location = location
         self.model_name = model_name
-        self.endpoint = None
+        self._endpoint: Optional[Lazy] = None
         
         # Check if project_id is empty
         if not project_id:
             logging.error("Project ID is empty. Using mock Vertex AI service.")
             return
-            
-        # Initialize Vertex AI client
+        
+        # The client is initialized on first use or by the startup warm-up
+        self._endpoint = Lazy(f"vertex {model_name}", self._connect)
+    
+    def _connect(self) -> Any:
+        """
+        Initialize the Vertex AI client and model endpoint.
+        
+        Returns:
+            The endpoint, or None if it could not be initialized
+        """
         try:
-            aiplatform.init(project=project_id, location=location)
+            aiplatform.init(project=self.project_id, location=self.location)
             
             # More robust endpoint initialization
-            endpoint_path = f"projects/{project_id}/locations/{location}/publishers/google/models/{model_name}"
+            endpoint_path = f"projects/{self.project_id}/locations/{self.location}/publishers/google/models/{self.model_name}"
             logging.info(f"Initializing Vertex AI client with endpoint: {endpoint_path}")
             
             try:
-                self.endpoint = aiplatform.Endpoint(endpoint_path)
-                logging.info(f"Successfully initialized Vertex AI client for model {model_name}")
+                endpoint = aiplatform.Endpoint(endpoint_path)
+                logging.info(f"Successfully initialized Vertex AI client for model {self.model_name}")
+                return endpoint
             except ValueError as e:
                 logging.error(f"Invalid endpoint path: {endpoint_path}. Error: {str(e)}")
                 logging.warning("Using fallback to direct API calls instead of Endpoint object")
-                self.endpoint = None
+                return None
                 
+        except ImportError:
+            logging.warning("Google Cloud libraries not installed. VertexService will not function properly.")
+            return None
         except Exception as e:
             logging.error(f"Failed to initialize Vertex AI client: {str(e)}")
-            self.endpoint = None
+            return None
+    
+    @property
+    def endpoint(self) -> Any:
+        """The model endpoint, initialized on the calling thread if needed"""
+        return self._endpoint.get() if self._endpoint else None
+    
+    async def _get_endpoint(self) -> Any:
+        """The model endpoint, initialized in a worker thread if needed"""
+        return await self._endpoint.aget() if self._endpoint else None
+    
+    async def _predict(self, operation: str, prompt: str, instances: List[Dict[str, Any]], parameters: Dict[str, Any]) -> Any:
+        """
+        Call the model endpoint, recording latency and token usage.
+        
+        The blocking client call runs in a worker thread so it does not block
+        the event loop. It is given what is left of the request deadline as
+        its timeout, so the call itself is cancelled when the budget is gone,
+        and nothing is sent once the budget is already gone. DeadlineExceeded
+        is raised in both cases.
+        
+        Args:
+            operation: Name of the calling operation, used as a metric label
+            prompt: The prompt text, used to estimate input tokens
+            instances: Prediction instances
+            parameters: Prediction parameters
+            
+        Returns:
+            The prediction response
+        """
+        attributes = {"vertex.operation": operation, "vertex.model": self.model_name}
+        with start_span("vertex predict", attributes, SPAN_KIND_CLIENT) as span:
+            started = time.perf_counter()
+            try:
+                check("vertex")
+                predict = functools.partial(
+                    self.endpoint.predict,
+                    instances=instances,
+                    parameters=parameters,
+                    timeout=effective_timeout(None),
+                )
+                response = await run_with_deadline(
+                    asyncio.get_running_loop().run_in_executor(_predict_executor, predict),
+                    "vertex",
+                )
+            except Exception as e:
+                VERTEX_LATENCY.labels(operation, self.model_name, "error").observe(time.perf_counter() - started)
+                if not isinstance(e, DeadlineExceeded):
+                    # The client's own timeout may fire just before ours
+                    check("vertex")
+                raise
+            VERTEX_LATENCY.labels(operation, self.model_name, "success").observe(time.perf_counter() - started)
+            
+            output = json.dumps(response.predictions, default=str) if response and response.predictions else ""
+            input_tokens, output_tokens = _token_counts(response, prompt, output)
+            VERTEX_TOKENS.labels(operation, self.model_name, "input").inc(input_tokens)
+            VERTEX_TOKENS.labels(operation, self.model_name, "output").inc(output_tokens)
+            span.set_attribute("vertex.input_tokens", input_tokens)
+            span.set_attribute("vertex.output_tokens", output_tokens)
+            return response
     
     async def generate_text(self, prompt: str, max_tokens: int = 1024) -> str:
         """
@@ -77,7 +193,7 @@ class VertexService:
         Returns:
             Generated text
         """
-        if not self.endpoint:
+        if not await self._get_endpoint():
             logging.warning("Vertex AI client not initialized. Returning fallback response.")
             return f"Error: Vertex AI service not properly initialized. Prompt was: {prompt[:100]}..."
             
@@ -92,10 +208,7 @@ class VertexService:
             }
             
             # Call the model
-            response = self.endpoint.predict(
-                instances=[instance],
-                parameters=parameters
-            )
+            response = await self._predict("generate_text", prompt, [instance], parameters)
             
             # Extract the generated text from the response
             if response and response.predictions:
@@ -104,6 +217,8 @@ class VertexService:
                 logging.warning("Empty response from Vertex AI")
                 return ""
                 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logging.error(f"Error generating text: {str(e)}")
             return f"Error generating text: {str(e)}"
@@ -119,7 +234,7 @@ class VertexService:
         Returns:
             Structured content as a dictionary
         """
-        if not self.endpoint:
+        if not await self._get_endpoint():
             logging.warning("Vertex AI client not initialized. Returning empty structured response.")
             return {}
             
@@ -151,10 +266,7 @@ class VertexService:
             }
             
             # Call the model
-            response = self.endpoint.predict(
-                instances=[instance],
-                parameters=parameters
-            )
+            response = await self._predict("generate_structured_content", prompt, [instance], parameters)
             
             # Extract the structured content from the function call
             if response and response.predictions:
@@ -169,6 +281,8 @@ class VertexService:
                 logging.warning("Empty response from Vertex AI")
                 return {}
                 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logging.error(f"Error generating structured content: {str(e)}")
             return {} 
\ No newline at end of file
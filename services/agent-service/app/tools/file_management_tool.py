@@ -6,6 +6,11 @@ This tool enables the AI agent to create, modify, and organize files for grant p
 from typing import Dict, Any, List
 import datetime
 
+from ..tracing import SPAN_KIND_CLIENT, start_span
+
+# Attributes of the span around each Cloud Storage call
+GCS_SPAN = {"storage.system": "gcs"}
+
 
 class FileManagementTool:
     """Tool for managing files in Cloud Storage for grant proposals."""
@@ -44,7 +49,8 @@ class FileManagementTool:
         # Create the file in Cloud Storage
         bucket = self.storage_client.bucket(self.bucket_name)
         blob = bucket.blob(file_path)
-        blob.upload_from_string(content)
+        with start_span("gcs upload_from_string", GCS_SPAN, SPAN_KIND_CLIENT):
+            blob.upload_from_string(content)
         
         # Generate metadata
         metadata = {
@@ -73,7 +79,9 @@ class FileManagementTool:
         """
         prefix = f"{user_id}/{project_id}/"
         bucket = self.storage_client.bucket(self.bucket_name)
-        blobs = bucket.list_blobs(prefix=prefix)
+        with start_span("gcs list_blobs", GCS_SPAN, SPAN_KIND_CLIENT):
+            # The listing is paged lazily, so read it inside the span
+            blobs = list(bucket.list_blobs(prefix=prefix))
         
         files = []
         for blob in blobs:
@@ -8,6 +8,12 @@ import inspect
 import json
 from typing import Dict, Any, List
 
+from ..tracing import start_span, traced
+from ..deadline import DeadlineExceeded, run_with_deadline
+
+# Longest a single tool run may take, even with budget left
+TOOL_TIMEOUT = 60
+
 
 class ToolRouter:
     """
@@ -91,6 +97,7 @@ class ToolRouter:
             # Handle more complex types
             return {"type": "object"}
         
+    @traced("select_tools")
     async def select_tools(self, task: str) -> List[str]:
         """
         Select appropriate tools for a given task.
@@ -164,13 +171,23 @@ class ToolRouter:
             valid_params = {k: v for k, v in parameters.items() if k in sig.parameters}
             
             # Execute with timeout
-            result = await asyncio.wait_for(method(**valid_params), timeout=60)
+            attributes = {"tool.name": tool_name, "tool.method": method_name}
+            with start_span(f"tool {tool_name}.{method_name}", attributes):
+                # Cancelled once the request deadline passes
+                result = await run_with_deadline(method(**valid_params), "tool", timeout=TOOL_TIMEOUT)
             return {
                 "tool": tool_name,
                 "method": method_name,
                 "result": result,
                 "status": "success"
             }
+        except DeadlineExceeded:
+            return {
+                "tool": tool_name,
+                "method": method_name,
+                "error": "Request deadline exceeded",
+                "status": "cancelled"
+            }
         except asyncio.TimeoutError:
             return {
                 "tool": tool_name,
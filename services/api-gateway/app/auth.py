@@ -1,19 +1,39 @@
-import firebase_admin
-from firebase_admin import credentials, auth
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
 import json
+import asyncio
 from typing import Dict, Any
+from app.lazy import Lazy, lazy_import
+from app.token_cache import VerifiedTokenCache
+from app.token_guard import NegativeTokenCache
+from app.jwt_verifier import (
+    ExpiredTokenError,
+    SigningKeysUnavailableError,
+    TokenVerificationError,
+    create_verifier_from_env,
+    user_data_from_claims,
+)
+
+# The Firebase Admin SDK is imported and initialized on first use
+firebase_admin = lazy_import("firebase_admin")
+auth = lazy_import("firebase_admin.auth")
+credentials = lazy_import("firebase_admin.credentials")
 
 # Initialize Firebase Admin SDK
 # In a production environment, the service account would be loaded from a secret
 firebase_initialized = False
 
-def initialize_firebase():
+def initialize_firebase() -> bool:
+    """
+    Initialize the Firebase Admin SDK.
+    
+    Returns:
+        Whether Firebase is available for token verification
+    """
     global firebase_initialized
     if firebase_initialized:
-        return
+        return True
     
     try:
         # Check if running in Google Cloud environment
@@ -22,7 +42,7 @@ def initialize_firebase():
             firebase_admin.initialize_app()
             firebase_initialized = True
             print("Firebase initialized with default Google Cloud credentials")
-            return
+            return True
             
         # For local development, use service account key file
         service_account_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_PATH", "./firebase-key.json")
@@ -31,7 +51,7 @@ def initialize_firebase():
             firebase_admin.initialize_app(cred)
             firebase_initialized = True
             print(f"Firebase initialized with service account key from {service_account_path}")
-            return
+            return True
             
         # Try to load from environment variable for container deployment
         firebase_config = os.getenv("FIREBASE_CONFIG")
@@ -42,13 +62,13 @@ def initialize_firebase():
             firebase_admin.initialize_app(cred)
             firebase_initialized = True
             print("Firebase initialized with configuration from environment variable")
-            return
+            return True
             
         # If running in development/testing mode without Firebase
         if os.getenv("FIREBASE_DISABLED", "").lower() == "true":
             print("Firebase authentication disabled - using mock mode")
             firebase_initialized = True
-            return
+            return True
             
         print("WARNING: No Firebase configuration found. Authentication will be limited.")
         # Don't raise exception, but set a flag to skip actual Firebase operations
@@ -58,33 +78,55 @@ def initialize_firebase():
         print(f"Error initializing Firebase: {str(e)}")
         # Don't crash application on startup
         firebase_initialized = False
+    return firebase_initialized
 
-# Initialize Firebase when the module is loaded
-initialize_firebase()
+# Initialized on first use or by the startup warm-up, not when the module is loaded
+firebase = Lazy("firebase", initialize_firebase)
 
 # Bearer token extractor
 security = HTTPBearer()
 
-async def verify_token(token: str) -> Dict[str, Any]:
+# Cache of verified tokens so repeat requests skip the Firebase round trip
+token_cache = VerifiedTokenCache(
+    max_size=int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", "300")),
+    revocation_check_interval=float(os.getenv("TOKEN_REVOCATION_CHECK_INTERVAL", "0")),
+)
+
+# Tokens that failed verification for good are rejected again without any verification
+rejected_tokens = NegativeTokenCache(
+    max_size=int(os.getenv("NEGATIVE_TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("NEGATIVE_TOKEN_CACHE_TTL", "60")),
+)
+
+# Local verification against cached signing keys (FIREBASE_LOCAL_VERIFY=true)
+local_verifier = create_verifier_from_env()
+
+async def _verify_locally(token: str) -> Dict[str, Any]:
     """
-    Verify Firebase ID token and return user data
+    Verify a token against cached signing keys without any network I/O
+    """
+    try:
+        claims = await local_verifier.verify(token)
+    except ExpiredTokenError:
+        raise rejected_tokens.reject(token, "Token has expired")
+    except SigningKeysUnavailableError as e:
+        # Says nothing about the token, so it is not remembered
+        print(f"Error verifying token: {str(e)}")
+        raise HTTPException(status_code=401, detail="Invalid token")
+    except TokenVerificationError as e:
+        print(f"Error verifying token: {str(e)}")
+        raise rejected_tokens.reject(token, "Invalid token")
+    
+    return user_data_from_claims(claims)
+
+def _verify_with_firebase(token: str, check_revoked: bool = False) -> Dict[str, Any]:
+    """
+    Verify a token with the Firebase Admin SDK (blocking network calls)
     """
-    # If Firebase is not initialized, use a mock user for development
-    if not firebase_initialized:
-        print(f"WARNING: Firebase not initialized. Using mock authentication for token: {token[:10]}...")
-        # Return a mock user for development/testing purposes
-        return {
-            "uid": "mock-user-id",
-            "email": "mock-user@example.com",
-            "email_verified": True,
-            "display_name": "Mock User",
-            "photo_url": None,
-            "token": {"mock": True}
-        }
-        
     try:
         # Verify the token
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = auth.verify_id_token(token, check_revoked=check_revoked)
         
         # Get additional user info from Firebase
         user = auth.get_user(decoded_token['uid'])
@@ -101,15 +143,46 @@ async def verify_token(token: str) -> Dict[str, Any]:
         
         return user_data
     except auth.ExpiredIdTokenError:
-        raise HTTPException(status_code=401, detail="Token has expired")
+        raise rejected_tokens.reject(token, "Token has expired")
     except auth.RevokedIdTokenError:
-        raise HTTPException(status_code=401, detail="Token has been revoked")
+        raise rejected_tokens.reject(token, "Token has been revoked")
     except auth.InvalidIdTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        raise rejected_tokens.reject(token, "Invalid token")
     except Exception as e:
+        # Possibly transient (Firebase unreachable, user lookup failed), so not remembered
         print(f"Error verifying token: {str(e)}")
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
+async def _verify_uncached(token: str, check_revoked: bool = False) -> Dict[str, Any]:
+    """
+    Verify a token locally if configured, otherwise with Firebase off the event loop
+    """
+    # Revocation can only be checked by Firebase
+    if local_verifier and (not check_revoked or not await firebase.aget()):
+        return await _verify_locally(token)
+    
+    return await asyncio.to_thread(_verify_with_firebase, token, check_revoked)
+
+async def verify_token(token: str) -> Dict[str, Any]:
+    """
+    Verify Firebase ID token and return user data
+    """
+    # If Firebase is not initialized, use a mock user for development
+    if not local_verifier and not await firebase.aget():
+        print(f"WARNING: Firebase not initialized. Using mock authentication for token: {token[:10]}...")
+        # Return a mock user for development/testing purposes
+        return {
+            "uid": "mock-user-id",
+            "email": "mock-user@example.com",
+            "email_verified": True,
+            "display_name": "Mock User",
+            "photo_url": None,
+            "token": {"mock": True}
+        }
+    
+    rejected_tokens.check(token)
+    return await token_cache.get_or_verify(token, _verify_uncached)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
     """
     Get current user from the Authorization header
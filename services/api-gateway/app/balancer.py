@@ -0,0 +1,207 @@
+"""
+Load balancing across service replicas for the API Gateway.
+
+A service URL in SERVICE_ENDPOINTS may list several comma-separated
+upstreams (self-hosted replicas, regional endpoints). Each request is sent
+to one of them using either:
+
+* least_outstanding - the upstream with the fewest in-flight requests
+* p2c               - power of two choices: the less loaded of two random upstreams
+
+Upstreams are ejected passively for a while when they fail repeatedly or
+become much slower than their peers. At most `max_ejection_percent` of the
+upstreams are ejected at once, so a service is never left with none.
+"""
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("api-gateway")
+
+STRATEGY_LEAST_OUTSTANDING = "least_outstanding"
+STRATEGY_P2C = "p2c"
+STRATEGIES = (STRATEGY_LEAST_OUTSTANDING, STRATEGY_P2C)
+
+
+def parse_upstreams(value: str) -> List[str]:
+    """
+    Split a comma-separated list of upstream base URLs.
+
+    Returns:
+        URLs without trailing slashes. Empty and `http://none` entries are dropped.
+    """
+    urls = []
+    for url in (value or "").split(","):
+        url = url.strip().rstrip("/")
+        if url and not url.startswith("http://none"):
+            urls.append(url)
+    return urls
+
+
+class Upstream:
+    """A single replica of a service and its observed behaviour"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        # Exponentially weighted moving average of response time in seconds
+        self.latency: Optional[float] = None
+        self.latency_samples = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "ejected": self.ejected_until > now,
+            "ejections": self.ejections,
+        }
+
+
+class LoadBalancer:
+    """
+    Picks an upstream for each request and tracks outstanding requests.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        urls: List[str],
+        strategy: str = STRATEGY_P2C,
+        consecutive_failures: int = 5,
+        latency_outlier_factor: float = 3.0,
+        min_latency_samples: int = 20,
+        ejection_duration: float = 30.0,
+        max_ejection_percent: float = 50.0,
+        latency_decay: float = 0.2,
+        clock: Callable[[], float] = time.monotonic,
+        rand: Optional[random.Random] = None,
+    ):
+        """
+        Initialize the balancer.
+
+        Args:
+            service: Service name, used in logs
+            urls: Upstream base URLs
+            strategy: "least_outstanding" or "p2c"
+            consecutive_failures: Failures in a row that eject an upstream
+            latency_outlier_factor: Eject an upstream whose average latency exceeds
+                this multiple of its peers' average
+            min_latency_samples: Responses observed from an upstream before it can be
+                ejected for latency
+            ejection_duration: Seconds an ejected upstream receives no traffic
+            max_ejection_percent: Upper bound on the share of upstreams ejected at once
+            latency_decay: Weight of the newest sample in the latency average
+            clock: Monotonic clock
+            rand: Random number generator
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy {strategy}")
+        self.service = service
+        self.upstreams = [Upstream(url) for url in urls]
+        self.strategy = strategy
+        self.consecutive_failures = consecutive_failures
+        self.latency_outlier_factor = latency_outlier_factor
+        self.min_latency_samples = min_latency_samples
+        self.ejection_duration = ejection_duration
+        self.max_ejection_percent = max_ejection_percent
+        self.latency_decay = latency_decay
+        self._clock = clock
+        self._random = rand or random.Random()
+
+    def _available(self) -> List[Upstream]:
+        now = self._clock()
+        available = [upstream for upstream in self.upstreams if upstream.ejected_until <= now]
+        return available or self.upstreams
+
+    @staticmethod
+    def _load(upstream: Upstream):
+        return (upstream.in_flight, upstream.latency or 0.0)
+
+    def acquire(self) -> Upstream:
+        """
+        Pick an upstream and count the request as in flight. Must be followed by `release`.
+
+        Raises:
+            LookupError: If the service has no upstreams
+        """
+        candidates = self._available()
+        if not candidates:
+            raise LookupError(f"No upstreams configured for {self.service}")
+
+        if len(candidates) == 1:
+            upstream = candidates[0]
+        elif self.strategy == STRATEGY_LEAST_OUTSTANDING:
+            upstream = min(candidates, key=self._load)
+        else:
+            first, second = self._random.sample(candidates, 2)
+            upstream = first if self._load(first) <= self._load(second) else second
+
+        upstream.in_flight += 1
+        upstream.requests += 1
+        return upstream
+
+    def release(self, upstream: Upstream) -> None:
+        """Mark a request to the upstream as finished"""
+        upstream.in_flight = max(0, upstream.in_flight - 1)
+
+    def observe(self, upstream: Upstream, success: bool, duration: float) -> None:
+        """
+        Record the outcome of a request and eject the upstream if it is an outlier.
+
+        Args:
+            upstream: The upstream the request was sent to
+            success: False for transport errors, timeouts and 5xx responses
+            duration: Response time in seconds
+        """
+        upstream.latency_samples += 1
+        if upstream.latency is None:
+            upstream.latency = duration
+        else:
+            upstream.latency += self.latency_decay * (duration - upstream.latency)
+
+        if success:
+            upstream.consecutive_failures = 0
+        else:
+            upstream.failures += 1
+            upstream.consecutive_failures += 1
+            if upstream.consecutive_failures >= self.consecutive_failures:
+                self._eject(upstream, "consecutive failures")
+                return
+
+        if upstream.latency_samples >= self.min_latency_samples:
+            peers = [
+                peer.latency for peer in self.upstreams
+                if peer is not upstream and peer.latency is not None
+            ]
+            if peers and upstream.latency > self.latency_outlier_factor * (sum(peers) / len(peers)):
+                self._eject(upstream, "high latency")
+
+    def _eject(self, upstream: Upstream, reason: str) -> None:
+        now = self._clock()
+        if upstream.ejected_until > now:
+            return
+        ejected = sum(1 for peer in self.upstreams if peer.ejected_until > now)
+        if (ejected + 1) * 100 > self.max_ejection_percent * len(self.upstreams):
+            return
+
+        logger.warning(f"Ejecting upstream {upstream.url} of {self.service} ({reason})")
+        upstream.ejected_until = now + self.ejection_duration
+        upstream.ejections += 1
+        upstream.consecutive_failures = 0
+        # Start from a clean average when it comes back
+        upstream.latency = None
+        upstream.latency_samples = 0
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-upstream gauges and counters for monitoring"""
+        now = self._clock()
+        return [upstream.stats(now) for upstream in self.upstreams]
@@ -0,0 +1,133 @@
+"""
+Batch requests for the API Gateway.
+
+`POST /api/batch` carries several API calls in one request, for example
+everything a project workspace needs when it opens:
+
+    {"requests": [
+        {"id": "me", "method": "GET", "path": "/api/users/me"},
+        {"id": "chats", "method": "GET", "path": "/api/chats/projects/p1?limit=20"},
+        {"id": "rename", "method": "PUT", "path": "/api/projects/p1", "body": {"name": "New"}}
+    ]}
+
+The batch is authenticated once. Sub-requests then go through the same
+routing, rate limiting, caching and resilience as individual calls and are
+dispatched concurrently, so their order of execution is not defined. Each
+one gets its own entry in the response, in request order:
+
+    {"responses": [{"id": "me", "status": 200, "headers": {...}, "body": {...}}, ...]}
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+from starlette.responses import Response
+
+from app.proxy import GATEWAY_IDENTITY_HEADERS, HOP_BY_HOP_HEADERS
+
+BATCH_METHODS = ("GET", "POST", "PUT", "DELETE")
+
+# Outer request headers that describe the batch body rather than a sub-request
+BATCH_ONLY_HEADERS = frozenset({"content-length", "content-type", "content-encoding", "accept-encoding"})
+
+# Item headers that are ignored: sub-requests always run as the user who was
+# verified for the batch, whose limits, cache keys and identity headers apply
+ITEM_IGNORED_HEADERS = (
+    frozenset({"authorization", "cookie", "content-length"}) | HOP_BY_HOP_HEADERS | GATEWAY_IDENTITY_HEADERS
+)
+
+
+class BatchItem(BaseModel):
+    """A single sub-request"""
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+    headers: Dict[str, str] = Field(default_factory=dict)
+    body: Any = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+
+def split_item_path(path: str, api_prefix: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Split a sub-request path into the gateway path and query parameters.
+
+    Args:
+        path: Path as the client would call it, e.g. "/api/chats/c1/messages?limit=20"
+        api_prefix: The gateway's API prefix, stripped if present
+
+    Returns:
+        Tuple of (path below the API prefix, query parameters)
+    """
+    parts = urlsplit(path)
+    item_path = parts.path
+    if api_prefix and (item_path == api_prefix or item_path.startswith(api_prefix + "/")):
+        item_path = item_path[len(api_prefix):]
+    if not item_path.startswith("/"):
+        item_path = "/" + item_path
+    return item_path, parse_qsl(parts.query, keep_blank_values=True)
+
+
+def item_headers(request_headers: Iterable[Tuple[str, str]], item: BatchItem) -> Dict[str, str]:
+    """
+    Headers of a sub-request: the batch request's headers overlaid with the item's own.
+    Credentials, identity and hop-by-hop headers always come from the batch request.
+
+    Upstream bodies are requested unencoded so they can be embedded in the
+    batch response, which is compressed as a whole instead.
+    """
+    headers = {key.lower(): value for key, value in request_headers if key.lower() not in BATCH_ONLY_HEADERS}
+    headers.update({
+        key.lower(): value for key, value in item.headers.items() if key.lower() not in ITEM_IGNORED_HEADERS
+    })
+    headers["accept-encoding"] = "identity"
+    if item.body is not None:
+        headers.setdefault("content-type", "application/json")
+    return headers
+
+
+def item_body(item: BatchItem) -> bytes:
+    if item.body is None:
+        return b""
+    if isinstance(item.body, str):
+        return item.body.encode()
+    return json.dumps(item.body).encode()
+
+
+def _decode_body(content: bytes, content_type: str) -> Any:
+    if not content:
+        return None
+    if "json" in content_type:
+        try:
+            return json.loads(content)
+        except ValueError:
+            pass
+    return content.decode("utf-8", errors="replace")
+
+
+def encode_response(item_id: Optional[str], response: Response) -> Dict[str, Any]:
+    """Batch entry for a sub-request that produced a response"""
+    headers = {
+        key: value for key, value in response.headers.items()
+        if key not in ("content-length", "set-cookie")
+    }
+    return {
+        "id": item_id,
+        "status": response.status_code,
+        "headers": headers,
+        "body": _decode_body(response.body, headers.get("content-type", "")),
+    }
+
+
+def encode_error(item_id: Optional[str], error: HTTPException) -> Dict[str, Any]:
+    """Batch entry for a sub-request that failed in the gateway or upstream"""
+    return {
+        "id": item_id,
+        "status": error.status_code,
+        "headers": dict(error.headers or {}),
+        "body": {"detail": error.detail},
+    }
@@ -0,0 +1,245 @@
+"""
+Response compression for the API Gateway.
+
+An ASGI middleware that compresses responses with brotli or gzip, chosen
+from the client's Accept-Encoding. Only responses whose content type is in
+the allowlist and whose body reaches the size threshold are compressed.
+Responses that already carry a Content-Encoding (compressed upstream) are
+passed through untouched.
+
+Streamed responses are compressed chunk by chunk with a flush after each
+chunk, so clients still receive data as soon as the upstream sends it.
+"""
+import logging
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger("api-gateway")
+
+ENCODING_BROTLI = "br"
+ENCODING_GZIP = "gzip"
+
+DEFAULT_CONTENT_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/x-ndjson",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def _brotli_module():
+    """Return the optional brotli module, or None if it is not installed"""
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Encodings supported in this environment, in order of preference"""
+    if _brotli_module() is not None:
+        return (ENCODING_BROTLI, ENCODING_GZIP)
+    return (ENCODING_GZIP,)
+
+
+def negotiate_encoding(accept_encoding: Optional[str], encodings: Iterable[str]) -> Optional[str]:
+    """
+    Pick a content encoding from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: The request's Accept-Encoding header
+        encodings: Supported encodings in order of preference
+
+    Returns:
+        The encoding with the highest q-value (ties go to the preferred one), or None
+    """
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Compressor:
+    """Incremental compressor with flush support"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == ENCODING_BROTLI:
+            self._brotli = _brotli_module().Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + self._brotli.flush() if flush else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """
+    Compresses eligible responses for clients that accept it.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        content_types: Iterable[str] = DEFAULT_CONTENT_TYPES,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        encodings: Optional[Iterable[str]] = None,
+    ):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application
+            minimum_size: Smaller bodies are sent uncompressed
+            content_types: Allowed content types; entries ending in "/" match a whole family
+            gzip_level: zlib compression level
+            brotli_quality: Brotli quality (0-11)
+            encodings: Encodings to offer, in order of preference (defaults to what is installed)
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = tuple(content_types)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = tuple(encodings) if encodings is not None else available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def compressible(self, headers: Headers, status_code: int) -> bool:
+        """Whether a response may be compressed, judging by its status and headers"""
+        if status_code < 200 or status_code in (204, 304):
+            return False
+        if "content-encoding" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", "").lower():
+            return False
+        content_length = headers.get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) < self.minimum_size:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return any(
+            content_type.startswith(allowed) if allowed.endswith("/") else content_type == allowed
+            for allowed in self.content_types
+        )
+
+
+class _CompressionResponder:
+    """Per-response state of the compression middleware"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self._start: Optional[Message] = None
+        self._compressor: Optional[_Compressor] = None
+        self._passthrough = False
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if self.middleware.compressible(headers, message["status"]):
+                # Decide once the first body chunk shows whether it is big enough
+                self._start = message
+            else:
+                self._passthrough = True
+                await self._send(message)
+            return
+
+        if message_type != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._compressor is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self._passthrough = True
+                await self._send(self._start)
+                await self._send(message)
+                return
+
+            self._compressor = _Compressor(
+                self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality
+            )
+            headers = MutableHeaders(raw=self._start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            _add_vary(headers, "Accept-Encoding")
+            # The compressed bytes are a different representation
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            if more_body:
+                del headers["content-length"]
+                await self._send(self._start)
+            else:
+                compressed = self._compressor.finish(body)
+                headers["Content-Length"] = str(len(compressed))
+                await self._send(self._start)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+
+        if more_body:
+            chunk = self._compressor.compress(body, flush=True)
+        else:
+            chunk = self._compressor.finish(body)
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+
+def _add_vary(headers: MutableHeaders, value: str) -> None:
+    """Add a value to the Vary header unless it is already listed"""
+    existing = headers.get("vary")
+    if not existing:
+        headers["Vary"] = value
+        return
+    listed: List[str] = [item.strip().lower() for item in existing.split(",")]
+    if value.lower() not in listed and "*" not in listed:
+        headers["Vary"] = f"{existing}, {value}"
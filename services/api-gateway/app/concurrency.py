@@ -0,0 +1,213 @@
+"""
+Adaptive concurrency limits for the API Gateway.
+
+Each backend service gets a limit on requests in flight that adapts with
+AIMD (additive increase, multiplicative decrease): every successful call
+made while the limit is in use raises it by 1/limit (about one per round
+trip), while errors and calls much slower than the service's no-load
+latency cut it by `backoff_ratio`. Requests beyond the limit are shed at
+once with 503 and a Retry-After hint instead of queueing behind a slow
+service.
+
+Requests carry a priority class. Lower classes may only use part of the
+limit, so under pressure they are shed first and the headroom is kept for
+more important traffic:
+
+* critical - health checks, may use the whole limit
+* read     - GET and HEAD requests
+* write    - other methods
+* low      - expensive writes, e.g. agent runs (set per route)
+
+Health probes made by the gateway itself do not go through the limiter.
+"""
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("api-gateway")
+
+PRIORITY_CRITICAL = "critical"
+PRIORITY_READ = "read"
+PRIORITY_WRITE = "write"
+PRIORITY_LOW = "low"
+
+# Share of the limit each priority class may fill
+PRIORITY_SHARES = {
+    PRIORITY_CRITICAL: 1.0,
+    PRIORITY_READ: 0.9,
+    PRIORITY_WRITE: 0.75,
+    PRIORITY_LOW: 0.5,
+}
+PRIORITIES = tuple(PRIORITY_SHARES)
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """Raised when a request is shed because its service is at its concurrency limit"""
+
+    def __init__(self, service: str, priority: str, retry_after: float):
+        super().__init__(f"Concurrency limit of {service} reached for {priority} requests")
+        self.service = service
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class Permit:
+    """A slot held by a request in flight"""
+
+    __slots__ = ("priority", "started", "recorded", "released")
+
+    def __init__(self, priority: str, started: float):
+        self.priority = priority
+        self.started = started
+        # Whether the outcome has been taken into account
+        self.recorded = False
+        self.released = False
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit for one backend service.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        initial_limit: float = 20.0,
+        min_limit: float = 2.0,
+        max_limit: float = 200.0,
+        backoff_ratio: float = 0.9,
+        latency_tolerance: Optional[float] = 2.0,
+        min_slow_latency: float = 0.05,
+        baseline_drift: float = 0.01,
+        decrease_interval: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            service: Service name, used in logs
+            initial_limit: Starting limit
+            min_limit: The limit never drops below this
+            max_limit: The limit never grows above this
+            backoff_ratio: Factor applied to the limit on an overload signal
+            latency_tolerance: Calls slower than this multiple of the no-load latency
+                count as an overload signal (None to react to errors only)
+            min_slow_latency: Calls faster than this many seconds never count as slow
+            baseline_drift: Per-call upward drift of the no-load latency estimate, so it
+                follows a service that has become slower for good
+            decrease_interval: Minimum seconds between two decreases, so one burst of
+                failures does not collapse the limit
+            clock: Monotonic clock
+        """
+        self.service = service
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.min_slow_latency = min_slow_latency
+        self.baseline_drift = baseline_drift
+        self.decrease_interval = decrease_interval
+        self._clock = clock
+
+        self.in_flight = 0
+        # Estimate of the latency without queueing: a slowly rising minimum
+        self.baseline: Optional[float] = None
+        self._last_decrease = -math.inf
+
+        self.shed: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self.decreases = 0
+
+    def allowed(self, priority: str) -> int:
+        """Requests in flight up to which a priority class is admitted"""
+        return max(1, int(self.limit * PRIORITY_SHARES[priority]))
+
+    def acquire(self, priority: str = PRIORITY_READ) -> Permit:
+        """
+        Admit a request or shed it. Must be followed by `release`.
+
+        Raises:
+            ConcurrencyLimitExceeded: If the service is at the limit for this priority class
+        """
+        if self.in_flight >= self.allowed(priority):
+            self.shed[priority] += 1
+            raise ConcurrencyLimitExceeded(self.service, priority, self.retry_after)
+        self.in_flight += 1
+        return Permit(priority, self._clock())
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds a shed client should wait: roughly the time for the requests in flight to drain"""
+        return max(1.0, self.baseline or 0.0)
+
+    def record(self, permit: Permit, success: Optional[bool] = True) -> None:
+        """
+        Adapt the limit to the outcome of a call that keeps its slot, e.g. a
+        streamed response whose headers have arrived. The latency is measured
+        up to now, so a slow client reading the body does not count.
+
+        Args:
+            permit: The permit returned by `acquire`
+            success: False for transport errors and 5xx responses, None if the call
+                ended without an outcome (cancelled); latency is taken into account either way
+        """
+        if permit.recorded or permit.released:
+            return
+        permit.recorded = True
+        now = self._clock()
+        latency = now - permit.started
+
+        if success is False or self._slow(latency):
+            self._decrease(now)
+        elif success:
+            self._observe_baseline(latency)
+            # Only grow while the limit is actually being used
+            if self.in_flight >= self.limit / 2:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def release(self, permit: Permit, success: Optional[bool] = True) -> None:
+        """
+        Give back a slot, adapting the limit to the outcome unless `record`
+        already did.
+
+        Args:
+            permit: The permit returned by `acquire`
+            success: As for `record`; ignored if the outcome was recorded
+        """
+        if permit.released:
+            return
+        self.record(permit, success)
+        permit.released = True
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def _slow(self, latency: float) -> bool:
+        if self.latency_tolerance is None or self.baseline is None:
+            return False
+        return latency > self.min_slow_latency and latency > self.latency_tolerance * self.baseline
+
+    def _observe_baseline(self, latency: float) -> None:
+        if self.baseline is None:
+            self.baseline = latency
+        else:
+            self.baseline = min(self.baseline * (1 + self.baseline_drift), latency)
+
+    def _decrease(self, now: float) -> None:
+        if now - self._last_decrease < self.decrease_interval:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self.decreases += 1
+        if int(previous) != int(self.limit):
+            logger.info(f"Concurrency limit of {self.service} lowered to {int(self.limit)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "baseline_latency_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+            "decreases": self.decreases,
+            "shed": dict(self.shed),
+        }
@@ -0,0 +1,150 @@
+"""
+Backend health aggregation for the API Gateway.
+
+All backends are probed concurrently and the aggregated result is cached.
+A background task keeps the snapshot fresh so `/api/health` answers
+immediately with the last known statuses and their age.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+from app.balancer import parse_upstreams
+
+logger = logging.getLogger("api-gateway")
+
+
+class HealthAggregator:
+    """
+    Probes every configured backend and caches the aggregated statuses.
+    """
+
+    def __init__(
+        self,
+        endpoints: Dict[str, str],
+        get_client: Callable[[str], httpx.AsyncClient],
+        timeout: float = 2.0,
+        ttl: float = 5.0,
+        refresh_interval: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the aggregator.
+
+        Args:
+            endpoints: Mapping of service name to base URL
+            get_client: Returns the pooled client for a service
+            timeout: Per-probe timeout in seconds
+            ttl: Age after which a request triggers a refresh
+            refresh_interval: Seconds between background refreshes (0 disables)
+            clock: Monotonic clock
+        """
+        self.endpoints = endpoints
+        self.get_client = get_client
+        self.timeout = timeout
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+
+        self._statuses: Optional[Dict[str, str]] = None
+        self._checked_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def probe(self, service_name: str, service_url: str) -> str:
+        """
+        Probe a single backend. Services with several upstreams are reported
+        as degraded while only some of them are healthy.
+
+        Returns:
+            A human readable status
+        """
+        # Only check health status if the service URL is set
+        urls = parse_upstreams(service_url)
+        if not urls:
+            return "not configured"
+        if len(urls) == 1:
+            return await self._probe_url(service_name, urls[0])
+
+        statuses = await asyncio.gather(*[self._probe_url(service_name, url) for url in urls])
+        healthy = statuses.count("healthy")
+        if healthy == len(urls):
+            return "healthy"
+        if healthy:
+            return f"degraded ({healthy}/{len(urls)} upstreams healthy)"
+        return f"unhealthy (0/{len(urls)} upstreams healthy)"
+
+    async def _probe_url(self, service_name: str, url: str) -> str:
+        try:
+            client = self.get_client(service_name)
+            response = await client.get(f"{url}/api/health", timeout=self.timeout)
+            if response.status_code == 200:
+                return "healthy"
+            return f"unhealthy ({response.status_code})"
+        except Exception as e:
+            return f"error: {str(e)}"
+
+    async def check_all(self) -> Dict[str, str]:
+        """Probe every backend concurrently and store the result"""
+        names = list(self.endpoints)
+        results = await asyncio.gather(*[self.probe(name, self.endpoints[name]) for name in names])
+
+        self._statuses = dict(zip(names, results))
+        self._checked_at = self._clock()
+        return self._statuses
+
+    def _refresh_now(self) -> asyncio.Task:
+        """Start a refresh, sharing one in-flight refresh between callers"""
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self.check_all())
+        return self._refresh
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the last known statuses.
+
+        Only the very first call waits for the probes. Afterwards the cached
+        snapshot is returned at once and refreshed in the background when
+        it is older than the ttl.
+
+        Returns:
+            Dictionary with `services` and `age_seconds`
+        """
+        if self._statuses is None:
+            await asyncio.shield(self._refresh_now())
+        elif self._clock() - self._checked_at >= self.ttl:
+            self._refresh_now()
+
+        return {
+            "services": dict(self._statuses or {}),
+            "age_seconds": round(self._clock() - self._checked_at, 3),
+        }
+
+    async def _run(self) -> None:
+        """Refresh the snapshot periodically"""
+        while True:
+            try:
+                await self._refresh_now()
+            except Exception as e:
+                logger.error(f"Error checking service health: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self) -> None:
+        """Start the background refresher"""
+        if self.refresh_interval > 0 and (self._refresher is None or self._refresher.done()):
+            self._refresher = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background refresher and any in-flight refresh"""
+        for task in (self._refresher, self._refresh):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._refresher = None
+        self._refresh = None
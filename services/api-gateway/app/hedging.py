@@ -0,0 +1,201 @@
+"""
+Hedged requests for the API Gateway.
+
+A GET on a route with a hedge policy is sent once. If it has not been
+answered after the route's recent latency percentile (p95 by default), the
+same request is sent a second time, and whichever answers first is used.
+The other one is cancelled. An attempt that fails, by raising or with a
+5xx response (the rule the circuit breakers use), does not win while the
+other one may still succeed. A slow first attempt (a cold instance, a slow
+Firestore read) then costs about the percentile plus one normal response
+time instead of its full latency.
+
+Hedges add load, so they are capped by a budget shared by all routes: at
+most `ratio` of recent hedgeable requests, plus a small floor. Until a
+route has `min_samples` latencies there is no threshold and nothing is
+hedged.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from app.resilience import RetryBudget
+from app.routing import HedgePolicy, Route
+
+logger = logging.getLogger("api-gateway")
+
+T = TypeVar("T")
+
+
+def _succeeded(task: "asyncio.Future[Any]") -> bool:
+    """Whether an attempt finished with a usable result"""
+    if task.cancelled() or task.exception() is not None:
+        return False
+    # Upstream responses count as failed with a server error, as in the circuit breakers
+    status_code = getattr(task.result(), "status_code", None)
+    return status_code is None or status_code < 500
+
+
+class LatencyWindow:
+    """
+    The most recent latencies of a route, with cached percentiles.
+    """
+
+    def __init__(self, size: int = 1000, recompute_every: int = 50):
+        """
+        Initialize the window.
+
+        Args:
+            size: Number of latencies kept
+            recompute_every: New samples between re-sorting the window
+        """
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._sorted: List[float] = []
+        self._recompute_every = recompute_every
+        self._since_sort = 0
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+        self._since_sort += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank percentile in seconds, or None without samples"""
+        if not self._samples:
+            return None
+        # Sorting on every request would cost more than the lookup saves
+        if self._since_sort >= self._recompute_every or len(self._sorted) == 0:
+            self._sorted = sorted(self._samples)
+            self._since_sort = 0
+        rank = max(0, min(len(self._sorted) - 1, int(round(q / 100 * len(self._sorted))) - 1))
+        return self._sorted[rank]
+
+
+class RouteHedgeStats:
+    """Latencies and hedge counters of one route"""
+
+    def __init__(self, window_size: int):
+        self.latencies = LatencyWindow(window_size)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+        self.threshold: Optional[float] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "budget_exhausted": self.budget_exhausted,
+            "threshold_ms": round(self.threshold * 1000, 1) if self.threshold is not None else None,
+        }
+
+
+class Hedger:
+    """
+    Runs calls with a hedge after the route's latency threshold.
+    """
+
+    def __init__(
+        self,
+        budget: Optional[RetryBudget] = None,
+        window_size: int = 1000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the hedger.
+
+        Args:
+            budget: Cap on hedges across all routes (default 5% of requests plus one per second)
+            window_size: Latencies kept per route to compute thresholds
+            clock: Monotonic clock
+        """
+        self.budget = budget or RetryBudget(ratio=0.05, min_retries_per_second=1.0)
+        self.window_size = window_size
+        self._clock = clock
+        self._routes: Dict[str, RouteHedgeStats] = {}
+
+    def route_stats(self, route: Route) -> RouteHedgeStats:
+        stats = self._routes.get(route.prefix)
+        if stats is None:
+            stats = self._routes[route.prefix] = RouteHedgeStats(self.window_size)
+        return stats
+
+    def threshold(self, policy: HedgePolicy, stats: RouteHedgeStats) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        if len(stats.latencies) < policy.min_samples:
+            return None
+        delay = max(policy.min_delay, stats.latencies.percentile(policy.percentile) or 0.0)
+        if policy.max_delay is not None:
+            delay = min(delay, policy.max_delay)
+        return delay
+
+    async def run(self, route: Route, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await `call()`, hedging it with a second `call()` if it is slow.
+
+        Returns:
+            The first successful result. A failed attempt (an exception or a
+            5xx response) is ignored while the other one may still succeed.
+            If none succeeds, the result of the last attempt to finish.
+
+        Raises:
+            Whatever the last attempt to finish raises if none succeeds
+        """
+        stats = self.route_stats(route)
+        stats.requests += 1
+        self.budget.record_request()
+        delay = self.threshold(route.hedge, stats)
+        stats.threshold = delay
+        started = self._clock()
+
+        if delay is None:
+            result = await call()
+            stats.latencies.add(self._clock() - started)
+            return result
+
+        primary = asyncio.ensure_future(call())
+        attempts = [primary]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done:
+                if self.budget.try_retry():
+                    stats.hedged += 1
+                    logger.debug("Hedging request on %s after %.0f ms", route.prefix, delay * 1000)
+                    attempts.append(asyncio.ensure_future(call()))
+                else:
+                    stats.budget_exhausted += 1
+
+            pending = set(attempts)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if _succeeded(task)), None)
+                if winner is not None or not pending:
+                    break
+            if winner is None:
+                # Every attempt failed; return or raise the failure of the last one
+                return done.pop().result()
+            if winner is not primary:
+                stats.hedge_wins += 1
+            stats.latencies.add(self._clock() - started)
+            return winner.result()
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+            # Retrieve failures of the attempts that lost so they are not logged as unhandled
+            for task in attempts:
+                if task.done() and not task.cancelled():
+                    task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedges": self.budget.retries,
+            "budget_exhausted": self.budget.exhausted,
+            "routes": {prefix: stats.stats() for prefix, stats in self._routes.items()},
+        }
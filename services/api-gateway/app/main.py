@@ -1,14 +1,80 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from typing import Dict, Any, List, Optional
+from starlette.background import BackgroundTask
+from starlette.datastructures import Headers
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+import asyncio
+import hmac
+import math
 import httpx
 import os
+import time
 import logging
-from app.auth import verify_token, get_current_user
+from app.auth import verify_token, get_current_user, token_cache, rejected_tokens, local_verifier
+from app.upstream import UpstreamClients
+from app.health import HealthAggregator
+from app.middleware import AuthMiddleware
+from app.token_guard import FailureTracker
+from app.compression import CompressionMiddleware
+from app.metrics import REGISTRY, MetricsMiddleware, metrics_response, route_template
+from app.lazy import start_warm_up
+from app.logging_config import SAMPLED, configure_logging
+from app.tracing import SPAN_KIND_CLIENT, TracingMiddleware, configure_tracing, inject, start_span, traced
+from app.deadline import (
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    deadline_scope,
+    remaining,
+    run_with_deadline,
+    with_timeout_header,
+)
+from app.routing import PrefixRouter, RateLimit, Route, build_routes, load_route_settings, merge_route_settings
+from app.balancer import LoadBalancer, parse_upstreams
+from app.batch import (
+    BATCH_METHODS,
+    BatchItem,
+    BatchRequest,
+    encode_error,
+    encode_response,
+    item_body,
+    item_headers,
+    split_item_path,
+)
+from app.ratelimit import (
+    MemoryRateLimitBackend,
+    RateLimiter,
+    RedisRateLimitBackend,
+    load_backend,
+    retry_after_header,
+)
+from app.resilience import CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay
+from app.concurrency import (
+    PRIORITY_CRITICAL,
+    PRIORITY_LOW,
+    PRIORITY_READ,
+    PRIORITY_WRITE,
+    AdaptiveConcurrencyLimiter,
+    ConcurrencyLimitExceeded,
+    Permit,
+)
+from app.response_cache import ResponseCache, cache_key, etag_matches
+from app.singleflight import SingleFlight
+from app.hedging import Hedger
+from app.identity import create_signer_from_env
+from app.proxy import (
+    BufferedResponse,
+    PROXY_MODE_BUFFERED,
+    PROXY_MODE_STREAMING,
+    PROXY_MODES,
+    build_upstream_headers,
+    raise_for_upstream_error,
+    send_buffered,
+    send_streaming,
+)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging: JSON lines written by a background thread
+configure_logging("api-gateway")
 logger = logging.getLogger("api-gateway")
 
 # Configuration
@@ -18,12 +84,23 @@ BACKEND_CORS_ORIGINS = os.getenv(
     "http://localhost:3000,http://localhost:8080,https://grantcraft-frontend-320165158819.us-central1.run.app,https://grantcraft.ai"
 ).split(",")
 
+# Proxy mode: "buffered" reads upstream bodies in full, "streaming" passes them through
+GATEWAY_PROXY_MODE = os.getenv("GATEWAY_PROXY_MODE", PROXY_MODE_BUFFERED).lower()
+if GATEWAY_PROXY_MODE not in PROXY_MODES:
+    logger.warning(f"Unknown GATEWAY_PROXY_MODE {GATEWAY_PROXY_MODE}, using {PROXY_MODE_BUFFERED}")
+    GATEWAY_PROXY_MODE = PROXY_MODE_BUFFERED
+
+# Traces start here; the context is passed on to backend services in the traceparent header
+configure_tracing("api-gateway")
+
 # Log configuration on startup
 logger.info(f"API_PREFIX: {API_PREFIX}")
 logger.info(f"BACKEND_CORS_ORIGINS: {BACKEND_CORS_ORIGINS}")
+logger.info(f"GATEWAY_PROXY_MODE: {GATEWAY_PROXY_MODE}")
 
 # Service endpoints
-# These would normally be retrieved from a configuration file or service discovery
+# These would normally be retrieved from a configuration file or service discovery.
+# Each URL may list several comma-separated upstreams to balance over.
 SERVICE_ENDPOINTS = {
     "user-service": os.getenv("USER_SERVICE_URL", "http://user-service:8000"),
     "project-service": os.getenv("PROJECT_SERVICE_URL", "http://project-service:8000"),
@@ -47,12 +124,263 @@ PATH_TO_SERVICE = {
     "/agent": "agent-service",
 }
 
+# Per-route settings (timeout, retry, cache_ttl, stale_while_revalidate, mode,
+# rate_limit, priority, hedge), keyed by path prefix. GATEWAY_ROUTES_FILE can point to a
+# JSON file with the same structure; its fields override those below one by one.
+# Prefixes may have {param} segments and inherit what they do not set from the enclosing prefix.
+# Response caching and hedging are opt-in, for example
+# "/users/me": {"cache_ttl": 5, "stale_while_revalidate": 30}
+# "/chats/{id}/messages": {"hedge": {"percentile": 95, "max_delay": 1.0}}
+ROUTE_SETTINGS = {
+    # Agent requests wait on the LLM and tool calls, and each one costs Vertex AI usage.
+    # Agent runs are shed first when the service is saturated.
+    "/agent": {
+        "timeout": 120.0,
+        "priority": PRIORITY_LOW,
+        "rate_limit": {
+            "rate": float(os.getenv("AGENT_RATE_LIMIT_PER_MINUTE", "12")) / 60,
+            "burst": int(os.getenv("AGENT_RATE_LIMIT_BURST", "5")),
+        },
+    },
+}
+GATEWAY_ROUTES_FILE = os.getenv("GATEWAY_ROUTES_FILE")
+if GATEWAY_ROUTES_FILE:
+    ROUTE_SETTINGS = merge_route_settings(ROUTE_SETTINGS, load_route_settings(GATEWAY_ROUTES_FILE))
+
+# Time budget of a request on routes without a timeout of their own. The remaining
+# budget is passed to the backend in the X-Request-Timeout-Ms header.
+GATEWAY_REQUEST_TIMEOUT = float(os.getenv("GATEWAY_REQUEST_TIMEOUT", "30.0"))
+
+# Methods that are safe to retry on connection errors
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Methods that invalidate cached responses
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Request headers that change the upstream response, part of the coalescing key
+COALESCE_VARY_HEADERS = ("accept", "accept-encoding", "if-none-match", "if-modified-since", "range")
+
+# Longest-prefix router compiled once at startup
+router = PrefixRouter(build_routes(PATH_TO_SERVICE, ROUTE_SETTINGS))
+
+# Rate limiting: an overall token bucket per user plus per-route buckets
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+def create_rate_limit_backend():
+    """Create the configured rate limit backend, falling back to in-memory buckets"""
+    try:
+        if RATE_LIMIT_BACKEND:
+            return load_backend(RATE_LIMIT_BACKEND)
+        if RATE_LIMIT_REDIS_URL:
+            return RedisRateLimitBackend(RATE_LIMIT_REDIS_URL)
+    except Exception as e:
+        logger.error(f"Error creating rate limit backend, using in-memory buckets: {str(e)}")
+    return MemoryRateLimitBackend(max_buckets=int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000")))
+
+rate_limiter = RateLimiter(
+    create_rate_limit_backend(),
+    user_limit=RateLimit(
+        rate=float(os.getenv("USER_RATE_LIMIT_PER_SECOND", "20")),
+        burst=int(os.getenv("USER_RATE_LIMIT_BURST", "40")),
+    ),
+)
+
+# Per-service load balancers over the configured upstreams
+LOAD_BALANCING_STRATEGY = os.getenv("LOAD_BALANCING_STRATEGY", "p2c")
+load_balancers = {
+    service_name: LoadBalancer(
+        service_name,
+        parse_upstreams(service_url),
+        strategy=LOAD_BALANCING_STRATEGY,
+        consecutive_failures=int(os.getenv("OUTLIER_CONSECUTIVE_FAILURES", "5")),
+        latency_outlier_factor=float(os.getenv("OUTLIER_LATENCY_FACTOR", "3.0")),
+        ejection_duration=float(os.getenv("OUTLIER_EJECTION_SECONDS", "30.0")),
+        max_ejection_percent=float(os.getenv("OUTLIER_MAX_EJECTION_PERCENT", "50")),
+    )
+    for service_name, service_url in SERVICE_ENDPOINTS.items()
+}
+
+# Per-service circuit breakers. Calls slower than the slow call duration count
+# against the service like errors do; agent calls wait on the LLM.
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "10.0"))
+CIRCUIT_SLOW_CALL_OVERRIDES = {
+    "agent-service": float(os.getenv("AGENT_CIRCUIT_SLOW_CALL_SECONDS", "90.0")),
+}
+circuit_breakers = {
+    service_name: CircuitBreaker(
+        service_name,
+        window_size=int(os.getenv("CIRCUIT_WINDOW_SIZE", "20")),
+        min_calls=int(os.getenv("CIRCUIT_MIN_CALLS", "10")),
+        failure_rate_threshold=float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5")),
+        slow_call_duration=CIRCUIT_SLOW_CALL_OVERRIDES.get(service_name, CIRCUIT_SLOW_CALL_SECONDS),
+        slow_call_rate_threshold=float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "0.8")),
+        open_duration=float(os.getenv("CIRCUIT_OPEN_SECONDS", "30.0")),
+    )
+    for service_name in SERVICE_ENDPOINTS
+}
+
+# Per-service adaptive concurrency limits. Agent latency depends on the LLM rather
+# than on load, so only errors lower its limit.
+CONCURRENCY_LIMIT_ENABLED = os.getenv("CONCURRENCY_LIMIT_ENABLED", "true").lower() == "true"
+CONCURRENCY_LATENCY_TOLERANCE_OVERRIDES = {
+    "agent-service": None,
+}
+concurrency_limiters = {
+    service_name: AdaptiveConcurrencyLimiter(
+        service_name,
+        initial_limit=float(os.getenv("CONCURRENCY_INITIAL_LIMIT", "20")),
+        min_limit=float(os.getenv("CONCURRENCY_MIN_LIMIT", "2")),
+        max_limit=float(os.getenv("CONCURRENCY_MAX_LIMIT", "200")),
+        backoff_ratio=float(os.getenv("CONCURRENCY_BACKOFF_RATIO", "0.9")),
+        latency_tolerance=CONCURRENCY_LATENCY_TOLERANCE_OVERRIDES.get(
+            service_name, float(os.getenv("CONCURRENCY_LATENCY_TOLERANCE", "2.0"))
+        ),
+    )
+    for service_name in SERVICE_ENDPOINTS
+}
+
+# Per-service retry budgets for idempotent requests
+retry_budgets = {
+    service_name: RetryBudget(
+        ratio=float(os.getenv("RETRY_BUDGET_RATIO", "0.2")),
+        min_retries_per_second=float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1.0")),
+    )
+    for service_name in SERVICE_ENDPOINTS
+}
+
+# Buffered GETs on routes with a hedge policy get a second attempt when the first is
+# slower than the route's latency percentile. Hedges across all routes are capped at
+# HEDGE_BUDGET_RATIO of hedgeable requests, plus HEDGE_BUDGET_MIN_PER_SECOND.
+HEDGING_ENABLED = os.getenv("GATEWAY_HEDGING", "true").lower() == "true"
+hedger = Hedger(
+    budget=RetryBudget(
+        ratio=float(os.getenv("HEDGE_BUDGET_RATIO", "0.05")),
+        min_retries_per_second=float(os.getenv("HEDGE_BUDGET_MIN_PER_SECOND", "1.0")),
+    ),
+)
+
+# Services trust the user in a signed X-Internal-Identity header instead of verifying
+# the Firebase token again (INTERNAL_IDENTITY_KEY, shared with the services)
+identity_signer = create_signer_from_env()
+
+# Cached GET responses for routes with a cache_ttl
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+    max_body_size=int(os.getenv("RESPONSE_CACHE_MAX_BODY_SIZE", str(1024 * 1024))),
+)
+
+# Identical concurrent buffered GETs share one upstream call
+COALESCE_GETS = os.getenv("GATEWAY_COALESCE_GETS", "true").lower() == "true"
+single_flight = SingleFlight()
+
+# Upstream latency per service and upstream URL (both come from configuration, so the set is bounded)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "gateway_upstream_request_duration_seconds",
+    "Latency of requests to backend services until response headers, by outcome",
+    ("service", "upstream", "outcome"),
+)
+
+SHED_REQUESTS = REGISTRY.counter(
+    "gateway_shed_requests",
+    "Requests rejected because the service was at its concurrency limit, by priority",
+    ("service", "priority"),
+)
+CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "gateway_concurrency_limit",
+    "Current adaptive concurrency limit per service",
+    ("service",),
+)
+
+def observe_upstream(service: str, url: str, status_code: Optional[int], duration: float) -> None:
+    """Record an upstream call; `status_code` is None for transport errors"""
+    outcome = f"{status_code // 100}xx" if status_code is not None else "error"
+    UPSTREAM_LATENCY.labels(service, url, outcome).observe(duration)
+
 app = FastAPI(
     title="GrantCraft API Gateway",
     description="API Gateway for the GrantCraft system",
     version="0.1.0",
 )
 
+# Long-lived pooled clients, one per backend service
+upstream_clients = UpstreamClients(SERVICE_ENDPOINTS)
+
+# Backend health, probed concurrently and cached
+health_aggregator = HealthAggregator(
+    SERVICE_ENDPOINTS,
+    get_client=lambda service_name: upstream_clients.get(service_name),
+    timeout=float(os.getenv("HEALTH_CHECK_TIMEOUT", "2.0")),
+    ttl=float(os.getenv("HEALTH_CACHE_TTL", "5.0")),
+    refresh_interval=float(os.getenv("HEALTH_REFRESH_INTERVAL", "10.0")),
+)
+
+@app.on_event("startup")
+async def startup_event():
+    """Start background health checks, warm up lazy clients and prefetch token signing keys"""
+    health_aggregator.start()
+    await start_warm_up()
+    
+    if local_verifier:
+        try:
+            await local_verifier.key_cache.refresh()
+        except Exception as e:
+            logger.error(f"Failed to prefetch token signing keys: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and close pooled upstream connections on shutdown"""
+    await health_aggregator.stop()
+    await response_cache.aclose()
+    await rate_limiter.backend.aclose()
+    await upstream_clients.aclose()
+    if local_verifier:
+        await local_verifier.key_cache.aclose()
+
+# Paths served without user authentication. /metrics checks METRICS_TOKEN itself.
+PUBLIC_PATHS = {f"{API_PREFIX}/health", "/metrics"}
+
+# Bearer token Prometheus scrapes /metrics with. The gateway faces the internet and
+# its metrics show traffic and upstreams, so without a token they are not served.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Clients failing authentication AUTH_FAILURE_LIMIT times within
+# AUTH_FAILURE_WINDOW seconds are refused for AUTH_FAILURE_BLOCK seconds.
+# Off by default (AUTH_FAILURE_LIMIT=0): it needs the real client address,
+# which behind Cloud Run's front end is only known from X-Forwarded-For, so
+# set AUTH_TRUSTED_PROXY_HOPS to the number of proxies in front of the gateway.
+# Keyed on the proxy's address instead, one abuser would block every user.
+AUTH_TRUSTED_PROXY_HOPS = int(os.getenv("AUTH_TRUSTED_PROXY_HOPS", "0"))
+auth_failures = FailureTracker(
+    max_failures=int(os.getenv("AUTH_FAILURE_LIMIT", "0")),
+    window=float(os.getenv("AUTH_FAILURE_WINDOW", "60")),
+    block_duration=float(os.getenv("AUTH_FAILURE_BLOCK", "300")),
+    max_clients=int(os.getenv("AUTH_FAILURE_MAX_CLIENTS", "100000")),
+)
+if auth_failures.max_failures > 0 and AUTH_TRUSTED_PROXY_HOPS == 0:
+    logger.warning("AUTH_FAILURE_LIMIT is set without AUTH_TRUSTED_PROXY_HOPS; failures are counted per peer address")
+
+# Add authentication middleware. CORS is added after it so that it wraps
+# authentication and error responses also carry CORS headers.
+app.add_middleware(
+    AuthMiddleware,
+    verify=traced("auth verify_token")(verify_token),
+    public_paths=PUBLIC_PATHS,
+    failures=auth_failures,
+    trusted_proxy_hops=AUTH_TRUSTED_PROXY_HOPS,
+)
+
+# Compress responses for clients that accept gzip or brotli
+if os.getenv("GATEWAY_COMPRESSION", "true").lower() == "true":
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+        gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+        brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")),
+    )
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -62,69 +390,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        # Skip auth for OPTIONS requests and health check
-        if request.method == "OPTIONS" or request.url.path == f"{API_PREFIX}/health":
-            logger.info(f"Skipping auth for {request.method} {request.url.path}")
-            return await call_next(request)
-        
-        # Check for authentication token
-        try:
-            # Extract the token from the Authorization header
-            auth_header = request.headers.get("Authorization")
-            if not auth_header or not auth_header.startswith("Bearer "):
-                logger.warning(f"Missing or invalid Authorization header for {request.url.path}")
-                raise HTTPException(status_code=401, detail="Missing or invalid token")
-            
-            token = auth_header.split("Bearer ")[1]
-            # Verify the token
-            user_data = await verify_token(token)
-            # Add user data to request state for downstream handlers
-            request.state.user = user_data
-            logger.debug(f"Authenticated user {user_data.get('uid')} for {request.url.path}")
-            
-            return await call_next(request)
-        except HTTPException as e:
-            # Re-raise authentication errors
-            logger.warning(f"Authentication error for {request.url.path}: {e.detail}")
-            raise e
-        except Exception as e:
-            # Log the error and return a 500 error
-            logger.error(f"Authentication error for {request.url.path}: {str(e)}")
-            raise HTTPException(status_code=500, detail="Internal server error")
+def metrics_route_label(scope) -> Optional[str]:
+    """Label proxied requests with the matched route prefix instead of the catch-all template"""
+    path = scope["path"]
+    if path.startswith(API_PREFIX):
+        route = router.match(path[len(API_PREFIX):])
+        if route is not None:
+            return f"{API_PREFIX}{route.prefix}"
+    return route_template(scope)
 
-# Add authentication middleware
-app.add_middleware(AuthMiddleware)
+# Clients may ask for a shorter budget than the route's with X-Request-Timeout-Ms
+app.add_middleware(DeadlineMiddleware)
+
+# Tracing and request metrics wrap everything else so rejected requests are recorded too
+app.add_middleware(TracingMiddleware, route_label=metrics_route_label, trust_incoming_sampling=False)
+app.add_middleware(MetricsMiddleware, route_label=metrics_route_label)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """
+    Prometheus metrics, for scrapers holding METRICS_TOKEN
+    """
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    authorization = request.headers.get("authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return metrics_response()
 
 @app.get(f"{API_PREFIX}/health")
 async def health_check():
     """
     Health check endpoint for the API Gateway
     """
-    # Get service statuses
-    service_statuses = {}
-    
-    try:
-        for service_name, service_url in SERVICE_ENDPOINTS.items():
-            try:
-                # Only check health status if the service URL is set
-                if service_url and not service_url.startswith("http://none"):
-                    logger.info(f"Checking health of service: {service_name} at {service_url}")
-                    # We use a short timeout for health checks
-                    async with httpx.AsyncClient(timeout=2.0) as client:
-                        health_url = f"{service_url}/api/health"
-                        response = await client.get(health_url)
-                        if response.status_code == 200:
-                            service_statuses[service_name] = "healthy"
-                        else:
-                            service_statuses[service_name] = f"unhealthy ({response.status_code})"
-                else:
-                    service_statuses[service_name] = "not configured"
-            except Exception as e:
-                service_statuses[service_name] = f"error: {str(e)}"
-    except Exception as e:
-        logger.error(f"Error checking service health: {str(e)}")
+    # Last known service statuses, refreshed in the background
+    snapshot = await health_aggregator.snapshot()
     
     # Return health information including environment and service statuses
     return {
@@ -134,100 +434,447 @@ async def health_check():
             "api_prefix": API_PREFIX,
             "port": os.getenv("PORT", "8080")
         },
-        "services": service_statuses
+        "services": snapshot["services"],
+        "services_age_seconds": snapshot["age_seconds"],
+        "auth": {
+            "token_cache": token_cache.stats(),
+            "rejected_tokens": rejected_tokens.stats(),
+            "failures": auth_failures.stats(),
+        },
+        "response_cache": response_cache.stats(),
+        "coalescing": single_flight.stats(),
+        "hedging": hedger.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "concurrency": {
+            service_name: limiter.stats()
+            for service_name, limiter in concurrency_limiters.items()
+        },
+        "circuit_breakers": {
+            service_name: {**breaker.stats(), "retry_budget": retry_budgets[service_name].stats()}
+            for service_name, breaker in circuit_breakers.items()
+        },
+        "upstreams": {
+            service_name: balancer.stats()
+            for service_name, balancer in load_balancers.items()
+        }
     }
 
-@app.api_route(f"{API_PREFIX}{{path:path}}", methods=["GET", "POST", "PUT", "DELETE"])
-async def api_gateway(path: str, request: Request, request_data: Dict[str, Any] = None):
+def upstream_attributes(route: Route, url: str, attempt: int = 0) -> Dict[str, Any]:
+    """Span attributes of a call to a backend service"""
+    return {"peer.service": route.service, "http.url": url, "retry.attempt": attempt}
+
+def request_priority(route: Route, method: str, path: str) -> str:
+    """Concurrency priority class of a request"""
+    if method in READ_METHODS:
+        # Only reads of a service's own health endpoint, e.g. GET /agent/health
+        if method != "OPTIONS" and path.rstrip("/") == f"{route.prefix}/health":
+            return PRIORITY_CRITICAL
+        return PRIORITY_READ
+    return route.priority or PRIORITY_WRITE
+
+def acquire_slot(route: Route, method: str, path: str) -> Optional[Permit]:
     """
-    Main API Gateway endpoint that routes requests to the appropriate service
+    Take a slot under the service's concurrency limit.
+
+    Raises:
+        ConcurrencyLimitExceeded: If the request is shed
     """
-    # Determine which service to route to
-    service = None
-    for path_prefix, service_name in PATH_TO_SERVICE.items():
-        if path.startswith(path_prefix):
-            service = service_name
-            break
-    
-    if not service:
-        logger.warning(f"No service mapping found for path: {path}")
+    if not CONCURRENCY_LIMIT_ENABLED:
+        return None
+    return concurrency_limiters[route.service].acquire(request_priority(route, method, path))
+
+def record_slot(route: Route, permit: Optional[Permit], success: Optional[bool]) -> None:
+    """Adapt the service's concurrency limit to a call's outcome while it keeps its slot"""
+    if permit is None:
+        return
+    limiter = concurrency_limiters[route.service]
+    limiter.record(permit, success)
+    CONCURRENCY_LIMIT.labels(route.service).set(int(limiter.limit))
+
+def release_slot(route: Route, permit: Optional[Permit], success: Optional[bool]) -> None:
+    """Give back a slot taken by `acquire_slot`; `success` is None for calls without an outcome"""
+    if permit is None:
+        return
+    limiter = concurrency_limiters[route.service]
+    limiter.release(permit, success)
+    CONCURRENCY_LIMIT.labels(route.service).set(int(limiter.limit))
+
+async def forward_buffered(
+    route: Route,
+    method: str,
+    path: str,
+    headers: List,
+    params: List,
+    body: bytes,
+) -> BufferedResponse:
+    """
+    Send a buffered request, hedging GETs on routes with a hedge policy.
+    """
+    forward = lambda: forward_with_retries(route, method, path, headers, params, body)
+    if HEDGING_ENABLED and method == "GET" and route.hedge is not None:
+        return await hedger.run(route, forward)
+    return await forward()
+
+async def forward_with_retries(
+    route: Route,
+    method: str,
+    path: str,
+    headers: List,
+    params: List,
+    body: bytes,
+) -> BufferedResponse:
+    """
+    Send a buffered request to one of the service's upstreams through its circuit breaker.
+    Idempotent methods are retried per the route's policy while the retry budget allows.
+    Every attempt takes a slot under the service's concurrency limit.
+    """
+    client = upstream_clients.get(route.service)
+    balancer = load_balancers[route.service]
+    breaker = circuit_breakers[route.service]
+    budget = retry_budgets[route.service]
+    retries = route.retry.max_retries if method in IDEMPOTENT_METHODS else 0
+    budget.record_request()
+    attempt = 0
+    while True:
+        permit = acquire_slot(route, method, path)
+        try:
+            breaker.check()
+        except CircuitOpenError:
+            release_slot(route, permit, None)
+            raise
+        upstream_node = balancer.acquire()
+        started = time.monotonic()
+        try:
+            with start_span(f"{method} {route.service}", upstream_attributes(route, upstream_node.url, attempt), SPAN_KIND_CLIENT) as span:
+                upstream = await run_with_deadline(send_buffered(
+                    client,
+                    method,
+                    f"{upstream_node.url}{path}",
+                    with_timeout_header(inject(headers, span)),
+                    params=params,
+                    content=body,
+                    timeout=route.timeout,
+                ), "upstream")
+                span.set_attribute("http.status_code", upstream.status_code)
+        except httpx.TransportError as e:
+            duration = time.monotonic() - started
+            breaker.record(False, duration)
+            balancer.observe(upstream_node, False, duration)
+            observe_upstream(route.service, upstream_node.url, None, duration)
+            release_slot(route, permit, False)
+            delay = backoff_delay(route.retry, attempt + 1)
+            left = remaining()
+            # No retry if it could not finish before the deadline
+            if attempt >= retries or (left is not None and delay >= left) or not budget.try_retry():
+                raise
+            attempt += 1
+            logger.warning("Retrying %s %s on %s (attempt %d): %s", method, path, route.service, attempt, e)
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            breaker.release()
+            release_slot(route, permit, None)
+            raise
+        finally:
+            balancer.release(upstream_node)
+        duration = time.monotonic() - started
+        breaker.record(upstream.status_code < 500, duration)
+        balancer.observe(upstream_node, upstream.status_code < 500, duration)
+        observe_upstream(route.service, upstream_node.url, upstream.status_code, duration)
+        release_slot(route, permit, upstream.status_code < 500)
+        return upstream
+
+async def forward_streaming(
+    route: Route,
+    method: str,
+    path: str,
+    headers: List,
+    params: List,
+    content,
+) -> Response:
+    """
+    Stream a request to one of the service's upstreams through its circuit breaker.
+    The upstream counts as in flight, and the request holds its concurrency slot,
+    until the response body has been sent. The concurrency limit adapts to the
+    time to response headers, like the circuit breaker, so slow clients and long
+    streams are not taken for an overloaded service.
+    """
+    balancer = load_balancers[route.service]
+    breaker = circuit_breakers[route.service]
+    permit = acquire_slot(route, method, path)
+    try:
+        breaker.check()
+    except CircuitOpenError:
+        release_slot(route, permit, None)
+        raise
+    upstream_node = balancer.acquire()
+    started = time.monotonic()
+    try:
+        # The span covers the time to response headers
+        with start_span(f"{method} {route.service}", upstream_attributes(route, upstream_node.url), SPAN_KIND_CLIENT) as span:
+            response = await run_with_deadline(send_streaming(
+                upstream_clients.get(route.service),
+                method,
+                f"{upstream_node.url}{path}",
+                with_timeout_header(inject(headers, span)),
+                params=params,
+                content=content,
+                timeout=route.timeout,
+            ), "upstream")
+            span.set_attribute("http.status_code", response.status_code)
+    except httpx.TransportError:
+        duration = time.monotonic() - started
+        breaker.record(False, duration)
+        balancer.observe(upstream_node, False, duration)
+        observe_upstream(route.service, upstream_node.url, None, duration)
+        balancer.release(upstream_node)
+        release_slot(route, permit, False)
+        raise
+    except BaseException:
+        breaker.release()
+        balancer.release(upstream_node)
+        release_slot(route, permit, None)
+        raise
+    # Time to response headers; the body is streamed afterwards
+    duration = time.monotonic() - started
+    breaker.record(response.status_code < 500, duration)
+    balancer.observe(upstream_node, response.status_code < 500, duration)
+    observe_upstream(route.service, upstream_node.url, response.status_code, duration)
+    record_slot(route, permit, response.status_code < 500)
+    
+    close_upstream = response.background
+    
+    async def finish():
+        try:
+            if close_upstream is not None:
+                await close_upstream()
+        finally:
+            balancer.release(upstream_node)
+            release_slot(route, permit, None)
+    
+    response.background = BackgroundTask(finish)
+    return response
+
+def resolve_route(path: str) -> Route:
+    """
+    Find the route for a path below the API prefix, raising 404 or 503 if it cannot be served.
+    """
+    route = router.match(path)
+    if not route:
+        logger.warning("No service mapping found for path: %s", path)
         raise HTTPException(status_code=404, detail="Service not found")
     
-    # Get service URL
-    service_url = SERVICE_ENDPOINTS.get(service)
-    if not service_url:
-        logger.error(f"Service URL not configured for service: {service}")
+    # Check that the service has upstreams
+    if not load_balancers[route.service].upstreams:
+        logger.error("Service URL not configured for service: %s", route.service)
+        raise HTTPException(status_code=503, detail=f"Service {route.service} is not available")
+    return route
+
+async def enforce_rate_limit(route: Route, client_id: str) -> None:
+    """Raise 429 with a Retry-After header if the client is over one of its limits"""
+    if not RATE_LIMIT_ENABLED:
+        return
+    wait = await rate_limiter.check(client_id, route)
+    if wait > 0:
+        logger.warning("Rate limit exceeded for %s on %s", client_id, route.prefix)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": retry_after_header(wait)},
+        )
+
+def identity_for(route: Route, user_data: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Signed identity assertion of the user for the route's service, if configured"""
+    if identity_signer is None or not user_data or not user_data.get("uid"):
+        return None
+    return identity_signer.mint(user_data, route.service)
+
+def client_id_for(request: Request, user_data: Optional[Dict[str, Any]]) -> str:
+    """Rate limit key: the user id, or the client address for anonymous requests"""
+    return (user_data or {}).get("uid") or (request.client.host if request.client else "anonymous")
+
+@contextmanager
+def upstream_errors(service: str) -> Iterator[None]:
+    """Map failures while forwarding to a service onto HTTP errors"""
+    try:
+        yield
+    except DeadlineExceeded:
+        logger.warning("Deadline exceeded waiting for %s", service)
+        raise HTTPException(status_code=504, detail="Deadline exceeded")
+    except ConcurrencyLimitExceeded as e:
+        SHED_REQUESTS.labels(service, e.priority).inc()
+        logger.warning("Shedding %s request to %s: concurrency limit reached", e.priority, service)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service {service} is overloaded",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
+    except CircuitOpenError as e:
+        logger.warning("Rejecting request to %s: circuit is open", service)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service {service} is not available",
+            headers={"Retry-After": str(max(1, int(e.retry_after)))},
+        )
+    except httpx.RequestError as e:
+        logger.error("Error forwarding request to %s: %s", service, e)
         raise HTTPException(status_code=503, detail=f"Service {service} is not available")
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except Exception as e:
+        logger.error("Error processing request: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+async def proxy_buffered(
+    route: Route,
+    method: str,
+    path: str,
+    request_headers: Headers,
+    params: List,
+    body: bytes,
+    user_data: Optional[Dict[str, Any]],
+) -> Response:
+    """
+    Forward a buffered request, serving GETs from the response cache and
+    coalescing identical in-flight GETs where enabled.
+    """
+    headers = build_upstream_headers(request_headers.items(), user_data, identity=identity_for(route, user_data))
     
-    logger.info(f"Routing request to {service} at {service_url}{path}")
+    key = None
+    coalesce_key = None
+    if method == "GET":
+        key = cache_key(
+            user_data.get("uid") if user_data else None,
+            path,
+            params,
+            variant=request_headers.get("accept-encoding", ""),
+        )
+        if COALESCE_GETS:
+            coalesce_key = (key, tuple(request_headers.get(name, "") for name in COALESCE_VARY_HEADERS))
     
-    # Forward the request
-    target_url = f"{service_url}{path}"
+    async def fetch() -> BufferedResponse:
+        forward = lambda: forward_buffered(route, method, path, headers, params, body)
+        if coalesce_key is None:
+            return await forward()
+        # Identical in-flight GETs share one upstream call
+        return await single_flight.do(coalesce_key, forward)
+    
+    if key is not None and route.cache_ttl > 0:
+        upstream, cache_status = await response_cache.get_or_fetch(
+            key,
+            fetch,
+            ttl=route.cache_ttl,
+            stale_while_revalidate=route.stale_while_revalidate,
+            refresh="no-cache" in request_headers.get("cache-control", "").lower(),
+        )
+        raise_for_upstream_error(route.service, upstream)
+        
+        etag = upstream.header("etag")
+        if etag and etag_matches(request_headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, "X-Cache": cache_status})
+        response = upstream.to_response()
+        response.headers["X-Cache"] = cache_status
+        return response
+    
+    upstream = await fetch()
+    
+    # Check for error status codes
+    raise_for_upstream_error(route.service, upstream)
+    
+    # Return the service's response
+    return upstream.to_response()
+
+# Sub-requests allowed in one batch
+BATCH_MAX_REQUESTS = int(os.getenv("GATEWAY_BATCH_MAX_REQUESTS", "20"))
+
+@app.post(f"{API_PREFIX}/batch")
+async def batch(batch_request: BatchRequest, request: Request):
+    """
+    Run several API requests in one round trip. Sub-requests are dispatched
+    concurrently and each gets its own status in the response.
+    """
+    if len(batch_request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch may contain at most {BATCH_MAX_REQUESTS} requests",
+        )
+    
+    user_data = request.state.user if hasattr(request.state, "user") else None
+    client_id = client_id_for(request, user_data)
+    
+    async def run(item: BatchItem) -> Dict[str, Any]:
+        method = item.method.upper()
+        path, params = split_item_path(item.path, API_PREFIX)
+        try:
+            if method not in BATCH_METHODS:
+                raise HTTPException(status_code=405, detail="Method not allowed")
+            if path == "/batch":
+                raise HTTPException(status_code=400, detail="Batches cannot be nested")
+            route = resolve_route(path)
+            await enforce_rate_limit(route, client_id)
+            try:
+                with upstream_errors(route.service), deadline_scope(route.timeout or GATEWAY_REQUEST_TIMEOUT):
+                    response = await proxy_buffered(
+                        route,
+                        method,
+                        path,
+                        Headers(headers=item_headers(request.headers.items(), item)),
+                        params,
+                        item_body(item),
+                        user_data,
+                    )
+            finally:
+                if method in WRITE_METHODS:
+                    response_cache.invalidate(path)
+        except HTTPException as e:
+            return encode_error(item.id, e)
+        return encode_response(item.id, response)
+    
+    logger.info("Dispatching batch of %d requests", len(batch_request.requests), extra=SAMPLED)
+    responses = await asyncio.gather(*(run(item) for item in batch_request.requests))
+    return {"responses": responses}
+
+@app.api_route(f"{API_PREFIX}{{path:path}}", methods=["GET", "POST", "PUT", "DELETE"])
+async def api_gateway(path: str, request: Request):
+    """
+    Main API Gateway endpoint that routes requests to the appropriate service
+    """
+    # Determine which service to route to
+    route = resolve_route(path)
+    service = route.service
     
     # Get user data from request state
     user_data = request.state.user if hasattr(request.state, "user") else None
     
-    # Prepare headers
-    headers = {k: v for k, v in request.headers.items() if k.lower() != "host"}
-    if user_data:
-        # Add user information to headers for service
-        headers["X-User-ID"] = user_data.get("uid", "")
-        headers["X-User-Email"] = user_data.get("email", "")
+    await enforce_rate_limit(route, client_id_for(request, user_data))
+    
+    logger.info("Routing request to %s: %s", service, path, extra=SAMPLED)
+    
+    # Forward the request
+    streaming = (route.mode or GATEWAY_PROXY_MODE) == PROXY_MODE_STREAMING
+    
+    params = request.query_params.multi_items()
     
     try:
-        async with httpx.AsyncClient() as client:
-            # Send request to the appropriate service
-            if request.method == "GET":
-                response = await client.get(
-                    target_url, 
-                    headers=headers,
-                    params=request.query_params
-                )
-            elif request.method == "POST":
-                response = await client.post(
-                    target_url, 
-                    headers=headers,
-                    json=request_data
+        with upstream_errors(service), deadline_scope(route.timeout or GATEWAY_REQUEST_TIMEOUT):
+            if streaming:
+                # Pass the raw request body through and stream the response back
+                headers = build_upstream_headers(
+                    request.headers.items(),
+                    user_data,
+                    keep_content_length=True,
+                    identity=identity_for(route, user_data),
                 )
-            elif request.method == "PUT":
-                response = await client.put(
-                    target_url, 
-                    headers=headers,
-                    json=request_data
-                )
-            elif request.method == "DELETE":
-                response = await client.delete(
-                    target_url, 
-                    headers=headers
-                )
-            else:
-                raise HTTPException(status_code=405, detail="Method not allowed")
+                return await forward_streaming(route, request.method, path, headers, params, request.stream())
             
-            # Check for error status codes
-            if response.status_code >= 400:
-                logger.warning(f"Error response from {service}: {response.status_code}")
-                error_detail = "Service error"
-                try:
-                    error_data = response.json()
-                    if "detail" in error_data:
-                        error_detail = error_data["detail"]
-                except:
-                    pass
-                    
-                raise HTTPException(status_code=response.status_code, detail=error_detail)
-                
-            # Return the service's response
-            return response.json()
-    except httpx.RequestError as e:
-        logger.error(f"Error forwarding request to {service}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"Service {service} is not available")
-    except HTTPException:
-        # Re-raise HTTP exceptions
-        raise
-    except Exception as e:
-        logger.error(f"Error processing request: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+            body = await request.body()
+            return await proxy_buffered(route, request.method, path, request.headers, params, body, user_data)
+    finally:
+        if request.method in WRITE_METHODS:
+            # Writes invalidate cached responses for related paths
+            response_cache.invalidate(path)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,163 @@
+"""
+ASGI middleware for the API Gateway.
+"""
+import logging
+import math
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.token_guard import FailureTracker
+
+logger = logging.getLogger("api-gateway")
+
+BEARER_PREFIX = "Bearer "
+
+
+def bearer_token(scope: Scope) -> Optional[str]:
+    """
+    Extract the bearer token from the raw ASGI headers.
+
+    Returns:
+        The token, or None if the Authorization header is missing or not a bearer token
+    """
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            header = value.decode("latin-1")
+            if header.startswith(BEARER_PREFIX):
+                return header[len(BEARER_PREFIX):]
+            return None
+    return None
+
+
+def client_address(scope: Scope, trusted_proxy_hops: int = 0) -> Optional[str]:
+    """
+    The address of the client that sent the request.
+
+    Each proxy in front of the gateway appends the address it received the
+    request from to X-Forwarded-For. With `trusted_proxy_hops` proxies of our
+    own in front (Cloud Run's front end is one), the client is the entry that
+    many places from the right of the forwarded addresses followed by the
+    peer address. Entries further left are set by the client and are not
+    trusted.
+
+    Args:
+        scope: ASGI connection scope
+        trusted_proxy_hops: Number of trusted proxies in front of the gateway
+
+    Returns:
+        The client address, or None if it is unknown
+    """
+    peer = scope["client"][0] if scope.get("client") else None
+    if trusted_proxy_hops <= 0:
+        return peer
+    forwarded = []
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for":
+            forwarded.extend(part.strip() for part in value.decode("latin-1").split(","))
+    addresses = [address for address in forwarded if address] + ([peer] if peer else [])
+    if len(addresses) <= trusted_proxy_hops:
+        # Fewer hops than configured: the request did not come through the proxies
+        return None
+    return addresses[-(trusted_proxy_hops + 1)]
+
+
+class AuthMiddleware:
+    """
+    Authenticates every request except public paths and CORS preflights.
+
+    The verified user is stored in `scope["state"]["user"]`, which is what
+    `request.state.user` reads. Failures are answered directly with a JSON
+    error instead of raising through the middleware stack.
+
+    With a FailureTracker, clients that fail authentication too often are
+    answered 429 before their token is looked at. Only rejected credentials
+    count; requests without any are cheap to answer and are not counted.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        verify: Callable[[str], Awaitable[Dict[str, Any]]],
+        public_paths: Iterable[str] = (),
+        failures: Optional[FailureTracker] = None,
+        trusted_proxy_hops: int = 0,
+    ):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application
+            verify: Coroutine verifying a token and returning the user data
+            public_paths: Exact paths that do not require authentication
+            failures: Tracker of failed authentications per client address
+            trusted_proxy_hops: Trusted proxies in front of the gateway, used to find
+                the client address in X-Forwarded-For
+        """
+        self.app = app
+        self.verify = verify
+        self.public_paths = frozenset(public_paths)
+        self.failures = failures
+        self.trusted_proxy_hops = trusted_proxy_hops
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in self.public_paths:
+            await self.app(scope, receive, send)
+            return
+
+        client = client_address(scope, self.trusted_proxy_hops) if self.failures is not None else None
+        if self.failures is not None and client is not None:
+            retry_after = self.failures.blocked(client)
+            if retry_after:
+                await self._reject(
+                    scope, receive, send, 429, "Too many failed authentication attempts",
+                    {"Retry-After": str(math.ceil(retry_after))},
+                )
+                return
+
+        token = bearer_token(scope)
+        if not token:
+            logger.warning("Missing or invalid Authorization header for %s", scope["path"])
+            await self._reject(scope, receive, send, 401, "Missing or invalid token")
+            return
+
+        try:
+            user_data = await self.verify(token)
+        except HTTPException as e:
+            logger.warning("Authentication error for %s: %s", scope["path"], e.detail)
+            if e.status_code == 401:
+                self._record_failure(client)
+            await self._reject(scope, receive, send, e.status_code, e.detail)
+            return
+        except Exception as e:
+            logger.error(f"Authentication error for {scope['path']}: {str(e)}")
+            await self._reject(scope, receive, send, 500, "Internal server error")
+            return
+
+        if self.failures is not None and client is not None:
+            self.failures.record_success(client)
+
+        # Add user data to request state for downstream handlers
+        scope.setdefault("state", {})["user"] = user_data
+        await self.app(scope, receive, send)
+
+    def _record_failure(self, client: Optional[str]) -> None:
+        if self.failures is not None and client is not None:
+            self.failures.record_failure(client)
+
+    @staticmethod
+    async def _reject(
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        status_code: int,
+        detail: Any,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Send a JSON error response"""
+        if status_code == 401:
+            headers = {**(headers or {}), "WWW-Authenticate": "Bearer"}
+        response = JSONResponse({"detail": detail}, status_code=status_code, headers=headers)
+        await response(scope, receive, send)
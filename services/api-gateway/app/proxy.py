@@ -0,0 +1,241 @@
+"""
+Request forwarding for the API Gateway.
+
+Two proxy modes are supported:
+
+* buffered  - the upstream body is read in full before it is returned. The
+              raw bytes are passed through untouched; only error bodies are
+              decoded so they can be normalised into a `detail` message.
+* streaming - the request body is streamed upstream and the upstream body
+              is streamed back to the client as it arrives.
+
+Neither mode decodes or re-encodes successful response bodies.
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+import httpx
+from fastapi import HTTPException
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
+
+logger = logging.getLogger("api-gateway")
+
+PROXY_MODE_BUFFERED = "buffered"
+PROXY_MODE_STREAMING = "streaming"
+PROXY_MODES = (PROXY_MODE_BUFFERED, PROXY_MODE_STREAMING)
+
+# Headers that describe a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+})
+
+# Identity headers are only ever set by the gateway itself
+GATEWAY_IDENTITY_HEADERS = frozenset({"x-user-id", "x-user-email", "x-internal-identity"})
+
+Headers = List[Tuple[str, str]]
+RequestContent = Union[bytes, AsyncIterator[bytes], None]
+
+
+@dataclass
+class BufferedResponse:
+    """A fully read upstream response"""
+    status_code: int
+    headers: Headers = field(default_factory=list)
+    content: bytes = b""
+
+    def header(self, name: str) -> Optional[str]:
+        """Get the first value of a header, case-insensitively"""
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+    def to_response(self) -> Response:
+        """Convert to a Starlette response, preserving status and headers"""
+        response = Response(content=self.content, status_code=self.status_code)
+        return apply_headers(response, self.headers)
+
+
+def apply_headers(response: Response, headers: Iterable[Tuple[str, str]]) -> Response:
+    """
+    Append headers to a response, keeping repeated headers such as Set-Cookie.
+
+    Args:
+        response: The outgoing response
+        headers: Headers to append
+
+    Returns:
+        The same response
+    """
+    response.raw_headers.extend(
+        (key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in headers
+    )
+    return response
+
+
+def build_upstream_headers(
+    request_headers: Iterable[Tuple[str, str]],
+    user_data: Optional[Dict[str, str]] = None,
+    keep_content_length: bool = False,
+    identity: Optional[str] = None,
+) -> Headers:
+    """
+    Build the header list to send upstream.
+
+    Args:
+        request_headers: Incoming request headers
+        user_data: Authenticated user, if any
+        keep_content_length: Keep the client's Content-Length (streamed bodies)
+        identity: Signed identity assertion of the user for the service
+
+    Returns:
+        Filtered header list with gateway identity headers added
+    """
+    headers = []
+    for key, value in request_headers:
+        lower = key.lower()
+        if lower in HOP_BY_HOP_HEADERS or lower in GATEWAY_IDENTITY_HEADERS:
+            continue
+        if lower == "content-length" and not keep_content_length:
+            continue
+        headers.append((key, value))
+
+    if user_data:
+        # Add user information to headers for service
+        headers.append(("X-User-ID", user_data.get("uid") or ""))
+        headers.append(("X-User-Email", user_data.get("email") or ""))
+    if identity:
+        headers.append(("X-Internal-Identity", identity))
+
+    return headers
+
+
+def filter_response_headers(headers: Iterable[Tuple[str, str]]) -> Headers:
+    """
+    Drop hop-by-hop and length headers from an upstream response.
+
+    Content-Length is recomputed by the outgoing response; Content-Encoding
+    is kept because bodies are forwarded as raw bytes.
+    """
+    return [
+        (key, value) for key, value in headers
+        if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() != "content-length"
+    ]
+
+
+def error_detail(content: bytes) -> str:
+    """Extract the `detail` message from an upstream error body"""
+    try:
+        error_data = json.loads(content)
+        if isinstance(error_data, dict) and "detail" in error_data:
+            return error_data["detail"]
+    except (ValueError, UnicodeDecodeError):
+        pass
+    return "Service error"
+
+
+async def send_buffered(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    headers: Headers,
+    params: Optional[Iterable[Tuple[str, str]]] = None,
+    content: Optional[bytes] = None,
+    timeout: Optional[float] = None,
+) -> BufferedResponse:
+    """
+    Send a request upstream and read the whole response.
+
+    Successful bodies are read raw so compressed payloads are passed through
+    without being decoded. Error bodies are decoded so their detail can be read.
+
+    Raises:
+        httpx.RequestError: If the upstream could not be reached
+    """
+    request = client.build_request(
+        method,
+        url,
+        headers=headers,
+        params=params,
+        content=content or None,
+        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+    )
+    response = await client.send(request, stream=True)
+    try:
+        if response.status_code >= 400:
+            body = await response.aread()
+            response_headers = [
+                (key, value) for key, value in filter_response_headers(response.headers.items())
+                if key.lower() != "content-encoding"
+            ]
+        else:
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+            response_headers = filter_response_headers(response.headers.items())
+    finally:
+        await response.aclose()
+
+    return BufferedResponse(
+        status_code=response.status_code,
+        headers=response_headers,
+        content=body,
+    )
+
+
+def raise_for_upstream_error(service: str, upstream: BufferedResponse) -> None:
+    """
+    Normalise an upstream error response into an HTTPException.
+
+    Raises:
+        HTTPException: If the upstream returned a 4xx/5xx status
+    """
+    if upstream.status_code >= 400:
+        logger.warning("Error response from %s: %d", service, upstream.status_code)
+        raise HTTPException(status_code=upstream.status_code, detail=error_detail(upstream.content))
+
+
+async def send_streaming(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    headers: Headers,
+    params: Optional[Iterable[Tuple[str, str]]] = None,
+    content: RequestContent = None,
+    timeout: Optional[float] = None,
+) -> StreamingResponse:
+    """
+    Send a request upstream and stream the response back unchanged.
+
+    The upstream connection is released once the client has received the
+    body or disconnected.
+
+    Raises:
+        httpx.RequestError: If the upstream could not be reached
+    """
+    request = client.build_request(
+        method,
+        url,
+        headers=headers,
+        params=params,
+        content=content,
+        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+    )
+    response = await client.send(request, stream=True)
+
+    streaming_response = StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        background=BackgroundTask(response.aclose),
+    )
+    return apply_headers(streaming_response, filter_response_headers(response.headers.items()))
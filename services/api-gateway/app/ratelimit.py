@@ -0,0 +1,243 @@
+"""
+Token-bucket rate limiting for the API Gateway.
+
+Every user has an overall bucket, and routes with a `rate_limit` add a
+tighter bucket per user and route (for example the agent routes, which are
+backed by Vertex AI). A request must get a token from each bucket that
+applies; otherwise it is answered with 429 and a Retry-After header. The
+user bucket is checked first, so a request the user's overall limit
+refuses does not use up a route allowance as well.
+
+Bucket state lives in a backend:
+
+* MemoryRateLimitBackend - per-process, bounded LRU of buckets (default)
+* RedisRateLimitBackend  - shared between gateway instances (needs the optional
+                           `redis` package and RATE_LIMIT_REDIS_URL)
+
+Any object with the same `acquire` coroutine can be used instead, loaded
+from RATE_LIMIT_BACKEND as "module:factory".
+"""
+import importlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.routing import RateLimit, Route
+
+logger = logging.getLogger("api-gateway")
+
+
+class MemoryRateLimitBackend:
+    """
+    In-process token buckets.
+
+    Buckets are kept in LRU order and the least recently used ones are
+    dropped beyond `max_buckets`. An idle bucket refills to full anyway, so
+    dropping it only forgets a user who has not sent requests for a while.
+    """
+
+    def __init__(self, max_buckets: int = 100000, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the backend.
+
+        Args:
+            max_buckets: Maximum number of buckets kept in memory
+            clock: Monotonic clock
+        """
+        self.max_buckets = max_buckets
+        self._clock = clock
+        # key -> [tokens, last refill time]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def acquire(self, key: str, limit: RateLimit, cost: float = 1.0) -> float:
+        """
+        Take tokens from a bucket.
+
+        Args:
+            key: Bucket key
+            limit: Refill rate and capacity of the bucket
+            cost: Tokens needed
+
+        Returns:
+            0 if the tokens were taken, otherwise seconds until they are available
+        """
+        now = self._clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(limit.burst), now]
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(float(limit.burst), bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / limit.rate
+
+    async def aclose(self) -> None:
+        pass
+
+
+# Token bucket evaluated atomically in Redis using the server's clock
+_REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "ts", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitBackend:
+    """
+    Token buckets shared between gateway instances through Redis.
+
+    Buckets expire once they would have refilled, so Redis memory stays bounded.
+    """
+
+    def __init__(self, url: str, prefix: str = "gateway:ratelimit:"):
+        """
+        Initialize the backend.
+
+        Args:
+            url: Redis URL, e.g. redis://localhost:6379/0
+            prefix: Key prefix for bucket keys
+
+        Raises:
+            ImportError: If the optional redis package is not installed
+        """
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise ImportError("RedisRateLimitBackend requires the redis package (pip install redis)") from e
+
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_TOKEN_BUCKET)
+
+    async def acquire(self, key: str, limit: RateLimit, cost: float = 1.0) -> float:
+        wait = await self._script(keys=[f"{self.prefix}{key}"], args=[limit.rate, limit.burst, cost])
+        return float(wait)
+
+    async def aclose(self) -> None:
+        await self._redis.close()
+
+
+def load_backend(path: str) -> Any:
+    """
+    Create a backend from a "module:factory" import path.
+
+    Args:
+        path: e.g. "mypackage.limits:create_backend"
+
+    Returns:
+        The object returned by calling the factory
+    """
+    module_name, _, attribute = path.partition(":")
+    factory = getattr(importlib.import_module(module_name), attribute)
+    return factory()
+
+
+class RateLimiter:
+    """
+    Applies the per-user and per-route limits to requests.
+    """
+
+    def __init__(self, backend: Any, user_limit: Optional[RateLimit] = None, fail_open: bool = True):
+        """
+        Initialize the limiter.
+
+        Args:
+            backend: Bucket backend with an `acquire(key, limit, cost)` coroutine
+            user_limit: Limit on all requests of a user (None disables it)
+            fail_open: Allow requests when the backend fails
+
+        Raises:
+            ValueError: If the user limit's rate or burst is not positive
+        """
+        if user_limit is not None and (user_limit.rate <= 0 or user_limit.burst <= 0):
+            raise ValueError("User rate limit rate and burst must be positive")
+        self.backend = backend
+        self.user_limit = user_limit
+        self.fail_open = fail_open
+
+        self.allowed = 0
+        self.limited = 0
+        self.backend_errors = 0
+
+    def _buckets(self, client_id: str, route: Route) -> List[Tuple[str, RateLimit]]:
+        # Tokens are not given back when a later bucket refuses, so the overall
+        # bucket goes first: a request it refuses leaves the route allowance alone
+        buckets = []
+        if self.user_limit is not None:
+            buckets.append((client_id, self.user_limit))
+        if route.rate_limit is not None:
+            buckets.append((f"{client_id}:{route.rate_limit_scope or route.prefix}", route.rate_limit))
+        return buckets
+
+    async def check(self, client_id: str, route: Route) -> float:
+        """
+        Take a token for a request from every bucket that applies.
+
+        Args:
+            client_id: User id (or client address for anonymous requests)
+            route: The matched route
+
+        Returns:
+            0 if the request may proceed, otherwise seconds to wait before retrying
+        """
+        for key, limit in self._buckets(client_id, route):
+            try:
+                wait = await self.backend.acquire(key, limit)
+            except Exception as e:
+                self.backend_errors += 1
+                logger.error(f"Rate limit backend error: {str(e)}")
+                if self.fail_open:
+                    continue
+                return 1.0
+            if wait > 0:
+                self.limited += 1
+                return wait
+
+        self.allowed += 1
+        return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "backend_errors": self.backend_errors,
+        }
+        if isinstance(self.backend, MemoryRateLimitBackend):
+            stats["buckets"] = len(self.backend)
+            stats["evictions"] = self.backend.evictions
+        return stats
+
+
+def retry_after_header(wait: float) -> str:
+    """Whole seconds for a Retry-After header, never less than one"""
+    return str(max(1, math.ceil(wait)))
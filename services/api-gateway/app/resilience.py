@@ -0,0 +1,271 @@
+"""
+Failure isolation for the API Gateway.
+
+* CircuitBreaker - one per backend service. Tracks the outcome and latency
+  of the most recent calls and opens when too many fail or are slow. While
+  open, requests are rejected immediately instead of waiting on a backend
+  that is down. After a cool-down a few trial calls are let through
+  (half-open); if they succeed the breaker closes again.
+* RetryBudget   - caps retries to a fraction of recent requests so a failing
+  backend is not hit by a retry storm.
+"""
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Tuple
+
+from app.routing import RetryPolicy
+
+logger = logging.getLogger("api-gateway")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the service's circuit is open"""
+
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(f"Circuit for {service} is open")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Count-based sliding window circuit breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 20,
+        min_calls: int = 10,
+        failure_rate_threshold: float = 0.5,
+        slow_call_duration: float = 10.0,
+        slow_call_rate_threshold: float = 0.8,
+        open_duration: float = 30.0,
+        half_open_calls: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the breaker.
+
+        Args:
+            name: Service name, used in logs
+            window_size: Number of recent calls considered
+            min_calls: Calls needed in the window before the breaker can open
+            failure_rate_threshold: Fraction of failed calls that opens the breaker
+            slow_call_duration: Calls taking at least this many seconds count as slow
+            slow_call_rate_threshold: Fraction of slow calls that opens the breaker
+            open_duration: Seconds to reject calls before trying again
+            half_open_calls: Trial calls allowed, and required to succeed, while half-open
+            clock: Monotonic clock
+        """
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_duration = open_duration
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+
+        self._state = STATE_CLOSED
+        self._window: Deque[Tuple[bool, bool]] = deque()
+        self._failures = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._trial_calls = 0
+        self._trial_successes = 0
+
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == STATE_OPEN and self._clock() - self._opened_at >= self.open_duration:
+            self._state = STATE_HALF_OPEN
+            self._trial_calls = 0
+            self._trial_successes = 0
+        return self._state
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets trial calls through"""
+        return max(0.0, self.open_duration - (self._clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        """
+        Whether a call may be made now. Must be followed by `record` or `release`.
+        """
+        state = self.state
+        if state == STATE_CLOSED:
+            return True
+        if state == STATE_HALF_OPEN and self._trial_calls < self.half_open_calls:
+            self._trial_calls += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def check(self) -> None:
+        """
+        Raise CircuitOpenError unless a call may be made now.
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after)
+
+    def release(self) -> None:
+        """
+        Give back a call allowed by `allow` that finished without an outcome (e.g. it was cancelled).
+        """
+        if self._state == STATE_HALF_OPEN and self._trial_calls > 0:
+            self._trial_calls -= 1
+
+    def record(self, success: bool, duration: float) -> None:
+        """
+        Record the outcome of a call.
+
+        Args:
+            success: False for transport errors, timeouts and 5xx responses
+            duration: Call duration in seconds
+        """
+        slow = duration >= self.slow_call_duration
+        state = self.state
+
+        if state == STATE_HALF_OPEN:
+            if not success or slow:
+                self._open()
+                return
+            self._trial_successes += 1
+            if self._trial_successes >= self.half_open_calls:
+                logger.info(f"Circuit for {self.name} closed")
+                self._reset()
+            return
+        if state == STATE_OPEN:
+            # Call started before the breaker opened
+            return
+
+        self._window.append((not success, slow))
+        self._failures += not success
+        self._slow += slow
+        if len(self._window) > self.window_size:
+            failed, was_slow = self._window.popleft()
+            self._failures -= failed
+            self._slow -= was_slow
+
+        calls = len(self._window)
+        if calls >= self.min_calls and (
+            self._failures / calls >= self.failure_rate_threshold
+            or self._slow / calls >= self.slow_call_rate_threshold
+        ):
+            self._open()
+
+    def _open(self) -> None:
+        logger.warning(f"Circuit for {self.name} opened")
+        self._state = STATE_OPEN
+        self._opened_at = self._clock()
+        self.trips += 1
+        self._window.clear()
+        self._failures = 0
+        self._slow = 0
+
+    def _reset(self) -> None:
+        self._state = STATE_CLOSED
+        self._window.clear()
+        self._failures = 0
+        self._slow = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state for monitoring"""
+        calls = len(self._window)
+        return {
+            "state": self.state,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "failure_rate": round(self._failures / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(self._slow / calls, 3) if calls else 0.0,
+        }
+
+
+class RetryBudget:
+    """
+    Allows retries up to `ratio` of the requests seen in the last `window`
+    seconds, plus a small floor so low-traffic services can still retry.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_retries_per_second: float = 1.0,
+        window: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the budget.
+
+        Args:
+            ratio: Retries allowed per request
+            min_retries_per_second: Retries always allowed regardless of traffic
+            window: Window length in seconds
+            clock: Monotonic clock
+        """
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.window = window
+        self._clock = clock
+
+        # One [second, requests, retries] bucket per second of the window
+        self._buckets = [[-1, 0, 0] for _ in range(window)]
+
+        self.retries = 0
+        self.exhausted = 0
+
+    def _bucket(self) -> list:
+        second = int(self._clock())
+        bucket = self._buckets[second % self.window]
+        if bucket[0] != second:
+            bucket[0], bucket[1], bucket[2] = second, 0, 0
+        return bucket
+
+    def _totals(self) -> Tuple[int, int]:
+        oldest = int(self._clock()) - self.window
+        requests = retries = 0
+        for second, bucket_requests, bucket_retries in self._buckets:
+            if second > oldest:
+                requests += bucket_requests
+                retries += bucket_retries
+        return requests, retries
+
+    def record_request(self) -> None:
+        """Count an original (non-retry) request"""
+        self._bucket()[1] += 1
+
+    def try_retry(self) -> bool:
+        """
+        Take a retry from the budget.
+
+        Returns:
+            True if the retry may be made
+        """
+        requests, retries = self._totals()
+        allowed = self.min_retries_per_second * self.window + self.ratio * requests
+        if retries >= allowed:
+            self.exhausted += 1
+            return False
+        self._bucket()[2] += 1
+        self.retries += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"retries": self.retries, "exhausted": self.exhausted}
+
+
+def backoff_delay(policy: RetryPolicy, attempt: int, rand: Callable[[], float] = random.random) -> float:
+    """
+    Full-jitter exponential backoff before the given retry attempt (1-based).
+    """
+    return rand() * min(policy.max_backoff, policy.backoff * (2 ** (attempt - 1)))
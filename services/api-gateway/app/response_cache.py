@@ -0,0 +1,286 @@
+"""
+Response cache for the API Gateway.
+
+Successful GET responses on routes with a `cache_ttl` are cached per user,
+path and query string. Every cached response gets an ETag so clients can
+revalidate with `If-None-Match` and receive a 304. Once an entry is older
+than its ttl it may still be served for `stale_while_revalidate` seconds
+while a single background request refreshes it.
+
+Writes through the gateway invalidate cached paths related to the written
+path on segment boundaries: a POST to `/files/projects/p1` clears
+`/files/projects/p1` and anything below it, as well as its ancestors.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+from urllib.parse import urlencode
+
+from app.proxy import BufferedResponse
+
+logger = logging.getLogger("api-gateway")
+
+CACHE_HIT = "HIT"
+CACHE_STALE = "STALE"
+CACHE_MISS = "MISS"
+
+# (user id, path, normalised query string, variant)
+CacheKey = Tuple[str, str, str, str]
+
+
+def cache_key(
+    user_id: Optional[str],
+    path: str,
+    params: Iterable[Tuple[str, str]],
+    variant: str = "",
+) -> CacheKey:
+    """
+    Build a cache key, ignoring the order of query parameters.
+
+    `variant` holds request headers the upstream response may vary on
+    (Accept-Encoding), so differently encoded upstream bodies are never mixed up.
+    """
+    return (user_id or "", normalize_path(path), urlencode(sorted(params)), variant.replace(" ", "").lower())
+
+
+def normalize_path(path: str) -> str:
+    """Strip trailing slashes so `/a/` and `/a` share entries"""
+    return path.rstrip("/") or "/"
+
+
+def paths_related(a: str, b: str) -> bool:
+    """Whether one path equals or contains the other on a segment boundary"""
+    if a == b:
+        return True
+    shorter, longer = (a, b) if len(a) < len(b) else (b, a)
+    return shorter == "/" or longer.startswith(shorter + "/")
+
+
+def compute_etag(content: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evaluate an If-None-Match header against an ETag (weak comparison).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+@dataclass
+class CachedResponse:
+    """A cached upstream response"""
+    response: BufferedResponse
+    etag: str
+    fresh_until: float
+    stale_until: float
+
+
+class ResponseCache:
+    """
+    LRU cache of buffered upstream responses.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        max_body_size: int = 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of cached responses
+            max_body_size: Larger responses are not cached
+            clock: Monotonic clock
+        """
+        self.max_entries = max_entries
+        self.max_body_size = max_body_size
+        self._clock = clock
+
+        self._entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self._refreshing: Set[CacheKey] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        # Bumped on every invalidation so responses fetched before a write are not stored
+        self._generation = 0
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def cacheable(self, response: BufferedResponse) -> bool:
+        """Whether an upstream response may be stored"""
+        if response.status_code != 200 or len(response.content) > self.max_body_size:
+            return False
+        if response.header("set-cookie") is not None:
+            return False
+        cache_control = (response.header("cache-control") or "").lower()
+        return "no-store" not in cache_control
+
+    def lookup(self, key: CacheKey) -> Optional[CachedResponse]:
+        """Get an entry that is fresh or still within its stale window"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._clock() >= entry.stale_until:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def store(
+        self,
+        key: CacheKey,
+        response: BufferedResponse,
+        ttl: float,
+        stale_while_revalidate: float = 0.0,
+        generation: Optional[int] = None,
+    ) -> Optional[CachedResponse]:
+        """
+        Store a response, adding an ETag if the upstream did not send one.
+
+        Args:
+            key: Cache key
+            response: The upstream response
+            ttl: Seconds the response is fresh
+            stale_while_revalidate: Seconds a stale response may still be served
+            generation: Invalidation generation observed before fetching the response
+
+        Returns:
+            The cached entry, or None if the response was not stored
+        """
+        if not self.cacheable(response):
+            return None
+        if generation is not None and generation != self._generation:
+            # A write happened while the response was being fetched
+            return None
+
+        etag = response.header("etag")
+        if etag is None:
+            etag = compute_etag(response.content)
+            response = BufferedResponse(response.status_code, response.headers + [("ETag", etag)], response.content)
+
+        now = self._clock()
+        entry = CachedResponse(response, etag, now + ttl, now + ttl + stale_while_revalidate)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def get_or_fetch(
+        self,
+        key: CacheKey,
+        fetch: Callable[[], Awaitable[BufferedResponse]],
+        ttl: float,
+        stale_while_revalidate: float = 0.0,
+        refresh: bool = False,
+    ) -> Tuple[BufferedResponse, str]:
+        """
+        Serve a response from the cache, fetching it on a miss.
+
+        Args:
+            key: Cache key
+            fetch: Coroutine function fetching the response from upstream
+            ttl: Seconds a response is fresh
+            stale_while_revalidate: Seconds a stale response may be served while it is refreshed
+            refresh: Skip the cached entry and fetch a new response
+
+        Returns:
+            Tuple of (response, cache status)
+        """
+        entry = None if refresh else self.lookup(key)
+        if entry is not None:
+            if self._clock() < entry.fresh_until:
+                self.hits += 1
+                return entry.response, CACHE_HIT
+            self.stale_hits += 1
+            self._revalidate(key, fetch, ttl, stale_while_revalidate)
+            return entry.response, CACHE_STALE
+
+        self.misses += 1
+        generation = self._generation
+        response = await fetch()
+        entry = self.store(key, response, ttl, stale_while_revalidate, generation)
+        return (entry.response if entry else response), CACHE_MISS
+
+    def _revalidate(
+        self,
+        key: CacheKey,
+        fetch: Callable[[], Awaitable[BufferedResponse]],
+        ttl: float,
+        stale_while_revalidate: float,
+    ) -> None:
+        """Refresh an entry in the background, once per key"""
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            generation = self._generation
+            try:
+                response = await fetch()
+                if self.store(key, response, ttl, stale_while_revalidate, generation) is None:
+                    self._entries.pop(key, None)
+            except Exception as e:
+                logger.warning(f"Background revalidation of {key[1]} failed: {str(e)}")
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def invalidate(self, path: str) -> int:
+        """
+        Drop every entry whose path equals, contains or is contained by `path`.
+
+        Returns:
+            Number of entries removed
+        """
+        path = normalize_path(path)
+        self._generation += 1
+        stale = [key for key in self._entries if paths_related(key[1], path)]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    async def aclose(self) -> None:
+        """Cancel background revalidations"""
+        for task in list(self._tasks):
+            task.cancel()
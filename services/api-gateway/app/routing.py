@@ -0,0 +1,294 @@
+"""
+Path routing for the API Gateway.
+
+Routes are compiled once into a trie keyed by path segment. A lookup walks
+the request path segment by segment and returns the longest matching
+prefix, so `/files/projects` wins over `/files` and `/users` never matches
+`/usersettings`.
+
+A `{name}` segment matches any single segment, so `/chats/{id}/messages`
+matches `/chats/c1/messages`. Literal segments win over parameters at the
+same depth.
+"""
+import json
+import logging
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.concurrency import PRIORITIES
+from app.proxy import PROXY_MODES
+
+logger = logging.getLogger("api-gateway")
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Retry settings for idempotent requests"""
+    max_retries: int = 0
+    backoff: float = 0.05
+    max_backoff: float = 1.0
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    """Hedging settings for GET requests"""
+    # Latency percentile of the route after which a second attempt is sent
+    percentile: float = 95.0
+    # Bounds in seconds on the wait before hedging
+    min_delay: float = 0.01
+    max_delay: Optional[float] = None
+    # Latencies needed before the route is hedged at all
+    min_samples: int = 20
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Token bucket settings: `rate` tokens per second, up to `burst` tokens"""
+    rate: float
+    burst: int
+
+
+@dataclass(frozen=True)
+class Route:
+    """A gateway route and its per-route settings"""
+    prefix: str
+    service: str
+    # Upstream timeout in seconds (None uses the client default)
+    timeout: Optional[float] = None
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    # Response cache lifetime in seconds (0 disables caching)
+    cache_ttl: float = 0.0
+    # Seconds a stale cached response may be served while it is refreshed
+    stale_while_revalidate: float = 0.0
+    # "buffered" or "streaming" (None uses GATEWAY_PROXY_MODE)
+    mode: Optional[str] = None
+    # Per-user limit on this route, on top of the overall per-user limit
+    rate_limit: Optional[RateLimit] = None
+    # Prefix whose bucket the rate limit draws from (None uses this route's prefix),
+    # so nested routes share the limit they inherit
+    rate_limit_scope: Optional[str] = None
+    # Concurrency priority class of non-read requests (None uses "write")
+    priority: Optional[str] = None
+    # Hedging of GET requests (None disables it)
+    hedge: Optional[HedgePolicy] = None
+
+
+class _Node:
+    __slots__ = ("children", "param", "route")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # Child for a `{name}` segment, matching any segment
+        self.param: Optional["_Node"] = None
+        self.route: Optional[Route] = None
+
+
+def split_path(path: str) -> List[str]:
+    """Split a path into its non-empty segments"""
+    return [segment for segment in path.split("/") if segment]
+
+
+def is_param_segment(segment: str) -> bool:
+    return len(segment) > 2 and segment[0] == "{" and segment[-1] == "}"
+
+
+class PrefixRouter:
+    """
+    Longest-prefix router matching on segment boundaries.
+    """
+
+    def __init__(self, routes: Iterable[Route]):
+        """
+        Compile the routes into a trie.
+
+        Args:
+            routes: Routes to register. Later routes replace earlier ones with the same prefix.
+        """
+        self._root = _Node()
+        self.routes: List[Route] = []
+        # Without parameter segments a lookup never has to backtrack
+        self._has_params = False
+        for route in routes:
+            self.add(route)
+
+    def add(self, route: Route) -> None:
+        """Register a route"""
+        node = self._root
+        for segment in split_path(route.prefix):
+            if is_param_segment(segment):
+                if node.param is None:
+                    node.param = _Node()
+                    self._has_params = True
+                node = node.param
+            else:
+                node = node.children.setdefault(segment, _Node())
+        if node.route is not None:
+            self.routes.remove(node.route)
+        node.route = route
+        self.routes.append(route)
+
+    def match(self, path: str) -> Optional[Route]:
+        """
+        Find the route with the longest prefix matching the path.
+
+        Args:
+            path: Request path relative to the API prefix
+
+        Returns:
+            The matching route, or None
+        """
+        if self._has_params:
+            return self._match(self._root, split_path(path), 0)[1]
+
+        node = self._root
+        best = node.route
+        for segment in path.split("/"):
+            if not segment:
+                continue
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.route is not None:
+                best = node.route
+        return best
+
+    def _match(self, node: _Node, segments: List[str], depth: int) -> Tuple[int, Optional[Route]]:
+        """Deepest route below `node`, as (depth, route); depth is -1 without one"""
+        best = (depth, node.route) if node.route is not None else (-1, None)
+        if depth < len(segments):
+            for child in (node.children.get(segments[depth]), node.param):
+                if child is not None:
+                    found = self._match(child, segments, depth + 1)
+                    # Strictly deeper, so a literal segment wins a tie with a parameter
+                    if found[0] > best[0]:
+                        best = found
+        return best
+
+
+def route_from_config(config: Dict[str, Any], defaults: Optional[Route] = None) -> Route:
+    """
+    Build a route from a configuration dictionary.
+
+    Args:
+        config: Route settings (prefix, service, timeout, retry, cache_ttl,
+            stale_while_revalidate, mode, rate_limit, priority, hedge). `hedge`
+            may be true for the default hedge policy.
+        defaults: Route whose settings are used for keys missing from config
+
+    Returns:
+        The route
+
+    Raises:
+        ValueError: If required keys are missing, the mode or priority is unknown
+            or the rate limit's rate or burst is not positive
+    """
+    settings = dict(config)
+    if "retry" in settings and isinstance(settings["retry"], dict):
+        settings["retry"] = RetryPolicy(**settings["retry"])
+    if settings.get("hedge") is True:
+        settings["hedge"] = HedgePolicy()
+    elif isinstance(settings.get("hedge"), dict):
+        settings["hedge"] = HedgePolicy(**settings["hedge"])
+    elif settings.get("hedge") is False:
+        settings["hedge"] = None
+    if isinstance(settings.get("rate_limit"), dict):
+        settings["rate_limit"] = RateLimit(**settings["rate_limit"])
+    limit = settings.get("rate_limit")
+    if limit is not None and (limit.rate <= 0 or limit.burst <= 0):
+        raise ValueError(f"Rate limit rate and burst must be positive for route {settings.get('prefix')}")
+    if settings.get("mode") is not None and settings["mode"] not in PROXY_MODES:
+        raise ValueError(f"Unknown proxy mode {settings['mode']} for route {settings.get('prefix')}")
+    if settings.get("priority") is not None and settings["priority"] not in PRIORITIES:
+        raise ValueError(f"Unknown priority {settings['priority']} for route {settings.get('prefix')}")
+
+    if defaults is not None:
+        return replace(defaults, **settings)
+    if "prefix" not in settings or "service" not in settings:
+        raise ValueError("Routes need a prefix and a service")
+    return Route(**settings)
+
+
+def build_routes(
+    path_to_service: Dict[str, str],
+    route_settings: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[Route]:
+    """
+    Build routes from a prefix to service mapping plus per-route settings.
+
+    Args:
+        path_to_service: Mapping of path prefix to service name
+        route_settings: Optional settings keyed by prefix. Prefixes not in
+            path_to_service inherit every setting they do not give, service
+            included, from the longest enclosing prefix. An inherited rate
+            limit shares the enclosing route's bucket.
+
+    Returns:
+        List of routes
+
+    Raises:
+        ValueError: If a prefix has no service and no enclosing prefix
+    """
+    route_settings = route_settings or {}
+    routes = []
+    for prefix, service in path_to_service.items():
+        base = Route(prefix=prefix, service=service)
+        routes.append(route_from_config(route_settings.get(prefix, {}), defaults=base))
+
+    # Shallow prefixes first, so nested ones inherit from routes that are complete
+    router = PrefixRouter(routes)
+    nested = sorted((prefix for prefix in route_settings if prefix not in path_to_service), key=lambda p: len(split_path(p)))
+    for prefix in nested:
+        settings = {"prefix": prefix, **route_settings[prefix]}
+        enclosing = router.match(prefix)
+        if enclosing is None:
+            route = route_from_config(settings)
+        else:
+            if "rate_limit" not in settings and enclosing.rate_limit is not None:
+                settings["rate_limit_scope"] = enclosing.rate_limit_scope or enclosing.prefix
+            route = route_from_config(settings, defaults=replace(enclosing, prefix=prefix, rate_limit_scope=None))
+        router.add(route)
+        routes.append(route)
+    return routes
+
+
+def merge_route_settings(
+    base: Dict[str, Dict[str, Any]],
+    overrides: Dict[str, Dict[str, Any]],
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Merge per-route settings field by field.
+
+    Args:
+        base: Settings keyed by prefix
+        overrides: Settings whose fields replace those of the same prefix in base
+
+    Returns:
+        The merged settings
+    """
+    merged = {prefix: dict(settings) for prefix, settings in base.items()}
+    for prefix, settings in overrides.items():
+        merged.setdefault(prefix, {}).update(settings)
+    return merged
+
+
+def load_route_settings(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Load per-route settings from a JSON file.
+
+    The file maps path prefixes to settings, for example
+    {"/agent": {"timeout": 120, "mode": "streaming"}}
+
+    Args:
+        path: Path to the JSON file
+
+    Returns:
+        Settings keyed by prefix (empty if the file cannot be read)
+    """
+    try:
+        with open(path, "r") as f:
+            settings = json.load(f)
+        logger.info(f"Loaded route settings from {path}")
+        return settings
+    except Exception as e:
+        logger.error(f"Error loading route settings from {path}: {str(e)}")
+        return {}
@@ -0,0 +1,88 @@
+"""
+Request coalescing for the API Gateway.
+
+Identical GETs that arrive while one is already in flight wait for that
+upstream call and share its response instead of each hitting the backend.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Shares one in-flight call between concurrent callers with the same key.
+
+    The call runs in its own task, so a caller that disconnects does not
+    cancel it for the others. It is only cancelled when every caller is gone,
+    and it is forgotten at once, so a new caller starts a new call instead of
+    joining one that is being cancelled.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `fn`, or wait for the call already in flight for `key`.
+
+        Args:
+            key: Identifies equivalent calls
+            fn: Coroutine function making the call
+
+        Returns:
+            The result of the shared call
+
+        Raises:
+            Whatever the shared call raises
+        """
+        call = self._calls.get(key)
+        if call is None:
+            self.calls += 1
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.collapsed += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # Mark the exception as retrieved when nobody was waiting any more
+            call.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Coalescing counters for monitoring"""
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "in_flight": self.in_flight,
+        }
@@ -0,0 +1,180 @@
+"""
+Verified token cache for the API Gateway.
+
+Caches the result of a successful ID token verification so repeat requests
+with the same token skip the round trip to Firebase. Entries never outlive
+the token's own `exp` claim.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# verify(token, check_revoked) -> user data
+Verifier = Callable[[str, bool], Awaitable[Dict[str, Any]]]
+
+
+def hash_token(token: str) -> str:
+    """Hash a token so raw credentials are never kept as cache keys"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Entry:
+    """A cached verification result"""
+    user_data: Dict[str, Any]
+    expires_at: float
+    checked_at: float
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified tokens.
+
+    - Entries expire after `ttl` seconds or at the token's `exp`, whichever is first
+    - Concurrent misses for the same token share a single verification. It runs
+      in its own task, so a request that is cancelled (a client disconnect, a
+      deadline) does not cancel it for the requests waiting on it
+    - If `revocation_check_interval` is set, entries older than the interval are
+      re-verified with a revocation check instead of being served from cache
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 300.0,
+        revocation_check_interval: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size: Maximum number of cached tokens (0 disables caching)
+            ttl: Maximum lifetime of an entry in seconds
+            revocation_check_interval: Seconds between revocation checks (0 disables)
+            clock: Monotonic clock used for entry lifetimes
+            wall_clock: Wall clock used to interpret the `exp` claim
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.revocation_check_interval = revocation_check_interval
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._pending: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.evictions = 0
+        self.revocation_checks = 0
+
+    def _lookup(self, key: str, now: float) -> Optional[_Entry]:
+        """Get a live entry and mark it as recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, user_data: Dict[str, Any], now: float) -> None:
+        """Cache a verification result, bounded by ttl and the token's exp"""
+        lifetime = self.ttl
+        exp = (user_data.get("token") or {}).get("exp")
+        if isinstance(exp, (int, float)):
+            lifetime = min(lifetime, exp - self._wall_clock())
+        if lifetime <= 0:
+            return
+
+        self._entries[key] = _Entry(user_data=user_data, expires_at=now + lifetime, checked_at=now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_verify(self, token: str, verify: Verifier) -> Dict[str, Any]:
+        """
+        Get the cached user for a token, verifying it on a miss.
+
+        Args:
+            token: The raw ID token
+            verify: Coroutine function performing the real verification
+
+        Returns:
+            The verified user data
+
+        Raises:
+            Whatever `verify` raises. Failures are never cached.
+        """
+        if self.max_size <= 0:
+            return await verify(token, False)
+
+        key = hash_token(token)
+        now = self._clock()
+        entry = self._lookup(key, now)
+        check_revoked = False
+
+        if entry is not None:
+            if not self.revocation_check_interval or now - entry.checked_at < self.revocation_check_interval:
+                self.hits += 1
+                return entry.user_data
+            check_revoked = True
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.collapsed += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        if check_revoked:
+            self.revocation_checks += 1
+
+        task = asyncio.ensure_future(self._verify(key, token, verify, check_revoked))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._finished(key, task))
+        return await asyncio.shield(task)
+
+    async def _verify(self, key: str, token: str, verify: Verifier, check_revoked: bool) -> Dict[str, Any]:
+        """Run a verification shared by every request for the token, caching its result"""
+        try:
+            user_data = await verify(token, check_revoked)
+        except Exception:
+            if check_revoked:
+                self._entries.pop(key, None)
+            raise
+        self._store(key, user_data, self._clock())
+        return user_data
+
+    def _finished(self, key: str, task: "asyncio.Task[Dict[str, Any]]") -> None:
+        if self._pending.get(key) is task:
+            del self._pending[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when no request was waiting any more
+            task.exception()
+
+    def invalidate(self, token: str) -> None:
+        """Drop a token from the cache"""
+        self._entries.pop(hash_token(token), None)
+
+    def clear(self) -> None:
+        """Drop every cached token"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters for monitoring"""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "evictions": self.evictions,
+            "revocation_checks": self.revocation_checks,
+        }
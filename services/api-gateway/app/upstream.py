@@ -0,0 +1,117 @@
+"""
+Upstream HTTP clients for the API Gateway.
+
+Keeps one long-lived httpx.AsyncClient per backend service so proxied
+requests reuse pooled keep-alive connections instead of paying a new
+TCP/TLS handshake on every call.
+"""
+import logging
+import os
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger("api-gateway")
+
+# Pool configuration
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30.0"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "5.0"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() == "true"
+
+
+def _http2_available() -> bool:
+    """Check whether the optional h2 package needed for HTTP/2 is installed"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class UpstreamClients:
+    """
+    Registry of pooled HTTP clients, one per backend service.
+
+    Clients are created lazily on first use and live for the lifetime of
+    the application. Call `aclose()` on shutdown to release connections.
+    """
+
+    def __init__(
+        self,
+        endpoints: Dict[str, str],
+        max_connections: int = UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections: int = UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = UPSTREAM_KEEPALIVE_EXPIRY,
+        timeout: float = UPSTREAM_TIMEOUT,
+        http2: bool = UPSTREAM_HTTP2,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            endpoints: Mapping of service name to base URL
+            max_connections: Maximum concurrent connections per service
+            max_keepalive_connections: Maximum idle connections kept per service
+            keepalive_expiry: Seconds an idle connection is kept open
+            timeout: Default request timeout in seconds
+            http2: Enable HTTP/2 if the h2 package is installed
+            transport: Optional transport override (used by tests and benchmarks)
+        """
+        self.endpoints = endpoints
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.transport = transport
+
+        if http2 and not _http2_available():
+            logger.warning("UPSTREAM_HTTP2 is enabled but the h2 package is not installed. Falling back to HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _create_client(self) -> httpx.AsyncClient:
+        """Create a new pooled client with the registry settings"""
+        return httpx.AsyncClient(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            transport=self.transport,
+        )
+
+    def get(self, service: str) -> httpx.AsyncClient:
+        """
+        Get the pooled client for a service.
+
+        Args:
+            service: The service name
+
+        Returns:
+            The service's long-lived client
+
+        Raises:
+            KeyError: If the service is not a configured endpoint
+        """
+        client = self._clients.get(service)
+        if client is None:
+            if service not in self.endpoints:
+                raise KeyError(service)
+            client = self._create_client()
+            self._clients[service] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close every client and release pooled connections"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Error closing upstream client: {str(e)}")
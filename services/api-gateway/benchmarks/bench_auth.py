@@ -0,0 +1,89 @@
+"""
+Benchmark of the gateway authentication middleware.
+
+Serves a trivial authenticated endpoint in-process, once behind the previous
+BaseHTTPMiddleware implementation and once behind the ASGI AuthMiddleware,
+and reports requests per second. Run from the api-gateway directory:
+
+    python -m benchmarks.bench_auth
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.middleware import AuthMiddleware
+
+USER = {"uid": "bench-user", "email": "bench@example.com"}
+
+
+async def verify_token(token: str):
+    return USER
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware implementation this benchmark compares against"""
+
+    async def dispatch(self, request, call_next):
+        if request.method == "OPTIONS" or request.url.path == "/api/health":
+            return await call_next(request)
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            raise HTTPException(status_code=401, detail="Missing or invalid token")
+        request.state.user = await verify_token(auth_header.split("Bearer ")[1])
+        return await call_next(request)
+
+
+def make_app(legacy: bool) -> FastAPI:
+    app = FastAPI()
+    if legacy:
+        app.add_middleware(LegacyAuthMiddleware)
+    else:
+        app.add_middleware(AuthMiddleware, verify=verify_token, public_paths={"/api/health"})
+
+    @app.get("/api/users/{user_id}")
+    async def get_user(user_id: str, request: Request):
+        return {"id": user_id, "uid": request.state.user["uid"]}
+
+    return app
+
+
+async def measure(app: FastAPI, requests: int, concurrency: int) -> float:
+    """Send `requests` requests with `concurrency` workers and return requests per second"""
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Authorization": "Bearer token"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+        remaining = iter(range(requests))
+
+        async def worker():
+            for i in remaining:
+                response = await client.get(f"/api/users/{i}", headers=headers)
+                assert response.status_code == 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return requests / (time.perf_counter() - started)
+
+
+async def run(requests: int, concurrency: int, rounds: int) -> None:
+    for name, legacy in (("BaseHTTPMiddleware", True), ("ASGI AuthMiddleware", False)):
+        app = make_app(legacy)
+        await measure(app, 200, concurrency)
+        best = max([await measure(app, requests, concurrency) for _ in range(rounds)])
+        print(f"{name:>20}: {best:8.0f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the gateway auth middleware")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Cold-start benchmark of the GrantCraft services.
+
+Starts each service in fresh Python processes, the way a new Cloud Run
+instance does, and reports:
+
+* import  - time to import the application module
+* startup - time to run the startup events (background warm-up included
+            only in "blocking" mode)
+* first   - time to answer the first request
+
+It also profiles the imports of one run with `python -X importtime` and
+shows where import time goes by top-level package. Google credentials are
+not needed. Run from the api-gateway directory:
+
+    python -m benchmarks.bench_cold_start
+    python -m benchmarks.bench_cold_start --service chat-service --runs 10 --top 15
+    python -m benchmarks.bench_cold_start --warm-up-mode blocking --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+SERVICES_DIR = Path(__file__).resolve().parents[2]
+
+# Service directory and a cheap path that is answered without authentication
+SERVICES = {
+    "api-gateway": "/api/health",
+    "user-service": "/health",
+    "chat-service": "/health",
+    "file-service": "/health",
+    "agent-service": "/api/agent/health",
+}
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main as service
+imported = time.perf_counter()
+from starlette.testclient import TestClient
+with TestClient(service.app) as client:
+    ready = time.perf_counter()
+    status = client.get(sys.argv[1]).status_code
+    answered = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "startup": ready - imported,
+    "first": answered - ready,
+    "status": status,
+}))
+"""
+
+
+def probe_env(warm_up_mode: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "FIREBASE_DISABLED": "true",
+        "TRACE_EXPORTER": "none",
+        "LOG_LEVEL": "WARNING",
+        "WARM_UP_MODE": warm_up_mode,
+    })
+    return env
+
+
+def run_probe(service: str, warm_up_mode: str, importtime: bool = False) -> Tuple[Dict[str, Any], str]:
+    """
+    Start the service in a new interpreter and time its cold start.
+
+    Returns:
+        Tuple of (timings, stderr)
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", PROBE, SERVICES[service]]
+    result = subprocess.run(
+        command,
+        cwd=SERVICES_DIR / service,
+        env=probe_env(warm_up_mode),
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{service} failed to start:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def import_profile(stderr: str) -> List[Tuple[str, float]]:
+    """
+    Import time by top-level package from `-X importtime` output.
+
+    Self times are summed per package, so the totals add up to the whole
+    import time without double counting nested imports.
+
+    Returns:
+        (package, seconds) pairs, slowest first
+    """
+    totals: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        package = parts[2].strip().split(".")[0]
+        totals[package] += int(parts[0]) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def measure(service: str, runs: int, warm_up_mode: str, top: int) -> Dict[str, Any]:
+    samples = [run_probe(service, warm_up_mode)[0] for _ in range(runs)]
+    _, stderr = run_probe(service, warm_up_mode, importtime=True)
+    report = {"service": service, "status": samples[-1]["status"]}
+    for phase in ("import", "startup", "first"):
+        values = [sample[phase] for sample in samples]
+        report[f"{phase}_ms"] = round(statistics.median(values) * 1000, 1)
+    report["total_ms"] = round(report["import_ms"] + report["startup_ms"] + report["first_ms"], 1)
+    report["imports"] = [
+        {"package": package, "ms": round(seconds * 1000, 1)}
+        for package, seconds in import_profile(stderr)[:top]
+    ]
+    return report
+
+
+def print_report(reports: List[Dict[str, Any]]) -> None:
+    print(f"{'service':<15} {'import ms':>10} {'startup ms':>11} {'first ms':>9} {'total ms':>9} {'status':>7}")
+    for report in reports:
+        print(
+            f"{report['service']:<15} {report['import_ms']:>10.1f} {report['startup_ms']:>11.1f} "
+            f"{report['first_ms']:>9.1f} {report['total_ms']:>9.1f} {report['status']:>7}"
+        )
+    for report in reports:
+        print(f"\nSlowest imports of {report['service']} (self time by package):")
+        for entry in report["imports"]:
+            print(f"  {entry['package']:<30} {entry['ms']:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of the services")
+    parser.add_argument("--service", action="append", choices=sorted(SERVICES), help="Service to measure (default all)")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per service; the median is reported")
+    parser.add_argument("--warm-up-mode", default="background", choices=["background", "blocking", "off"])
+    parser.add_argument("--top", type=int, default=10, help="Packages shown in the import profile")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    reports = [measure(service, args.runs, args.warm_up_mode, args.top) for service in args.service or SERVICES]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print_report(reports)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Load test of the whole API Gateway against local stub backends.
+
+The real gateway `app` is driven in-process by an async load generator.
+Upstream calls go to ASGI stub services that stand in for the user, chat,
+file and agent services, with configurable latency and payload size, so
+nothing touches the network and the suite can run in CI. Token
+verification is replaced by a fake verifier that accepts any token, so the
+token cache and auth middleware still run but Firebase is never called.
+
+Each scenario is measured twice: through the gateway, and directly against
+the stub it is routed to. The difference between the two is the gateway's
+overhead. Run from the api-gateway directory:
+
+    python -m benchmarks.bench_gateway
+    python -m benchmarks.bench_gateway --latency 0.02 --payload-size 65536 --concurrency 100
+    python -m benchmarks.bench_gateway --service-latency agent-service=0.5 --json
+
+Rate limiting and concurrency limits are off by default: every request
+comes from the same bench user, and shed requests would not measure the
+proxy path. Pass --rate-limit and --concurrency-limit to include them.
+--tracemalloc adds the peak Python heap to the report, at a large cost in
+throughput.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+# Must be set before the gateway is imported, tracing reads it on import
+os.environ.setdefault("TRACE_EXPORTER", "none")
+
+from app import auth as gateway_auth  # noqa: E402
+from app import main as gateway  # noqa: E402
+from app.balancer import parse_upstreams  # noqa: E402
+from app.lazy import Lazy  # noqa: E402
+from app.upstream import UpstreamClients  # noqa: E402
+
+AUTH_HEADERS = {"Authorization": "Bearer bench-token"}
+
+BENCH_USER = {
+    "uid": "bench-user",
+    "email": "bench@example.com",
+    "email_verified": True,
+    "display_name": "Bench User",
+    "photo_url": None,
+    "token": {"bench": True},
+}
+
+# (method, gateway path, JSON body)
+DEFAULT_SCENARIOS: List[Tuple[str, str, Optional[Dict[str, Any]]]] = [
+    ("GET", "/api/users/me", None),
+    ("GET", "/api/chats/c1/messages?limit=20", None),
+    ("GET", "/api/files/projects/p1", None),
+    ("POST", "/api/agent/process", {"message": "Summarise the project", "project_id": "p1"}),
+]
+
+
+def make_stub_service(name: str, latency: float = 0.0, payload_size: int = 1024):
+    """
+    Build an ASGI app answering every request with a JSON body of about
+    `payload_size` bytes after `latency` seconds.
+    """
+    body = json.dumps({"service": name, "data": "x" * payload_size}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message.get("more_body", False)
+        if latency:
+            await asyncio.sleep(latency)
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+class StubBackends:
+    """ASGI app dispatching each request to the stub service its host belongs to"""
+
+    def __init__(self, services: Dict[str, Any], endpoints: Dict[str, str]):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            services: Mapping of service name to stub ASGI app
+            endpoints: Mapping of service name to its comma-separated upstream URLs
+        """
+        self.services = services
+        self.hosts = {
+            urlsplit(url).netloc: name
+            for name, value in endpoints.items()
+            for url in parse_upstreams(value)
+            if name in services
+        }
+
+    async def __call__(self, scope, receive, send):
+        host = dict(scope.get("headers") or []).get(b"host", b"").decode()
+        app = self.services.get(self.hosts.get(host, ""))
+        if app is None:
+            await send({"type": "http.response.start", "status": 502, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await app(scope, receive, send)
+
+
+@dataclass
+class Result:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[int, int] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def errors(self) -> int:
+        return sum(count for status, count in self.statuses.items() if status >= 400)
+
+    @property
+    def rps(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank percentile of the latencies in seconds"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "rps": round(self.rps, 1),
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p95_ms": round(self.percentile(95) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+        }
+
+
+async def generate_load(
+    app,
+    base_url: str,
+    method: str,
+    path: str,
+    body: Optional[Dict[str, Any]],
+    requests: int,
+    concurrency: int,
+    name: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> Result:
+    """Send `requests` requests with `concurrency` closed-loop workers and record their latencies"""
+    result = Result(name)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, headers=headers) as client:
+        remaining = iter(range(requests))
+
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                result.latencies.append(time.perf_counter() - started)
+                result.statuses[response.status_code] = result.statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        result.elapsed = time.perf_counter() - started
+    return result
+
+
+def direct_target(path: str) -> Tuple[str, str]:
+    """Base URL and path the gateway would forward a request to"""
+    upstream_path = path[len(gateway.API_PREFIX):] if path.startswith(gateway.API_PREFIX) else path
+    route = gateway.router.match(upstream_path.split("?")[0])
+    if route is None:
+        raise ValueError(f"No route for {path}")
+    return parse_upstreams(gateway.SERVICE_ENDPOINTS[route.service])[0], upstream_path
+
+
+async def verify_bench_token(token: str, check_revoked: bool = False) -> Dict[str, Any]:
+    """Stands in for Firebase: every token belongs to the bench user"""
+    return dict(BENCH_USER)
+
+
+def install_stubs(backends: StubBackends, rate_limit: bool, concurrency_limit: bool) -> None:
+    """Point the gateway at the stub backends and the fake token verifier"""
+    gateway_auth.firebase = Lazy("firebase", lambda: True)
+    gateway_auth._verify_uncached = verify_bench_token
+    gateway.upstream_clients = UpstreamClients(gateway.SERVICE_ENDPOINTS, transport=httpx.ASGITransport(app=backends))
+    gateway.RATE_LIMIT_ENABLED = rate_limit
+    gateway.CONCURRENCY_LIMIT_ENABLED = concurrency_limit
+
+
+def max_rss_mb() -> float:
+    """Peak resident set size of the process"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+async def run(
+    scenarios: Sequence[Tuple[str, str, Optional[Dict[str, Any]]]],
+    requests: int,
+    concurrency: int,
+    latency: float,
+    payload_size: int,
+    service_latency: Dict[str, float],
+    rate_limit: bool = False,
+    concurrency_limit: bool = False,
+    trace_memory: bool = False,
+    warmup: int = 100,
+) -> Dict[str, Any]:
+    """
+    Run every scenario through the gateway and directly against its stub.
+
+    Returns:
+        Report with per-scenario results and memory use
+    """
+    services = {
+        name: make_stub_service(name, service_latency.get(name, latency), payload_size)
+        for name in gateway.SERVICE_ENDPOINTS
+    }
+    backends = StubBackends(services, gateway.SERVICE_ENDPOINTS)
+    install_stubs(backends, rate_limit, concurrency_limit)
+
+    report: Dict[str, Any] = {"scenarios": []}
+    rss_before = max_rss_mb()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for method, path, body in scenarios:
+            name = f"{method} {path}"
+            base_url, upstream_path = direct_target(path)
+            await generate_load(gateway.app, "http://gateway", method, path, body, warmup, concurrency, name, AUTH_HEADERS)
+
+            through = await generate_load(
+                gateway.app, "http://gateway", method, path, body, requests, concurrency, name, AUTH_HEADERS,
+            )
+            direct = await generate_load(backends, base_url, method, upstream_path, body, requests, concurrency, name)
+            report["scenarios"].append({
+                "gateway": through.summary(),
+                "direct": direct.summary(),
+                "overhead_p50_ms": round((through.percentile(50) - direct.percentile(50)) * 1000, 2),
+            })
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        await gateway.upstream_clients.aclose()
+
+    report["memory"] = {
+        "max_rss_mb": round(max_rss_mb(), 1),
+        "rss_growth_mb": round(max_rss_mb() - rss_before, 1),
+    }
+    if trace_memory:
+        report["memory"]["python_peak_mb"] = round(peak / (1024 * 1024), 1)
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'scenario':<40} {'target':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for scenario in report["scenarios"]:
+        for target in ("gateway", "direct"):
+            result = scenario[target]
+            print(
+                f"{result['name']:<40} {target:>8} {result['rps']:>9.0f} {result['p50_ms']:>8.2f} "
+                f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>7}"
+            )
+        print(f"{'':<40} {'overhead':>8} {'':>9} {scenario['overhead_p50_ms']:>8.2f}")
+    memory = report["memory"]
+    print(f"\nMax RSS {memory['max_rss_mb']} MB (+{memory['rss_growth_mb']} MB during the run)")
+    if "python_peak_mb" in memory:
+        print(f"Python heap peak {memory['python_peak_mb']} MB")
+
+
+def parse_service_latency(values: Sequence[str]) -> Dict[str, float]:
+    latencies = {}
+    for value in values:
+        name, _, seconds = value.partition("=")
+        latencies[name] = float(seconds)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the gateway against local stub backends")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario and target")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005, help="Stub response time in seconds")
+    parser.add_argument("--payload-size", type=int, default=1024, help="Stub response body size in bytes")
+    parser.add_argument(
+        "--service-latency", action="append", default=[], metavar="SERVICE=SECONDS",
+        help="Response time of one stub service, e.g. agent-service=0.5",
+    )
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the gateway rate limiter on")
+    parser.add_argument("--concurrency-limit", action="store_true", help="Keep the adaptive concurrency limits on")
+    parser.add_argument("--tracemalloc", action="store_true", help="Report the peak Python heap (slow)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    # Per-request logs would dominate the measurement
+    for name in (None, "httpx", "api-gateway"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    report = asyncio.run(run(
+        DEFAULT_SCENARIOS,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        latency=args.latency,
+        payload_size=args.payload_size,
+        service_latency=parse_service_latency(args.service_latency),
+        rate_limit=args.rate_limit,
+        concurrency_limit=args.concurrency_limit,
+        trace_memory=args.tracemalloc,
+    ))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of gateway path dispatch.
+
+Compares the previous linear `startswith` scan over PATH_TO_SERVICE with the
+compiled PrefixRouter as the number of routes grows. Run from the
+api-gateway directory:
+
+    python -m benchmarks.bench_routing
+"""
+import argparse
+import random
+import timeit
+from typing import Dict, List
+
+from app.routing import PrefixRouter, build_routes
+
+
+def make_routes(count: int) -> Dict[str, str]:
+    """Build `count` two-segment route prefixes"""
+    return {f"/service{i // 10}/resource{i % 10}": f"service-{i % 6}" for i in range(count)}
+
+
+def linear_match(path_to_service: Dict[str, str], path: str):
+    """The original dispatch: first prefix that the path starts with"""
+    for path_prefix, service_name in path_to_service.items():
+        if path.startswith(path_prefix):
+            return service_name
+    return None
+
+
+def make_paths(path_to_service: Dict[str, str], count: int = 1000) -> List[str]:
+    """Request paths spread uniformly over the routes"""
+    prefixes = list(path_to_service)
+    rng = random.Random(42)
+    return [f"{rng.choice(prefixes)}/item-{rng.randint(0, 9999)}/details" for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gateway path dispatch")
+    parser.add_argument("--routes", default="6,25,100,400,1600")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'routes':>8} {'linear ns/op':>14} {'trie ns/op':>12} {'speedup':>9}")
+    for count in [int(value) for value in args.routes.split(",")]:
+        path_to_service = make_routes(count)
+        router = PrefixRouter(build_routes(path_to_service))
+        paths = make_paths(path_to_service)
+
+        def run_linear():
+            for path in paths:
+                linear_match(path_to_service, path)
+
+        def run_trie():
+            for path in paths:
+                router.match(path)
+
+        linear = min(timeit.repeat(run_linear, number=10, repeat=args.repeat)) / (10 * len(paths))
+        trie = min(timeit.repeat(run_trie, number=10, repeat=args.repeat)) / (10 * len(paths))
+        print(f"{count:>8} {linear * 1e9:>14.0f} {trie * 1e9:>12.0f} {linear / trie:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Test package for API Gateway"""
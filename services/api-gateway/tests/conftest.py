@@ -0,0 +1,82 @@
+"""Pytest configuration file for API Gateway tests"""
+import json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import auth, main
+from app.proxy import PROXY_MODE_BUFFERED, PROXY_MODE_STREAMING
+from app.balancer import LoadBalancer, parse_upstreams
+from app.concurrency import AdaptiveConcurrencyLimiter
+from app.hedging import Hedger
+from app.ratelimit import MemoryRateLimitBackend, RateLimiter
+from app.resilience import CircuitBreaker, RetryBudget
+from app.upstream import UpstreamClients
+
+AUTH_HEADERS = {"Authorization": "Bearer test-token"}
+
+class BodyStream(httpx.AsyncByteStream):
+    """Unread response body, as a real network transport would return it"""
+    
+    def __init__(self, body: bytes):
+        self.body = body
+    
+    async def __aiter__(self):
+        yield self.body
+
+def upstream_response(status_code=200, content=b"", json_body=None, headers=None) -> httpx.Response:
+    """Build an upstream response whose body has not been read yet"""
+    headers = dict(headers or {})
+    if json_body is not None:
+        content = json.dumps(json_body).encode()
+        headers.setdefault("Content-Type", "application/json")
+    headers.setdefault("Content-Length", str(len(content)))
+    return httpx.Response(status_code, headers=headers, stream=BodyStream(content))
+
+class RecordingBackend:
+    """Mock upstream that records requests and returns a configurable response"""
+    
+    def __init__(self):
+        self.requests = []
+        self.handler = lambda request: upstream_response(200, json_body={"ok": True})
+    
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        self.requests.append(request)
+        return self.handler(request)
+
+@pytest.fixture(autouse=True)
+def reset_token_guards():
+    """Failed authentications in one test must not reject or block the next"""
+    auth.rejected_tokens.clear()
+    main.auth_failures.clear()
+    yield
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Route every upstream call from the gateway to a recording mock backend"""
+    recorder = RecordingBackend()
+    clients = UpstreamClients(main.SERVICE_ENDPOINTS, transport=httpx.MockTransport(recorder))
+    monkeypatch.setattr(main, "upstream_clients", clients)
+    monkeypatch.setattr(main, "load_balancers", {
+        name: LoadBalancer(name, parse_upstreams(url)) for name, url in main.SERVICE_ENDPOINTS.items()
+    })
+    monkeypatch.setattr(main, "circuit_breakers", {name: CircuitBreaker(name) for name in main.SERVICE_ENDPOINTS})
+    monkeypatch.setattr(main, "retry_budgets", {name: RetryBudget() for name in main.SERVICE_ENDPOINTS})
+    monkeypatch.setattr(main, "concurrency_limiters", {
+        name: AdaptiveConcurrencyLimiter(name) for name in main.SERVICE_ENDPOINTS
+    })
+    monkeypatch.setattr(main, "hedger", Hedger())
+    monkeypatch.setattr(main, "rate_limiter", RateLimiter(MemoryRateLimitBackend(), user_limit=main.rate_limiter.user_limit))
+    yield recorder
+
+@pytest.fixture(params=[PROXY_MODE_BUFFERED, PROXY_MODE_STREAMING])
+def proxy_mode(request, monkeypatch):
+    """Run a test in both proxy modes"""
+    monkeypatch.setattr(main, "GATEWAY_PROXY_MODE", request.param)
+    return request.param
+
+@pytest.fixture
+def client():
+    """Test client for the gateway app"""
+    return TestClient(main.app)
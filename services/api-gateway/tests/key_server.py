@@ -0,0 +1,161 @@
+"""
+Local stand-in for Google's token signing key endpoint.
+
+Generates RSA signing keys, serves their certificates in the same format as
+https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com
+and mints Firebase-style ID tokens signed with them. Used by the tests, and
+can be run directly for local development:
+
+    python -m tests.key_server --project-id demo-project
+
+then start a service with FIREBASE_LOCAL_VERIFY=true,
+FIREBASE_PROJECT_ID=demo-project and FIREBASE_CERTS_URL set to the printed URL.
+"""
+import argparse
+import base64
+import datetime
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class SigningKey:
+    """An RSA key pair with a self-signed certificate"""
+
+    def __init__(self, key_id: Optional[str] = None):
+        self.key_id = key_id or uuid.uuid4().hex
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.system.gserviceaccount.com")])
+        now = datetime.datetime.utcnow()
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self.private_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        self.certificate_pem = certificate.public_bytes(serialization.Encoding.PEM).decode("ascii")
+
+    def sign(self, data: bytes) -> bytes:
+        return self.private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+
+
+class LocalKeyServer:
+    """
+    HTTP server publishing signing certificates with a Cache-Control max-age.
+    """
+
+    def __init__(self, project_id: str = "demo-project", max_age: int = 3600, port: int = 0):
+        self.project_id = project_id
+        self.max_age = max_age
+        self.keys = [SigningKey()]
+        self.requests = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = json.dumps(server.certificates()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Cache-Control", f"public, max-age={server.max_age}, must-revalidate, no-transform")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def certificates(self) -> Dict[str, str]:
+        return {key.key_id: key.certificate_pem for key in self.keys}
+
+    def rotate(self) -> SigningKey:
+        """Publish a new signing key and make it current"""
+        key = SigningKey()
+        self.keys.insert(0, key)
+        return key
+
+    def mint_token(self, key: Optional[SigningKey] = None, header: Optional[Dict[str, Any]] = None, **claims) -> str:
+        """
+        Mint a signed Firebase-style ID token.
+
+        Keyword arguments override the default claims.
+        """
+        key = key or self.keys[0]
+        now = int(time.time())
+        payload = {
+            "iss": f"https://securetoken.google.com/{self.project_id}",
+            "aud": self.project_id,
+            "auth_time": now,
+            "user_id": "local-user",
+            "sub": "local-user",
+            "iat": now,
+            "exp": now + 3600,
+            "email": "local-user@example.com",
+            "email_verified": True,
+            "name": "Local User",
+        }
+        payload.update(claims)
+        token_header = {"alg": "RS256", "kid": key.key_id, "typ": "JWT"}
+        token_header.update(header or {})
+
+        signing_input = (
+            f"{_b64encode(json.dumps(token_header).encode())}."
+            f"{_b64encode(json.dumps(payload).encode())}"
+        )
+        return f"{signing_input}.{_b64encode(key.sign(signing_input.encode('ascii')))}"
+
+    def start(self) -> "LocalKeyServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "LocalKeyServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve local Firebase token signing keys")
+    parser.add_argument("--project-id", default="demo-project")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--max-age", type=int, default=3600)
+    args = parser.parse_args()
+
+    key_server = LocalKeyServer(project_id=args.project_id, max_age=args.max_age, port=args.port)
+    print(f"FIREBASE_CERTS_URL={key_server.url}")
+    print(f"Sample token: {key_server.mint_token()}")
+    try:
+        key_server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        key_server.stop()
@@ -0,0 +1,106 @@
+"""Tests for load balancing across service replicas"""
+import random
+import pytest
+
+from app import main
+from app.balancer import STRATEGY_LEAST_OUTSTANDING, STRATEGY_P2C, LoadBalancer, parse_upstreams
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+URLS = ["http://chat-1:8000", "http://chat-2:8000", "http://chat-3:8000"]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_parse_upstreams():
+    assert parse_upstreams("http://a:8000/, http://b:8000,,") == ["http://a:8000", "http://b:8000"]
+    assert parse_upstreams("http://none") == []
+    assert parse_upstreams("") == []
+
+def test_least_outstanding_picks_idle_upstream():
+    balancer = LoadBalancer("chat-service", URLS, strategy=STRATEGY_LEAST_OUTSTANDING)
+
+    picked = [balancer.acquire() for _ in range(3)]
+
+    assert sorted(upstream.url for upstream in picked) == URLS
+    balancer.release(picked[1])
+    assert balancer.acquire() is picked[1]
+
+def test_p2c_avoids_loaded_upstream():
+    balancer = LoadBalancer("chat-service", URLS, strategy=STRATEGY_P2C, rand=random.Random(1))
+    busy = balancer.upstreams[0]
+    busy.in_flight = 100
+
+    for _ in range(50):
+        upstream = balancer.acquire()
+        assert upstream is not busy
+        balancer.release(upstream)
+
+def test_in_flight_gauge():
+    balancer = LoadBalancer("chat-service", URLS[:1])
+    first = balancer.acquire()
+    balancer.acquire()
+
+    assert balancer.stats()[0]["in_flight"] == 2
+    balancer.release(first)
+    assert balancer.stats()[0]["in_flight"] == 1
+
+def test_consecutive_failures_eject_upstream():
+    clock = FakeClock()
+    balancer = LoadBalancer("chat-service", URLS, consecutive_failures=3, ejection_duration=30, clock=clock)
+    bad = balancer.upstreams[0]
+    for _ in range(3):
+        balancer.observe(bad, False, 0.01)
+
+    assert balancer.stats()[0]["ejected"]
+    for _ in range(20):
+        upstream = balancer.acquire()
+        assert upstream is not bad
+        balancer.release(upstream)
+
+    clock.now = 30
+    assert not balancer.stats()[0]["ejected"]
+
+def test_slow_upstream_ejected():
+    balancer = LoadBalancer("chat-service", URLS, min_latency_samples=5)
+    for upstream in balancer.upstreams[1:]:
+        balancer.observe(upstream, True, 0.05)
+    for _ in range(5):
+        balancer.observe(balancer.upstreams[0], True, 1.0)
+
+    assert balancer.stats()[0]["ejected"]
+    assert balancer.stats()[0]["ejections"] == 1
+
+def test_ejection_is_capped():
+    """At most half the upstreams are ejected, and a lone upstream never is"""
+    balancer = LoadBalancer("chat-service", URLS[:2], consecutive_failures=1)
+    for upstream in balancer.upstreams:
+        balancer.observe(upstream, False, 0.01)
+
+    assert [stats["ejected"] for stats in balancer.stats()] == [True, False]
+
+    single = LoadBalancer("chat-service", URLS[:1], consecutive_failures=1)
+    single.observe(single.upstreams[0], False, 0.01)
+    assert not single.stats()[0]["ejected"]
+
+@pytest.mark.parametrize("strategy", [STRATEGY_LEAST_OUTSTANDING, STRATEGY_P2C])
+def test_gateway_spreads_requests(client, backend, monkeypatch, strategy):
+    monkeypatch.setitem(main.load_balancers, "chat-service", LoadBalancer("chat-service", URLS, strategy=strategy))
+
+    for _ in range(30):
+        assert client.get("/api/chats/c1", headers=AUTH_HEADERS).status_code == 200
+
+    hosts = {request.url.host for request in backend.requests}
+    assert hosts == {"chat-1", "chat-2", "chat-3"}
+    assert all(stats["in_flight"] == 0 for stats in main.load_balancers["chat-service"].stats())
+
+def test_gateway_stream_holds_upstream_until_sent(client, backend, monkeypatch):
+    """Streamed responses release their upstream once the body is sent"""
+    monkeypatch.setattr(main, "GATEWAY_PROXY_MODE", "streaming")
+    backend.handler = lambda request: upstream_response(200, content=b"chunk")
+
+    assert client.get("/api/chats/c1", headers=AUTH_HEADERS).content == b"chunk"
+    assert main.load_balancers["chat-service"].stats()[0]["in_flight"] == 0
@@ -0,0 +1,124 @@
+"""Tests for the gateway batch endpoint"""
+import json
+
+from app import main
+from app.batch import BatchItem, item_headers, split_item_path
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+def test_split_item_path():
+    assert split_item_path("/api/chats/c1/messages?limit=20&offset=0", "/api") == (
+        "/chats/c1/messages", [("limit", "20"), ("offset", "0")],
+    )
+    assert split_item_path("/users/me", "/api") == ("/users/me", [])
+    assert split_item_path("/apis/x", "/api") == ("/apis/x", [])
+
+def test_item_headers_overlay_batch_headers():
+    item = BatchItem(path="/users/me", headers={"If-None-Match": '"abc"'}, body={"a": 1})
+    headers = item_headers(
+        [("authorization", "Bearer t"), ("content-type", "application/json"), ("content-length", "99"), ("accept-encoding", "gzip")],
+        item,
+    )
+    assert headers == {
+        "authorization": "Bearer t",
+        "if-none-match": '"abc"',
+        "accept-encoding": "identity",
+        "content-type": "application/json",
+    }
+
+def test_item_headers_cannot_replace_credentials():
+    item = BatchItem(path="/users/me", headers={
+        "Authorization": "Bearer unverified",
+        "Cookie": "session=x",
+        "X-User-ID": "someone-else",
+        "X-Internal-Identity": "forged",
+        "Connection": "close",
+        "Accept": "text/csv",
+    })
+    headers = item_headers([("authorization", "Bearer verified")], item)
+
+    assert headers == {"authorization": "Bearer verified", "accept": "text/csv", "accept-encoding": "identity"}
+
+def test_batch_items_run_as_the_verified_user(client, backend):
+    response = client.post("/api/batch", headers=AUTH_HEADERS, json={"requests": [
+        {"path": "/api/users/me", "headers": {"Authorization": "Bearer unverified", "X-User-ID": "someone-else"}},
+    ]})
+
+    assert response.json()["responses"][0]["status"] == 200
+    request = backend.requests[0]
+    assert request.headers["authorization"] == AUTH_HEADERS["Authorization"]
+    assert request.headers["x-user-id"] != "someone-else"
+
+def test_batch_dispatches_every_request(client, backend):
+    def handler(request):
+        return upstream_response(200, json_body={"path": request.url.path, "query": request.url.query.decode()})
+    backend.handler = handler
+
+    response = client.post("/api/batch", headers=AUTH_HEADERS, json={"requests": [
+        {"id": "me", "path": "/api/users/me"},
+        {"id": "messages", "path": "/api/chats/c1/messages?limit=20"},
+        {"id": "files", "path": "/files/projects/p1"},
+    ]})
+
+    assert response.status_code == 200
+    results = response.json()["responses"]
+    assert [result["id"] for result in results] == ["me", "messages", "files"]
+    assert all(result["status"] == 200 for result in results)
+    assert results[1]["body"] == {"path": "/chats/c1/messages", "query": "limit=20"}
+    assert results[0]["headers"]["content-type"] == "application/json"
+    assert {request.url.host for request in backend.requests} == {"user-service", "chat-service", "file-service"}
+    # Identity headers are added to every sub-request
+    assert all(request.headers["x-user-id"] for request in backend.requests)
+
+def test_batch_forwards_bodies(client, backend):
+    response = client.post("/api/batch", headers=AUTH_HEADERS, json={"requests": [
+        {"method": "PUT", "path": "/api/projects/p1", "body": {"name": "New"}},
+    ]})
+
+    assert response.json()["responses"][0]["status"] == 200
+    request = backend.requests[0]
+    assert request.method == "PUT"
+    assert request.headers["content-type"] == "application/json"
+    assert json.loads(request.content) == {"name": "New"}
+
+def test_batch_reports_failures_per_item(client, backend):
+    def handler(request):
+        if request.url.host == "chat-service":
+            return upstream_response(500, json_body={"detail": "boom"})
+        return upstream_response(200, json_body={"ok": True})
+    backend.handler = handler
+
+    response = client.post("/api/batch", headers=AUTH_HEADERS, json={"requests": [
+        {"id": "ok", "path": "/api/users/me"},
+        {"id": "broken", "path": "/api/chats/c1"},
+        {"id": "unknown", "path": "/api/nothing"},
+        {"id": "patch", "method": "PATCH", "path": "/api/users/me"},
+        {"id": "nested", "method": "POST", "path": "/api/batch"},
+    ]})
+
+    assert response.status_code == 200
+    statuses = {result["id"]: result["status"] for result in response.json()["responses"]}
+    assert statuses == {"ok": 200, "broken": 500, "unknown": 404, "patch": 405, "nested": 400}
+
+def test_batch_is_rate_limited_per_item(client, backend, monkeypatch):
+    limiter = main.rate_limiter
+    monkeypatch.setattr(limiter, "user_limit", main.RateLimit(rate=0.001, burst=2))
+
+    response = client.post("/api/batch", headers=AUTH_HEADERS, json={"requests": [
+        {"path": "/api/users/me"} for _ in range(3)
+    ]})
+
+    statuses = sorted(result["status"] for result in response.json()["responses"])
+    assert statuses == [200, 200, 429]
+
+def test_batch_size_is_limited(client, backend, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_REQUESTS", 2)
+    response = client.post("/api/batch", headers=AUTH_HEADERS, json={"requests": [
+        {"path": "/api/users/me"} for _ in range(3)
+    ]})
+    assert response.status_code == 400
+    assert backend.requests == []
+
+def test_batch_requires_authentication(client, backend):
+    response = client.post("/api/batch", json={"requests": [{"path": "/api/users/me"}]})
+    assert response.status_code == 401
+    assert backend.requests == []
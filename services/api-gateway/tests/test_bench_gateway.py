@@ -0,0 +1,52 @@
+"""Smoke test of the gateway load test, so it keeps working in CI"""
+import pytest
+
+from app import auth, main
+from benchmarks import bench_gateway
+
+@pytest.mark.asyncio
+async def test_load_test_reports_gateway_and_direct_results(monkeypatch):
+    for name in ("upstream_clients", "RATE_LIMIT_ENABLED", "CONCURRENCY_LIMIT_ENABLED"):
+        monkeypatch.setattr(main, name, getattr(main, name))
+    for name in ("firebase", "_verify_uncached"):
+        monkeypatch.setattr(auth, name, getattr(auth, name))
+
+    report = await bench_gateway.run(
+        [("GET", "/api/users/me", None), ("POST", "/api/agent/process", {"message": "hi"})],
+        requests=20,
+        concurrency=4,
+        latency=0.0,
+        payload_size=256,
+        service_latency={"agent-service": 0.001},
+        warmup=4,
+    )
+
+    assert len(report["scenarios"]) == 2
+    for scenario in report["scenarios"]:
+        for target in ("gateway", "direct"):
+            result = scenario[target]
+            assert result["requests"] == 20
+            assert result["statuses"] == {"200": 20}
+            assert 0 < result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+    assert report["memory"]["max_rss_mb"] > 0
+
+def test_stub_backends_route_by_host():
+    services = {"user-service": bench_gateway.make_stub_service("user-service")}
+    backends = bench_gateway.StubBackends(services, {"user-service": "http://a:8000, http://b:8000", "chat-service": "http://c:8000"})
+    assert backends.hosts == {"a:8000": "user-service", "b:8000": "user-service"}
+    assert bench_gateway.direct_target("/api/chats/c1?limit=1") == ("http://chat-service:8000", "/chats/c1?limit=1")
+
+@pytest.mark.asyncio
+async def test_bench_verifier_is_used_instead_of_firebase(monkeypatch):
+    for name in ("upstream_clients", "RATE_LIMIT_ENABLED", "CONCURRENCY_LIMIT_ENABLED"):
+        monkeypatch.setattr(main, name, getattr(main, name))
+    for name in ("firebase", "_verify_uncached"):
+        monkeypatch.setattr(auth, name, getattr(auth, name))
+    monkeypatch.setattr(auth, "local_verifier", None)
+    services = {"user-service": bench_gateway.make_stub_service("user-service")}
+    bench_gateway.install_stubs(bench_gateway.StubBackends(services, main.SERVICE_ENDPOINTS), False, False)
+
+    user = await auth.verify_token("bench-only-token")
+    auth.token_cache.invalidate("bench-only-token")
+
+    assert user["uid"] == "bench-user"
@@ -0,0 +1,112 @@
+"""Tests for negotiated response compression"""
+import gzip
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.responses import Response
+
+from app.compression import (
+    ENCODING_BROTLI,
+    ENCODING_GZIP,
+    CompressionMiddleware,
+    negotiate_encoding,
+)
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+LARGE_JSON = json.dumps({"files": [{"id": i, "name": f"file-{i}.pdf"} for i in range(200)]}).encode()
+
+@pytest.mark.parametrize("header,encoding", [
+    ("gzip, deflate, br", ENCODING_BROTLI),
+    ("gzip", ENCODING_GZIP),
+    ("br;q=0.5, gzip", ENCODING_GZIP),
+    ("gzip;q=0, br;q=0", None),
+    ("*", ENCODING_BROTLI),
+    ("identity", None),
+    (None, None),
+])
+def test_negotiate_encoding(header, encoding):
+    assert negotiate_encoding(header, (ENCODING_BROTLI, ENCODING_GZIP)) == encoding
+
+@pytest.fixture
+def app_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500, encodings=(ENCODING_GZIP,))
+
+    @app.get("/large")
+    async def large():
+        return Response(LARGE_JSON, media_type="application/json", headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    async def small():
+        return Response(b'{"ok": true}', media_type="application/json")
+
+    @app.get("/pdf")
+    async def pdf():
+        return Response(LARGE_JSON, media_type="application/pdf")
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"line {i}\n".encode()
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    return TestClient(app)
+
+def get_raw(client, path, encoding="gzip"):
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+def test_large_json_is_compressed(app_client):
+    response, raw = get_raw(app_client, "/large")
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert int(response.headers["content-length"]) == len(raw) < len(LARGE_JSON)
+    assert gzip.decompress(raw) == LARGE_JSON
+
+@pytest.mark.parametrize("path", ["/small", "/pdf"])
+def test_small_or_binary_not_compressed(app_client, path):
+    response, _ = get_raw(app_client, path)
+
+    assert "content-encoding" not in response.headers
+
+def test_not_compressed_without_accept_encoding(app_client):
+    response, raw = get_raw(app_client, "/large", encoding="identity")
+
+    assert "content-encoding" not in response.headers
+    assert raw == LARGE_JSON
+
+def test_streamed_response_compressed_incrementally(app_client):
+    response, raw = get_raw(app_client, "/stream")
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(raw) == b"line 0\nline 1\nline 2\n"
+
+def test_brotli_when_installed():
+    brotli = pytest.importorskip("brotli")
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500, encodings=(ENCODING_BROTLI, ENCODING_GZIP))
+
+    @app.get("/large")
+    async def large():
+        return Response(LARGE_JSON, media_type="application/json")
+
+    response, raw = get_raw(TestClient(app), "/large", encoding="br")
+    assert response.headers["content-encoding"] == "br"
+    assert brotli.decompress(raw) == LARGE_JSON
+
+def test_gateway_compresses_in_both_modes(client, backend, proxy_mode):
+    backend.handler = lambda request: upstream_response(200, content=LARGE_JSON, headers={"Content-Type": "application/json"})
+
+    with client.stream("GET", "/api/files/projects/p1", headers={**AUTH_HEADERS, "Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(raw) == LARGE_JSON
+    # The upstream still sees the client's Accept-Encoding and may compress itself
+    assert backend.requests[0].headers["accept-encoding"] == "gzip"
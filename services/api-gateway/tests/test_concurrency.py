@@ -0,0 +1,179 @@
+"""Tests for adaptive concurrency limits and load shedding"""
+import asyncio
+
+import httpx
+import pytest
+
+from app import main
+from app.proxy import PROXY_MODE_STREAMING
+from app.concurrency import (
+    PRIORITY_CRITICAL,
+    PRIORITY_LOW,
+    PRIORITY_READ,
+    PRIORITY_WRITE,
+    AdaptiveConcurrencyLimiter,
+    ConcurrencyLimitExceeded,
+)
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_limit_grows_while_used():
+    limiter = AdaptiveConcurrencyLimiter("svc", initial_limit=4, clock=FakeClock())
+    for _ in range(8):
+        permits = [limiter.acquire(PRIORITY_CRITICAL) for _ in range(3)]
+        for permit in permits:
+            limiter.release(permit)
+    assert limiter.limit > 5
+
+    # An idle service does not earn a higher limit
+    idle = AdaptiveConcurrencyLimiter("svc", initial_limit=10, clock=FakeClock())
+    for _ in range(20):
+        idle.release(idle.acquire())
+    assert idle.limit == 10
+
+def test_limit_backs_off_on_errors_and_slow_calls():
+    clock = FakeClock()
+    limiter = AdaptiveConcurrencyLimiter("svc", initial_limit=10, min_limit=2, clock=clock)
+    limiter.release(limiter.acquire(), False)
+    assert limiter.limit == pytest.approx(9)
+    # One burst of failures counts once
+    limiter.release(limiter.acquire(), False)
+    assert limiter.limit == pytest.approx(9)
+
+    clock.now += 1
+    permit = limiter.acquire()
+    clock.now += 0.1
+    limiter.release(permit)
+    assert limiter.baseline == pytest.approx(0.1)
+
+    clock.now += 1
+    permit = limiter.acquire()
+    clock.now += 0.5
+    limiter.release(permit)
+    assert limiter.limit == pytest.approx(8.1)
+    assert limiter.stats()["decreases"] == 2
+
+    for _ in range(50):
+        clock.now += 1
+        limiter.release(limiter.acquire(), False)
+    assert limiter.limit == 2
+
+def test_recorded_outcome_is_not_counted_again_on_release():
+    """A stream is judged by its time to headers, not by how long its body takes"""
+    clock = FakeClock()
+    limiter = AdaptiveConcurrencyLimiter("svc", initial_limit=10, clock=clock)
+    permit = limiter.acquire()
+    clock.now += 0.1
+    limiter.record(permit, True)
+    assert limiter.baseline == pytest.approx(0.1)
+    assert limiter.in_flight == 1
+
+    clock.now += 30
+    limiter.release(permit, False)
+    assert limiter.in_flight == 0
+    assert limiter.limit == pytest.approx(10)
+    assert limiter.stats()["decreases"] == 0
+
+def test_low_priority_is_shed_first():
+    limiter = AdaptiveConcurrencyLimiter("svc", initial_limit=10, clock=FakeClock())
+    for _ in range(5):
+        limiter.acquire(PRIORITY_READ)
+
+    with pytest.raises(ConcurrencyLimitExceeded) as exc_info:
+        limiter.acquire(PRIORITY_LOW)
+    assert exc_info.value.priority == PRIORITY_LOW
+    assert exc_info.value.retry_after >= 1
+
+    for _ in range(2):
+        limiter.acquire(PRIORITY_WRITE)
+    with pytest.raises(ConcurrencyLimitExceeded):
+        limiter.acquire(PRIORITY_WRITE)
+    limiter.acquire(PRIORITY_READ)
+    limiter.acquire(PRIORITY_READ)
+    with pytest.raises(ConcurrencyLimitExceeded):
+        limiter.acquire(PRIORITY_READ)
+    limiter.acquire(PRIORITY_CRITICAL)
+    assert limiter.stats()["shed"] == {PRIORITY_CRITICAL: 0, PRIORITY_READ: 1, PRIORITY_WRITE: 1, PRIORITY_LOW: 1}
+
+def test_request_priority():
+    chat = main.router.match("/chats/c1")
+    agent = main.router.match("/agent/run")
+    assert main.request_priority(chat, "GET", "/chats/c1") == PRIORITY_READ
+    assert main.request_priority(chat, "POST", "/chats/c1") == PRIORITY_WRITE
+    assert main.request_priority(agent, "POST", "/agent/run") == PRIORITY_LOW
+    assert main.request_priority(agent, "GET", "/agent/health") == PRIORITY_CRITICAL
+    assert main.request_priority(agent, "HEAD", "/agent/health/") == PRIORITY_CRITICAL
+    # Writes and other paths ending in /health are not health checks
+    assert main.request_priority(agent, "POST", "/agent/health") == PRIORITY_LOW
+    assert main.request_priority(agent, "POST", "/agent/anything/health") == PRIORITY_LOW
+    assert main.request_priority(chat, "GET", "/chats/c1/health") == PRIORITY_READ
+
+def test_overloaded_service_sheds_with_retry_after(client, backend, proxy_mode):
+    limiter = main.concurrency_limiters["user-service"]
+    held = [limiter.acquire(PRIORITY_CRITICAL) for _ in range(limiter.allowed(PRIORITY_READ))]
+
+    response = client.get("/api/users/me", headers=AUTH_HEADERS)
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Service user-service is overloaded"
+    assert int(response.headers["Retry-After"]) >= 1
+    assert backend.requests == []
+    # Other services are not affected
+    assert client.get("/api/chats/c1", headers=AUTH_HEADERS).status_code == 200
+
+    for permit in held:
+        limiter.release(permit)
+    assert client.get("/api/users/me", headers=AUTH_HEADERS).status_code == 200
+    assert limiter.in_flight == 0
+
+def test_slots_are_released_on_failures(client, backend, proxy_mode):
+    def handler(request):
+        if request.url.host == "chat-service":
+            raise httpx.ConnectError("connection refused", request=request)
+        return upstream_response(500, json_body={"detail": "boom"})
+    backend.handler = handler
+
+    client.get("/api/users/me", headers=AUTH_HEADERS)
+    client.post("/api/chats/c1", headers=AUTH_HEADERS, json={})
+    assert main.concurrency_limiters["user-service"].in_flight == 0
+    assert main.concurrency_limiters["chat-service"].in_flight == 0
+    assert main.concurrency_limiters["user-service"].limit < 20
+    assert main.concurrency_limiters["chat-service"].limit < 20
+
+def test_slot_is_held_while_the_upstream_works(client, backend):
+    observed = []
+    async def handler(request):
+        observed.append(main.concurrency_limiters["user-service"].in_flight)
+        await asyncio.sleep(0)
+        return upstream_response(200, json_body={"ok": True})
+    backend.handler = handler
+
+    assert client.get("/api/users/me", headers=AUTH_HEADERS).status_code == 200
+    assert observed == [1]
+
+class SlowBody(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        for _ in range(3):
+            await asyncio.sleep(0.1)
+            yield b"chunk"
+
+def test_slow_streamed_body_does_not_lower_the_limit(client, backend, monkeypatch):
+    monkeypatch.setattr(main, "GATEWAY_PROXY_MODE", PROXY_MODE_STREAMING)
+    limiter = main.concurrency_limiters["user-service"]
+    backend.handler = lambda request: upstream_response(200, json_body={"ok": True})
+    for _ in range(3):
+        client.get("/api/users/me", headers=AUTH_HEADERS)
+    assert limiter.baseline is not None
+
+    backend.handler = lambda request: httpx.Response(200, stream=SlowBody())
+    response = client.get("/api/users/me", headers=AUTH_HEADERS)
+
+    assert response.content == b"chunk" * 3
+    assert limiter.in_flight == 0
+    assert limiter.stats()["decreases"] == 0
+    assert limiter.limit >= 20
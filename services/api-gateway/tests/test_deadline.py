@@ -0,0 +1,124 @@
+"""Tests for request deadlines"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import main
+from app.deadline import (
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    deadline_scope,
+    parse_timeout_header,
+    remaining,
+    run_with_deadline,
+    with_timeout_header,
+)
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+def test_parse_timeout_header():
+    assert parse_timeout_header("1500") == 1.5
+    assert parse_timeout_header("-5") == 0.0
+    assert parse_timeout_header(None) is None
+    assert parse_timeout_header("soon") is None
+    assert parse_timeout_header("nan") is None
+
+def test_nested_scopes_keep_the_earlier_deadline():
+    assert remaining() is None
+    with deadline_scope(1.0):
+        with deadline_scope(10.0):
+            assert remaining() <= 1.0
+        with deadline_scope(0.5):
+            assert remaining() <= 0.5
+        with deadline_scope(None):
+            assert 0.5 < remaining() <= 1.0
+    assert remaining() is None
+
+def test_timeout_header_carries_the_remaining_budget():
+    headers = [("X-Request-Timeout-Ms", "999999"), ("accept", "*/*")]
+    # A stale budget is never passed on
+    assert with_timeout_header(headers) == [("accept", "*/*")]
+    with deadline_scope(2.0):
+        headers = with_timeout_header(headers)
+    assert headers[0] == ("accept", "*/*")
+    assert headers[1][0] == "x-request-timeout-ms"
+    assert 1900 <= int(headers[1][1]) <= 2000
+
+@pytest.mark.asyncio
+async def test_run_with_deadline():
+    with deadline_scope(0.01):
+        with pytest.raises(DeadlineExceeded):
+            await run_with_deadline(asyncio.sleep(1), "test")
+        # Nothing is started once the budget is gone
+        with pytest.raises(DeadlineExceeded):
+            await run_with_deadline(asyncio.sleep(0), "test")
+
+    # The call's own timeout is not a deadline
+    with deadline_scope(10):
+        with pytest.raises(asyncio.TimeoutError):
+            await run_with_deadline(asyncio.sleep(1), "test", timeout=0.01)
+
+    assert await run_with_deadline(asyncio.sleep(0, result=42), "test") == 42
+
+def test_gateway_passes_budget_to_backend(client, backend):
+    client.get("/api/users/me", headers=AUTH_HEADERS)
+    assert 0 < int(backend.requests[0].headers["x-request-timeout-ms"]) <= main.GATEWAY_REQUEST_TIMEOUT * 1000
+
+    # A client may ask for less time, but not more than the route allows
+    client.get("/api/users/me", headers={**AUTH_HEADERS, "X-Request-Timeout-Ms": "1500"})
+    assert 0 < int(backend.requests[1].headers["x-request-timeout-ms"]) <= 1500
+
+    client.get("/api/users/me", headers={**AUTH_HEADERS, "X-Request-Timeout-Ms": "99999999"})
+    assert int(backend.requests[2].headers["x-request-timeout-ms"]) <= main.GATEWAY_REQUEST_TIMEOUT * 1000
+
+def test_expired_deadline_is_rejected(client, backend):
+    response = client.get("/api/users/me", headers={**AUTH_HEADERS, "X-Request-Timeout-Ms": "0"})
+    assert response.status_code == 504
+    assert backend.requests == []
+
+def test_slow_upstream_answers_504(client, backend, monkeypatch, proxy_mode):
+    async def slow(request):
+        await asyncio.sleep(1)
+        return upstream_response(200, json_body={"ok": True})
+    backend.handler = slow
+    monkeypatch.setattr(main, "GATEWAY_REQUEST_TIMEOUT", 0.05)
+
+    response = client.get("/api/users/me", headers=AUTH_HEADERS)
+    assert response.status_code == 504
+    assert response.json()["detail"] == "Deadline exceeded"
+    # A deadline is the caller's limit, not a failure of the service
+    assert main.circuit_breakers["user-service"].stats()["failure_rate"] == 0.0
+
+def make_deadline_app(timeout):
+    app = FastAPI()
+    app.add_middleware(DeadlineMiddleware, default_timeout=timeout)
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(1)
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk {i}\n"
+                await asyncio.sleep(0.05)
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    return TestClient(app)
+
+def test_deadline_cancels_requests_that_have_not_responded():
+    response = make_deadline_app(0.05).get("/slow")
+
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Deadline exceeded"}
+
+def test_deadline_does_not_cut_off_started_responses():
+    """A stream that outlives the deadline is sent in full"""
+    response = make_deadline_app(0.05).get("/stream")
+
+    assert response.status_code == 200
+    assert response.text == "chunk 0\nchunk 1\nchunk 2\n"
@@ -0,0 +1,115 @@
+"""Tests for backend health aggregation"""
+import asyncio
+import time
+import httpx
+import pytest
+
+from app.health import HealthAggregator
+
+ENDPOINTS = {
+    "user-service": "http://user-service:8000",
+    "chat-service": "http://chat-service:8000",
+    "file-service": "http://file-service:8000",
+    "agent-service": "http://agent-service:8000",
+    "task-service": "http://none",
+}
+
+class SlowBackend:
+    """Backend answering health probes after a delay"""
+    
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.probes = 0
+    
+    async def __call__(self, request):
+        self.probes += 1
+        await asyncio.sleep(self.delay)
+        if request.url.host == "agent-service":
+            return httpx.Response(503)
+        return httpx.Response(200, json={"status": "ok"})
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+    
+    def __call__(self):
+        return self.now
+
+def make_aggregator(backend, **kwargs):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(backend))
+    return HealthAggregator(ENDPOINTS, get_client=lambda name: client, **kwargs)
+
+@pytest.mark.asyncio
+async def test_probes_run_concurrently():
+    """Total time is bounded by the slowest probe, not the sum"""
+    backend = SlowBackend(delay=0.2)
+    aggregator = make_aggregator(backend)
+    
+    started = time.monotonic()
+    snapshot = await aggregator.snapshot()
+    elapsed = time.monotonic() - started
+    
+    assert elapsed < 0.5
+    assert snapshot["services"]["user-service"] == "healthy"
+    assert snapshot["services"]["agent-service"] == "unhealthy (503)"
+    assert snapshot["services"]["task-service"] == "not configured"
+    assert backend.probes == 4
+
+@pytest.mark.asyncio
+async def test_snapshot_is_cached():
+    """Requests within the ttl do not probe again"""
+    clock = FakeClock()
+    backend = SlowBackend(delay=0)
+    aggregator = make_aggregator(backend, ttl=5, clock=clock)
+    
+    await aggregator.snapshot()
+    clock.now += 2
+    snapshot = await aggregator.snapshot()
+    
+    assert backend.probes == 4
+    assert snapshot["age_seconds"] == 2
+
+@pytest.mark.asyncio
+async def test_stale_snapshot_returned_while_refreshing():
+    """A stale snapshot is returned immediately and refreshed in the background"""
+    clock = FakeClock()
+    backend = SlowBackend(delay=0)
+    aggregator = make_aggregator(backend, ttl=5, clock=clock)
+    await aggregator.snapshot()
+    
+    backend.delay = 0.2
+    clock.now += 10
+    started = time.monotonic()
+    snapshot = await aggregator.snapshot()
+    
+    assert time.monotonic() - started < 0.1
+    assert snapshot["age_seconds"] == 10
+    
+    await asyncio.sleep(0.3)
+    snapshot = await aggregator.snapshot()
+    assert snapshot["age_seconds"] == 0
+    assert backend.probes == 8
+
+@pytest.mark.asyncio
+async def test_background_refresher():
+    """The refresher keeps the snapshot fresh without any requests"""
+    backend = SlowBackend(delay=0)
+    aggregator = make_aggregator(backend, refresh_interval=0.05)
+    
+    aggregator.start()
+    await asyncio.sleep(0.12)
+    await aggregator.stop()
+    
+    assert backend.probes >= 8
+
+@pytest.mark.asyncio
+async def test_replicas_probed_individually():
+    """Services with several upstreams report how many are healthy"""
+    backend = SlowBackend(delay=0)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(backend))
+    endpoints = {"agent-service": "http://user-service:8000,http://agent-service:8000"}
+    aggregator = HealthAggregator(endpoints, get_client=lambda name: client)
+    
+    snapshot = await aggregator.snapshot()
+    
+    assert snapshot["services"]["agent-service"] == "degraded (1/2 upstreams healthy)"
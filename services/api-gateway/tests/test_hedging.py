@@ -0,0 +1,195 @@
+"""Tests for hedged gateway reads"""
+import asyncio
+import pytest
+
+from app import main
+from app.hedging import Hedger, LatencyWindow
+from app.resilience import RetryBudget
+from app.routing import HedgePolicy, PrefixRouter, Route, route_from_config
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+HEDGED = Route("/users", "user-service", hedge=HedgePolicy(min_samples=0, min_delay=0.02))
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=100, recompute_every=1)
+    assert window.percentile(95) is None
+
+    for latency in range(1, 101):
+        window.add(latency / 1000)
+    assert window.percentile(50) == 0.05
+    assert window.percentile(95) == 0.095
+
+    # Only the most recent latencies count
+    for _ in range(100):
+        window.add(1.0)
+    assert window.percentile(50) == 1.0
+
+def test_hedge_setting_from_config():
+    assert route_from_config({"prefix": "/a", "service": "s", "hedge": True}).hedge == HedgePolicy()
+    route = route_from_config({"prefix": "/a", "service": "s", "hedge": {"percentile": 99, "max_delay": 0.5}})
+    assert route.hedge == HedgePolicy(percentile=99, max_delay=0.5)
+    assert route_from_config({"hedge": False}, defaults=route).hedge is None
+
+def test_threshold_needs_samples():
+    hedger = Hedger()
+    route = Route("/users", "user-service", hedge=HedgePolicy(min_samples=3, min_delay=0.01, max_delay=0.2))
+    stats = hedger.route_stats(route)
+    assert hedger.threshold(route.hedge, stats) is None
+
+    for latency in (0.001, 0.002, 5.0):
+        stats.latencies.add(latency)
+    # Bounded by max_delay, and by min_delay below
+    assert hedger.threshold(route.hedge, stats) == 0.2
+    assert hedger.threshold(HedgePolicy(percentile=10, min_samples=3, min_delay=0.01), stats) == 0.01
+
+@pytest.mark.asyncio
+async def test_fast_call_is_not_hedged():
+    hedger = Hedger()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return "ok"
+
+    assert await hedger.run(HEDGED, call) == "ok"
+    assert calls == [1]
+    assert hedger.stats()["routes"]["/users"]["hedged"] == 0
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged_and_cancelled():
+    hedger = Hedger()
+    delays = [1.0, 0.0]
+    cancelled = []
+
+    async def call():
+        delay = delays.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    assert await hedger.run(HEDGED, call) == 0.0
+    await asyncio.sleep(0)
+    assert cancelled == [1.0]
+    stats = hedger.stats()
+    assert stats["hedges"] == 1
+    assert stats["routes"]["/users"]["hedge_wins"] == 1
+
+@pytest.mark.asyncio
+async def test_failed_attempt_waits_for_the_other():
+    hedger = Hedger()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) == 1:
+            await asyncio.sleep(0.05)
+            return "primary"
+        raise ConnectionError("refused")
+
+    assert await hedger.run(HEDGED, call) == "primary"
+    assert len(attempts) == 2
+
+class FakeResponse:
+    def __init__(self, status_code, name):
+        self.status_code = status_code
+        self.name = name
+
+@pytest.mark.asyncio
+async def test_server_error_response_waits_for_the_other():
+    """A fast 5xx from the hedge does not beat a slower healthy primary"""
+    hedger = Hedger()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) == 1:
+            await asyncio.sleep(0.05)
+            return FakeResponse(200, "primary")
+        return FakeResponse(503, "hedge")
+
+    response = await hedger.run(HEDGED, call)
+
+    assert (response.status_code, response.name) == (200, "primary")
+    assert hedger.stats()["routes"]["/users"]["hedge_wins"] == 0
+
+@pytest.mark.asyncio
+async def test_last_server_error_returned_when_every_attempt_fails():
+    hedger = Hedger()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        await asyncio.sleep(0.03 if len(attempts) == 1 else 0.05)
+        return FakeResponse(502, f"attempt {len(attempts)}")
+
+    response = await hedger.run(HEDGED, call)
+
+    assert response.status_code == 502
+    assert len(attempts) == 2
+
+@pytest.mark.asyncio
+async def test_error_raised_when_every_attempt_fails():
+    hedger = Hedger()
+
+    async def call():
+        await asyncio.sleep(0.03)
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        await hedger.run(HEDGED, call)
+
+@pytest.mark.asyncio
+async def test_hedges_are_capped_by_the_budget():
+    hedger = Hedger(budget=RetryBudget(ratio=0.0, min_retries_per_second=0.1, window=10))
+    route = Route("/users", "user-service", hedge=HedgePolicy(min_samples=0, min_delay=0.01, max_delay=0.01))
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.04)
+        return "ok"
+
+    await hedger.run(route, call)
+    await hedger.run(route, call)
+    await asyncio.sleep(0.05)
+
+    assert len(calls) == 3
+    assert hedger.stats()["routes"]["/users"]["budget_exhausted"] == 1
+
+def test_gateway_hedges_slow_gets(client, backend, monkeypatch):
+    monkeypatch.setattr(main, "router", PrefixRouter([HEDGED]))
+    monkeypatch.setattr(main, "COALESCE_GETS", False)
+
+    async def handler(request):
+        if len(backend.requests) == 1:
+            await asyncio.sleep(1.0)
+        return upstream_response(200, json_body={"attempt": len(backend.requests)})
+    backend.handler = handler
+
+    response = client.get("/api/users/me", headers=AUTH_HEADERS)
+    assert response.status_code == 200
+    assert response.json() == {"attempt": 2}
+    assert main.hedger.stats()["routes"]["/users"]["hedge_wins"] == 1
+
+    # Only GETs are hedged
+    client.post("/api/users/me", headers=AUTH_HEADERS, json={})
+    assert main.hedger.stats()["routes"]["/users"]["requests"] == 1
+
+def test_gateway_prefers_slow_success_over_fast_server_error(client, backend, monkeypatch):
+    monkeypatch.setattr(main, "router", PrefixRouter([HEDGED]))
+    monkeypatch.setattr(main, "COALESCE_GETS", False)
+
+    async def handler(request):
+        if len(backend.requests) == 1:
+            await asyncio.sleep(0.1)
+            return upstream_response(200, json_body={"attempt": 1})
+        return upstream_response(503, json_body={"detail": "unavailable"})
+    backend.handler = handler
+
+    response = client.get("/api/users/me", headers=AUTH_HEADERS)
+
+    assert response.status_code == 200
+    assert response.json() == {"attempt": 1}
@@ -0,0 +1,87 @@
+"""Tests for signed internal identity assertions"""
+import pytest
+
+from app import main
+from app.identity import IdentitySigner, IdentityVerifier, InternalIdentityError
+from tests.conftest import AUTH_HEADERS
+
+KEY = b"test-identity-key"
+USER = {
+    "uid": "user-1",
+    "email": "one@example.com",
+    "email_verified": True,
+    "display_name": "User One",
+    "photo_url": None,
+}
+
+class FakeClock:
+    """Manually advanced clock"""
+    
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+def test_assertion_round_trip():
+    assertion = IdentitySigner(KEY).mint(USER, "chat-service")
+    user = IdentityVerifier([KEY], "chat-service").verify(assertion)
+
+    assert {key: user[key] for key in USER} == USER
+    assert user["token"]["aud"] == "chat-service"
+
+@pytest.mark.parametrize("tamper", [
+    lambda assertion: assertion[:-2] + ("AA" if not assertion.endswith("AA") else "BB"),
+    lambda assertion: "e30" + assertion[3:],
+    lambda assertion: assertion.split(".")[0],
+    lambda assertion: "not-an-assertion",
+])
+def test_tampered_assertions_rejected(tamper):
+    assertion = IdentitySigner(KEY).mint(USER, "chat-service")
+
+    with pytest.raises(InternalIdentityError):
+        IdentityVerifier([KEY], "chat-service").verify(tamper(assertion))
+
+def test_wrong_key_and_audience_rejected():
+    assertion = IdentitySigner(b"other-key").mint(USER, "chat-service")
+    with pytest.raises(InternalIdentityError):
+        IdentityVerifier([KEY], "chat-service").verify(assertion)
+
+    assertion = IdentitySigner(KEY).mint(USER, "file-service")
+    with pytest.raises(InternalIdentityError, match="another service"):
+        IdentityVerifier([KEY], "chat-service").verify(assertion)
+
+def test_expired_assertion_rejected():
+    clock = FakeClock()
+    assertion = IdentitySigner(KEY, ttl=60, clock=clock).mint(USER, "chat-service")
+    verifier = IdentityVerifier([KEY], "chat-service", leeway=5, clock=clock)
+
+    clock.now += 64
+    assert verifier.verify(assertion)["uid"] == "user-1"
+
+    clock.now += 2
+    with pytest.raises(InternalIdentityError, match="expired"):
+        verifier.verify(assertion)
+
+def test_previous_key_accepted_during_rotation():
+    assertion = IdentitySigner(b"old-key").mint(USER, "user-service")
+
+    assert IdentityVerifier([b"new-key", b"old-key"], "user-service").verify(assertion)["uid"] == "user-1"
+
+def test_gateway_forwards_signed_identity(client, backend, monkeypatch):
+    monkeypatch.setattr(main, "identity_signer", IdentitySigner(KEY))
+
+    # A client-supplied assertion is dropped
+    client.get("/api/chats/c1", headers={**AUTH_HEADERS, "X-Internal-Identity": "forged"})
+
+    assertions = backend.requests[0].headers.get_list("x-internal-identity")
+    assert len(assertions) == 1
+    user = IdentityVerifier([KEY], "chat-service").verify(assertions[0])
+    assert user["uid"] == "mock-user-id"
+
+def test_no_identity_without_key(client, backend, monkeypatch):
+    monkeypatch.setattr(main, "identity_signer", None)
+
+    client.get("/api/chats/c1", headers={**AUTH_HEADERS, "X-Internal-Identity": "forged"})
+
+    assert "x-internal-identity" not in backend.requests[0].headers
@@ -0,0 +1,172 @@
+"""Tests for local Firebase ID token verification"""
+import asyncio
+import time
+import pytest
+
+from app.jwt_verifier import (
+    ExpiredTokenError,
+    FirebaseTokenVerifier,
+    PublicKeyCache,
+    SigningKeysUnavailableError,
+    TokenVerificationError,
+    parse_max_age,
+    user_data_from_claims,
+)
+from tests.key_server import LocalKeyServer, SigningKey
+
+PROJECT_ID = "demo-project"
+
+@pytest.fixture(scope="module")
+def key_server():
+    """Local key endpoint shared by the tests in this module"""
+    with LocalKeyServer(project_id=PROJECT_ID, max_age=600) as server:
+        yield server
+
+@pytest.fixture
+def verifier(key_server):
+    return FirebaseTokenVerifier(PROJECT_ID, key_cache=PublicKeyCache(url=key_server.url))
+
+def test_parse_max_age():
+    """max-age is read from Cache-Control"""
+    assert parse_max_age("public, max-age=19302, must-revalidate, no-transform") == 19302
+    assert parse_max_age(None) == 3600
+
+@pytest.mark.asyncio
+async def test_valid_token(verifier, key_server):
+    """A correctly signed token yields its claims"""
+    claims = await verifier.verify(key_server.mint_token(sub="user-1"))
+
+    assert claims["uid"] == "user-1"
+    assert user_data_from_claims(claims)["email"] == "local-user@example.com"
+
+@pytest.mark.asyncio
+async def test_keys_fetched_once(verifier, key_server):
+    """Steady-state verification does not touch the key endpoint"""
+    await verifier.verify(key_server.mint_token())
+    requests = key_server.requests
+
+    for _ in range(5):
+        await verifier.verify(key_server.mint_token())
+
+    assert key_server.requests == requests
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("claims,error", [
+    ({"exp": int(time.time()) - 10}, ExpiredTokenError),
+    ({"aud": "other-project"}, TokenVerificationError),
+    ({"iss": "https://securetoken.google.com/other-project"}, TokenVerificationError),
+    ({"sub": ""}, TokenVerificationError),
+    ({"iat": int(time.time()) + 600}, TokenVerificationError),
+])
+async def test_invalid_claims(verifier, key_server, claims, error):
+    """Tokens with bad registered claims are rejected"""
+    with pytest.raises(error):
+        await verifier.verify(key_server.mint_token(**claims))
+
+@pytest.mark.asyncio
+async def test_forged_signature(verifier, key_server):
+    """A token signed by an unpublished key with a known kid is rejected"""
+    forger = SigningKey(key_id=key_server.keys[0].key_id)
+
+    with pytest.raises(TokenVerificationError):
+        await verifier.verify(key_server.mint_token(key=forger))
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("token", ["", "abc", "a.b.c", "a.b"])
+async def test_malformed_token(verifier, token):
+    with pytest.raises(TokenVerificationError):
+        await verifier.verify(token)
+
+@pytest.mark.asyncio
+async def test_wrong_algorithm(verifier, key_server):
+    with pytest.raises(TokenVerificationError):
+        await verifier.verify(key_server.mint_token(header={"alg": "HS256"}))
+
+@pytest.mark.asyncio
+async def test_rotated_key_triggers_refresh(key_server):
+    """A token signed with a newly published key forces a refresh"""
+    key_cache = PublicKeyCache(url=key_server.url, min_refresh_interval=0)
+    verifier = FirebaseTokenVerifier(PROJECT_ID, key_cache=key_cache)
+    await verifier.verify(key_server.mint_token())
+
+    new_key = key_server.rotate()
+    claims = await verifier.verify(key_server.mint_token(key=new_key))
+
+    assert claims["uid"] == "local-user"
+    assert key_cache.refreshes == 2
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.mark.asyncio
+async def test_background_refresh_near_expiry(key_server):
+    """Keys close to expiry are refreshed in the background"""
+    clock = FakeClock()
+    certificates = key_server.certificates()
+    fetches = []
+
+    def fetch():
+        fetches.append(clock.now)
+        return certificates, 600
+
+    key_cache = PublicKeyCache(fetch=fetch, refresh_margin=60, clock=clock)
+    key_id = next(iter(certificates))
+
+    assert await key_cache.get_verifier(key_id) is not None
+    clock.now = 550
+    assert await key_cache.get_verifier(key_id) is not None
+    await asyncio.sleep(0.05)
+
+    assert fetches == [0.0, 550]
+    assert key_cache.expires_in == 600
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_previous_keys(key_server):
+    """If the key endpoint fails, previously fetched keys stay in use"""
+    clock = FakeClock()
+    certificates = key_server.certificates()
+    responses = [lambda: (certificates, 600)]
+
+    def fetch():
+        if responses:
+            return responses.pop()()
+        raise OSError("network down")
+
+    key_cache = PublicKeyCache(fetch=fetch, clock=clock)
+    key_id = next(iter(certificates))
+    await key_cache.get_verifier(key_id)
+
+    clock.now = 700
+    assert await key_cache.get_verifier(key_id) is not None
+    assert key_cache.refresh_failures == 1
+
+@pytest.mark.asyncio
+async def test_unavailable_keys():
+    """Verification fails cleanly if keys were never fetched"""
+    def fetch():
+        raise OSError("network down")
+
+    with pytest.raises(SigningKeysUnavailableError):
+        await PublicKeyCache(fetch=fetch).get_verifier("any")
+
+@pytest.mark.asyncio
+async def test_gateway_verify_token_uses_local_verifier(monkeypatch, verifier, key_server):
+    """The gateway verifies tokens locally when a local verifier is configured"""
+    from fastapi import HTTPException
+    from app import auth
+    from app.token_cache import VerifiedTokenCache
+
+    monkeypatch.setattr(auth, "local_verifier", verifier)
+    monkeypatch.setattr(auth, "token_cache", VerifiedTokenCache())
+
+    user = await auth.verify_token(key_server.mint_token(sub="user-2", email="two@example.com"))
+    assert user["uid"] == "user-2"
+    assert user["email"] == "two@example.com"
+
+    with pytest.raises(HTTPException) as exc_info:
+        await auth.verify_token(key_server.mint_token(exp=int(time.time()) - 5))
+    assert exc_info.value.detail == "Token has expired"
@@ -0,0 +1,80 @@
+"""Tests for lazy initialization"""
+import sys
+import threading
+
+import pytest
+
+from app import lazy
+from app.lazy import Lazy, lazy_import, start_warm_up
+
+@pytest.fixture
+def registry(monkeypatch):
+    components = []
+    monkeypatch.setattr(lazy, "_registry", components)
+    return components
+
+def test_value_is_built_once_on_first_use(registry):
+    calls = []
+    component = Lazy("component", lambda: calls.append(1) or "client")
+    assert not component.ready
+    assert calls == []
+
+    threads = [threading.Thread(target=component.get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert component.get() == "client"
+    assert calls == [1]
+    assert component.stats()["ready"]
+    assert registry == [component]
+
+def test_failures_are_retried(registry):
+    attempts = []
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("unavailable")
+        return "client"
+
+    component = Lazy("component", factory)
+    with pytest.raises(ConnectionError):
+        component.get()
+    assert not component.ready
+    assert component.get() == "client"
+
+def test_lazy_import_defers_the_import():
+    name = "email.mime.audio"
+    sys.modules.pop(name, None)
+    module = lazy_import(name)
+    assert name not in sys.modules
+    assert module.MIMEAudio.__name__ == "MIMEAudio"
+    assert name in sys.modules
+
+@pytest.mark.asyncio
+async def test_warm_up_modes(registry):
+    def broken():
+        raise RuntimeError("no credentials")
+    ok = Lazy("ok", lambda: "client")
+    failing = Lazy("failing", broken)
+
+    assert await start_warm_up("off") is None
+    assert not ok.ready
+
+    # Failures are logged, not raised, and do not stop the other components
+    task = await start_warm_up("background")
+    await task
+    assert ok.ready
+    assert not failing.ready
+
+    ok.reset()
+    await start_warm_up("blocking")
+    assert ok.ready
+    assert lazy.components()["failing"] == {"ready": False, "init_ms": None}
+
+@pytest.mark.asyncio
+async def test_aget_builds_off_the_event_loop(registry):
+    loop_thread = threading.get_ident()
+    component = Lazy("component", threading.get_ident)
+    assert await component.aget() != loop_thread
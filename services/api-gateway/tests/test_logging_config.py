@@ -0,0 +1,91 @@
+"""Tests for the queued JSON logging setup"""
+import io
+import json
+import logging
+
+import pytest
+
+from app import logging_config
+from app.logging_config import SAMPLED, JsonFormatter, LazyJson, SamplingFilter, configure_logging, stop_logging
+from app.tracing import InMemoryExporter, Tracer
+
+@pytest.fixture
+def restore_logging():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+def test_records_are_written_as_json_by_the_listener(restore_logging):
+    stream = io.StringIO()
+    configure_logging("test-service", level="INFO", sample_rate=1.0, stream=stream)
+    logger = logging.getLogger("test")
+    logger.info("Routing %s to %s", "/users/me", "user-service", extra={"route": "/users"})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("Failed")
+    logger.debug("Not written")
+    stop_logging()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(lines) == 2
+    assert lines[0]["message"] == "Routing /users/me to user-service"
+    assert lines[0]["severity"] == "INFO"
+    assert lines[0]["service"] == "test-service"
+    assert lines[0]["route"] == "/users"
+    assert lines[0]["timestamp"].endswith("Z")
+    assert "ValueError: boom" in lines[1]["exception"]
+
+def test_text_format(restore_logging):
+    stream = io.StringIO()
+    configure_logging("test-service", level="INFO", log_format="text", stream=stream)
+    logging.getLogger("test").warning("Circuit for %s opened", "chat-service")
+    stop_logging()
+    assert stream.getvalue().rstrip().endswith("test - WARNING - Circuit for chat-service opened")
+
+def test_lazy_json_is_serialized_only_when_formatted():
+    calls = []
+    class Value:
+        def __str__(self):
+            calls.append(1)
+            return "value"
+
+    lazy = LazyJson({"tool": Value()})
+    assert calls == []
+    assert str(lazy) == '{"tool": "value"}'
+    assert calls == [1]
+
+def test_sampling_keeps_a_fraction_of_marked_info_records():
+    draws = iter([0.05, 0.5])
+    sampling = SamplingFilter(0.1, rand=lambda: next(draws))
+
+    def record(level, extra=None):
+        return logging.makeLogRecord({"levelno": level, **(extra or {})})
+
+    kept = record(logging.INFO, SAMPLED)
+    assert sampling.filter(kept)
+    assert kept.sample_rate == 0.1
+    assert not sampling.filter(record(logging.INFO, SAMPLED))
+    # Unmarked records and warnings are never dropped
+    assert sampling.filter(record(logging.INFO))
+    assert sampling.filter(record(logging.WARNING, SAMPLED))
+
+def test_records_of_sampled_traces_are_kept_with_their_ids(monkeypatch):
+    tracer = Tracer("test", InMemoryExporter(), sample_ratio=1.0)
+    monkeypatch.setattr("app.tracing._tracer", tracer)
+    sampling = SamplingFilter(0.0)
+    handler = logging_config.ContextQueueHandler(None)
+
+    with tracer.start_span("request") as span:
+        record = logging.makeLogRecord({"levelno": logging.INFO, **SAMPLED})
+        assert sampling.filter(record)
+        handler.prepare(record)
+    assert record.trace_id == span.context.trace_id
+    assert record.span_id == span.context.span_id
+    assert json.loads(JsonFormatter("test").format(record))["trace_id"] == span.context.trace_id
@@ -0,0 +1,105 @@
+"""Tests for the metrics registry and the /metrics endpoint"""
+import pytest
+
+from app import main
+from app.metrics import OVERFLOW_LABEL, Registry, timed
+from tests.conftest import AUTH_HEADERS
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    histogram.labels("/a").observe(0.05)
+    histogram.labels("/a").observe(0.5)
+    histogram.labels("/a").observe(5)
+
+    text = registry.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/a"} 3' in text
+    assert 'latency_seconds_sum{route="/a"} 5.55' in text
+
+def test_counter_and_gauge():
+    registry = Registry()
+    counter = registry.counter("requests", "Requests", ("status",))
+    gauge = registry.gauge("in_flight", "In flight")
+    counter.labels(status=200).inc()
+    counter.labels(status=200).inc(2)
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+
+    text = registry.render()
+    assert 'requests_total{status="200"} 3' in text
+    assert "in_flight 1" in text
+    with pytest.raises(ValueError):
+        counter.labels("200").inc(-1)
+
+def test_registry_returns_existing_metric():
+    registry = Registry()
+    assert registry.counter("requests", "Requests") is registry.counter("requests", "Requests")
+    with pytest.raises(ValueError):
+        registry.gauge("requests", "Requests")
+
+def test_series_are_bounded():
+    registry = Registry()
+    counter = registry.counter("requests", "Requests", ("path",), max_series=2)
+    for index in range(10):
+        counter.labels(f"/items/{index}").inc()
+
+    samples = {values: value for _, _, values, value in counter.samples()}
+    assert len(samples) == 3
+    assert samples[(OVERFLOW_LABEL,)] == 8
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("requests", "Requests", ("path",)).labels('a"b\\c').inc()
+    assert 'requests_total{path="a\\"b\\\\c"} 1' in registry.render()
+
+@pytest.mark.asyncio
+async def test_timed_records_outcome():
+    registry = Registry()
+    histogram = registry.histogram("calls_seconds", "Calls", ("operation", "outcome"))
+
+    @timed(histogram, operation="get")
+    async def get():
+        return 1
+
+    @timed(histogram, operation="get")
+    def fail():
+        raise RuntimeError("boom")
+
+    assert await get() == 1
+    with pytest.raises(RuntimeError):
+        fail()
+    assert histogram.labels("get", "success").count == 1
+    assert histogram.labels("get", "error").count == 1
+
+METRICS_HEADERS = {"Authorization": "Bearer scrape-token"}
+
+def test_metrics_endpoint_reports_routes_and_upstreams(client, backend, monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-token")
+    client.get("/api/users/u1/profile", headers=AUTH_HEADERS)
+    client.get("/api/users/u2/profile", headers=AUTH_HEADERS)
+
+    response = client.get("/metrics", headers=METRICS_HEADERS)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    # Proxied paths are labelled with the route prefix, not the raw path
+    assert 'http_requests_total{method="GET",route="/api/users",status="200"}' in text
+    assert "/api/users/u1" not in text
+    assert 'gateway_upstream_request_duration_seconds_count{service="user-service",upstream="http://user-service:8000",outcome="2xx"}' in text
+    assert 'http_requests_in_flight{method="GET"} 0' in text
+
+def test_metrics_endpoint_requires_the_metrics_token(client, monkeypatch):
+    # Not served at all without a token configured
+    monkeypatch.setattr(main, "METRICS_TOKEN", "")
+    assert client.get("/metrics", headers=METRICS_HEADERS).status_code == 404
+
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-token")
+    assert client.get("/metrics").status_code == 401
+    # A user's token is not enough
+    assert client.get("/metrics", headers=AUTH_HEADERS).status_code == 401
+    assert client.get("/metrics", headers=METRICS_HEADERS).status_code == 200
@@ -0,0 +1,63 @@
+"""Tests for the gateway authentication middleware"""
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from app.middleware import AuthMiddleware
+
+async def fake_verify(token):
+    if token == "bad":
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if token == "boom":
+        raise RuntimeError("verifier crashed")
+    return {"uid": f"user-{token}"}
+
+@pytest.fixture
+def app_client():
+    app = FastAPI()
+    app.add_middleware(AuthMiddleware, verify=fake_verify, public_paths={"/public"})
+
+    @app.api_route("/whoami", methods=["GET", "OPTIONS"])
+    async def whoami(request: Request):
+        return {"uid": getattr(request.state, "user", {}).get("uid")}
+
+    @app.get("/public")
+    async def public():
+        return {"ok": True}
+
+    return TestClient(app)
+
+def test_user_stored_in_request_state(app_client):
+    response = app_client.get("/whoami", headers={"Authorization": "Bearer 42"})
+
+    assert response.status_code == 200
+    assert response.json() == {"uid": "user-42"}
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Basic abc"}, {"Authorization": "Bearer "}])
+def test_missing_token_rejected(app_client, headers):
+    response = app_client.get("/whoami", headers=headers)
+
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Missing or invalid token"}
+    assert response.headers["www-authenticate"] == "Bearer"
+
+def test_verification_errors(app_client):
+    """Verifier errors are answered directly instead of surfacing as 500s"""
+    response = app_client.get("/whoami", headers={"Authorization": "Bearer bad"})
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Invalid token"}
+
+    response = app_client.get("/whoami", headers={"Authorization": "Bearer boom"})
+    assert response.status_code == 500
+    assert response.json() == {"detail": "Internal server error"}
+
+def test_public_paths_and_preflight_skip_auth(app_client):
+    assert app_client.get("/public").status_code == 200
+    assert app_client.options("/whoami").json() == {"uid": None}
+
+def test_gateway_rejections_carry_cors_headers(client):
+    """Gateway 401s are wrapped by CORS so browsers can read them"""
+    response = client.get("/api/users/u1", headers={"Origin": "http://localhost:3000"})
+
+    assert response.status_code == 401
+    assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
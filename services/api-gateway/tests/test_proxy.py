@@ -0,0 +1,80 @@
+"""Tests for request forwarding through the gateway"""
+import gzip
+import httpx
+import pytest
+
+from app import main
+from app.proxy import PROXY_MODE_BUFFERED
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+def test_forwards_raw_request_body(client, backend, proxy_mode):
+    """Request bodies are forwarded byte for byte, JSON or not"""
+    response = client.post(
+        "/api/files/projects/p1",
+        content=b"plain text body",
+        headers={**AUTH_HEADERS, "Content-Type": "text/plain"},
+    )
+    
+    assert response.status_code == 200
+    upstream_request = backend.requests[0]
+    assert upstream_request.content == b"plain text body"
+    assert upstream_request.headers["content-type"] == "text/plain"
+    assert str(upstream_request.url) == "http://file-service:8000/files/projects/p1"
+
+def test_passes_non_json_response_through(client, backend, proxy_mode):
+    """Non-JSON responses keep their status, headers and body"""
+    backend.handler = lambda request: upstream_response(
+        201,
+        content=b"<xml/>",
+        headers={"Content-Type": "application/xml", "X-Backend": "chat"},
+    )
+    
+    response = client.get("/api/chats/c1?limit=5&limit=6", headers=AUTH_HEADERS)
+    
+    assert response.status_code == 201
+    assert response.content == b"<xml/>"
+    assert response.headers["content-type"] == "application/xml"
+    assert response.headers["x-backend"] == "chat"
+    assert backend.requests[0].url.params.get_list("limit") == ["5", "6"]
+
+def test_compressed_body_is_not_decoded(client, backend, proxy_mode):
+    """Already-compressed upstream bodies are forwarded as-is"""
+    payload = gzip.compress(b'{"files": []}')
+    backend.handler = lambda request: upstream_response(
+        200,
+        content=payload,
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+    )
+    
+    with client.stream("GET", "/api/files/projects/p1", headers={**AUTH_HEADERS, "Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+    
+    assert response.headers["content-encoding"] == "gzip"
+    assert raw == payload
+
+def test_identity_headers_cannot_be_spoofed(client, backend, proxy_mode):
+    """Client supplied identity headers are replaced by the gateway"""
+    client.get("/api/users/me", headers={**AUTH_HEADERS, "X-User-ID": "someone-else"})
+    
+    upstream_request = backend.requests[0]
+    assert upstream_request.headers.get_list("x-user-id") == ["mock-user-id"]
+
+def test_buffered_mode_normalises_errors(client, backend, monkeypatch):
+    """Buffered mode maps upstream errors to a detail message"""
+    monkeypatch.setattr(main, "GATEWAY_PROXY_MODE", PROXY_MODE_BUFFERED)
+    backend.handler = lambda request: upstream_response(404, json_body={"detail": "Chat not found"})
+    
+    response = client.get("/api/chats/missing", headers=AUTH_HEADERS)
+    
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Chat not found"}
+
+def test_unreachable_service(client, backend):
+    """Connection failures surface as 503"""
+    def fail(request):
+        raise httpx.ConnectError("connection refused", request=request)
+    backend.handler = fail
+    
+    response = client.get("/api/agent/tools", headers=AUTH_HEADERS)
+    
+    assert response.status_code == 503
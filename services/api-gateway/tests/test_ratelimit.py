@@ -0,0 +1,110 @@
+"""Tests for gateway rate limiting"""
+import pytest
+
+from app import main
+from app.ratelimit import MemoryRateLimitBackend, RateLimiter, load_backend, retry_after_header
+from app.routing import PrefixRouter, RateLimit, Route, build_routes
+from tests.conftest import AUTH_HEADERS
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FailingBackend:
+    async def acquire(self, key, limit, cost=1.0):
+        raise ConnectionError("redis unavailable")
+
+    async def aclose(self):
+        pass
+
+def create_failing_backend():
+    return FailingBackend()
+
+@pytest.mark.asyncio
+async def test_bucket_refills_over_time():
+    clock = FakeClock()
+    backend = MemoryRateLimitBackend(clock=clock)
+    limit = RateLimit(rate=2, burst=3)
+
+    assert [await backend.acquire("u1", limit) for _ in range(3)] == [0, 0, 0]
+    assert await backend.acquire("u1", limit) == 0.5
+
+    clock.now = 1.0
+    assert [await backend.acquire("u1", limit) for _ in range(2)] == [0, 0]
+    assert await backend.acquire("u1", limit) > 0
+
+@pytest.mark.asyncio
+async def test_buckets_are_bounded():
+    backend = MemoryRateLimitBackend(max_buckets=2)
+    for user in ("u1", "u2", "u3"):
+        await backend.acquire(user, RateLimit(rate=1, burst=1))
+
+    assert len(backend) == 2
+    assert backend.evictions == 1
+
+@pytest.mark.asyncio
+async def test_route_limit_is_per_user():
+    limiter = RateLimiter(MemoryRateLimitBackend(clock=FakeClock()), user_limit=RateLimit(rate=100, burst=100))
+    agent = Route("/agent", "agent-service", rate_limit=RateLimit(rate=0.1, burst=2))
+    files = Route("/files", "file-service")
+
+    assert [await limiter.check("u1", agent) for _ in range(3)] == [0, 0, 10]
+    assert await limiter.check("u1", files) == 0
+    assert await limiter.check("u2", agent) == 0
+    assert limiter.stats()["limited"] == 1
+
+@pytest.mark.asyncio
+async def test_user_limit_refusals_keep_the_route_allowance():
+    """Requests refused by the overall limit do not use up the agent allowance"""
+    clock = FakeClock()
+    limiter = RateLimiter(MemoryRateLimitBackend(clock=clock), user_limit=RateLimit(rate=1, burst=1))
+    agent = Route("/agent", "agent-service", rate_limit=RateLimit(rate=0.01, burst=2))
+
+    assert await limiter.check("u1", agent) == 0
+    for _ in range(5):
+        assert await limiter.check("u1", agent) > 0
+
+    clock.now = 1.0
+    assert await limiter.check("u1", agent) == 0
+
+@pytest.mark.asyncio
+async def test_backend_failure_fails_open():
+    limiter = RateLimiter(load_backend("tests.test_ratelimit:create_failing_backend"), user_limit=RateLimit(1, 1))
+
+    assert await limiter.check("u1", Route("/files", "file-service")) == 0
+    assert limiter.stats()["backend_errors"] == 1
+
+def test_route_config_parses_rate_limit():
+    routes = build_routes({"/agent": "agent-service"}, {"/agent": {"rate_limit": {"rate": 0.2, "burst": 5}}})
+
+    assert routes[0].rate_limit == RateLimit(rate=0.2, burst=5)
+
+@pytest.mark.parametrize("rate_limit", [{"rate": 0, "burst": 5}, {"rate": 1, "burst": 0}, {"rate": -1, "burst": 5}])
+def test_non_positive_rate_limit_rejected(rate_limit):
+    with pytest.raises(ValueError):
+        build_routes({"/agent": "agent-service"}, {"/agent": {"rate_limit": rate_limit}})
+    with pytest.raises(ValueError):
+        RateLimiter(MemoryRateLimitBackend(), user_limit=RateLimit(**rate_limit))
+
+def test_retry_after_header():
+    assert retry_after_header(0.2) == "1"
+    assert retry_after_header(4.5) == "5"
+
+def test_gateway_returns_429(client, backend, monkeypatch):
+    monkeypatch.setattr(main, "router", PrefixRouter([
+        Route("/agent", "agent-service", rate_limit=RateLimit(rate=0.5, burst=2)),
+        Route("/files", "file-service"),
+    ]))
+
+    statuses = [client.post("/api/agent/run", json={}, headers=AUTH_HEADERS).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+    response = client.post("/api/agent/run", json={}, headers=AUTH_HEADERS)
+    assert response.headers["retry-after"] == "2"
+    assert response.json() == {"detail": "Too many requests"}
+    assert len(backend.requests) == 2
+
+    assert client.get("/api/files/f1", headers=AUTH_HEADERS).status_code == 200
@@ -0,0 +1,139 @@
+"""Tests for circuit breakers and retry budgets"""
+import httpx
+import pytest
+
+from app import main
+from app.resilience import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    RetryBudget,
+    backoff_delay,
+)
+from app.routing import PrefixRouter, RetryPolicy, Route
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_breaker(clock, **kwargs):
+    settings = dict(window_size=10, min_calls=4, failure_rate_threshold=0.5, slow_call_duration=1.0,
+                    slow_call_rate_threshold=0.75, open_duration=30, half_open_calls=2)
+    settings.update(kwargs)
+    return CircuitBreaker("chat-service", clock=clock, **settings)
+
+def test_opens_on_error_rate():
+    breaker = make_breaker(FakeClock())
+    for success in (True, False, True):
+        breaker.record(success, 0.1)
+    assert breaker.state == STATE_CLOSED
+
+    breaker.record(False, 0.1)
+
+    assert breaker.state == STATE_OPEN
+    assert breaker.trips == 1
+    assert not breaker.allow()
+
+def test_opens_on_slow_calls():
+    breaker = make_breaker(FakeClock())
+    for _ in range(4):
+        breaker.record(True, 2.0)
+
+    assert breaker.state == STATE_OPEN
+
+def test_half_open_closes_after_successful_trials():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        breaker.record(False, 0.1)
+
+    clock.now = 30
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow() and breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record(True, 0.1)
+    breaker.record(True, 0.1)
+    assert breaker.state == STATE_CLOSED
+
+def test_half_open_failure_reopens():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(4):
+        breaker.record(False, 0.1)
+
+    clock.now = 31
+    assert breaker.allow()
+    breaker.record(False, 0.1)
+
+    assert breaker.state == STATE_OPEN
+    assert breaker.trips == 2
+    assert breaker.retry_after == 30
+
+def test_released_trial_can_be_reused():
+    clock = FakeClock()
+    breaker = make_breaker(clock, half_open_calls=1)
+    for _ in range(4):
+        breaker.record(False, 0.1)
+    clock.now = 30
+
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+def test_retry_budget_limits_retries():
+    clock = FakeClock()
+    budget = RetryBudget(ratio=0.1, min_retries_per_second=0.2, window=10, clock=clock)
+    for _ in range(20):
+        budget.record_request()
+
+    # 0.2 * 10 + 0.1 * 20
+    assert [budget.try_retry() for _ in range(5)] == [True, True, True, True, False]
+
+    clock.now = 11
+    assert budget.try_retry()
+    assert budget.stats() == {"retries": 5, "exhausted": 1}
+
+def test_backoff_has_full_jitter():
+    policy = RetryPolicy(max_retries=5, backoff=0.1, max_backoff=0.3)
+
+    assert backoff_delay(policy, 1, rand=lambda: 1.0) == 0.1
+    assert backoff_delay(policy, 4, rand=lambda: 1.0) == 0.3
+    assert backoff_delay(policy, 2, rand=lambda: 0.5) == 0.1
+
+def test_gateway_fails_fast_when_circuit_open(client, backend, monkeypatch):
+    """Once a backend keeps failing the gateway stops calling it"""
+    monkeypatch.setattr(main, "circuit_breakers", {"chat-service": CircuitBreaker("chat-service", min_calls=3)})
+    backend.handler = lambda request: upstream_response(503, json_body={"detail": "down"})
+
+    for _ in range(3):
+        assert client.get("/api/chats/c1", headers=AUTH_HEADERS).status_code == 503
+    response = client.get("/api/chats/c1", headers=AUTH_HEADERS)
+
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+    assert len(backend.requests) == 3
+
+    health = client.get("/api/health").json()
+    assert health["circuit_breakers"]["chat-service"]["state"] == STATE_OPEN
+    assert health["circuit_breakers"]["chat-service"]["trips"] == 1
+
+def test_gateway_retries_within_budget(client, backend, monkeypatch):
+    monkeypatch.setattr(main, "router", PrefixRouter([
+        Route("/users", "user-service", retry=RetryPolicy(max_retries=3, backoff=0)),
+    ]))
+    monkeypatch.setattr(main, "retry_budgets", {"user-service": RetryBudget(ratio=0, min_retries_per_second=0.1)})
+
+    def handler(request):
+        raise httpx.ConnectError("refused")
+
+    backend.handler = handler
+
+    assert client.get("/api/users/u1", headers=AUTH_HEADERS).status_code == 503
+    # One retry allowed by the budget floor (0.1/s over 10s)
+    assert len(backend.requests) == 2
@@ -0,0 +1,156 @@
+"""Tests for the gateway response cache"""
+import asyncio
+import pytest
+
+from app import main
+from app.proxy import BufferedResponse
+from app.response_cache import (
+    CACHE_HIT,
+    CACHE_MISS,
+    CACHE_STALE,
+    ResponseCache,
+    cache_key,
+    etag_matches,
+    paths_related,
+)
+from app.routing import PrefixRouter, Route
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class Upstream:
+    """Fetch function counting calls and returning numbered responses"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return BufferedResponse(200, [("Content-Type", "application/json")], f'{{"n": {self.calls}}}'.encode())
+
+@pytest.mark.parametrize("a,b,related", [
+    ("/files/projects/p1", "/files/projects/p1", True),
+    ("/files/projects/p1", "/files/projects/p1/upload", True),
+    ("/files/projects", "/files/projects/p1", True),
+    ("/files/projects/p1", "/files/projects/p10", False),
+    ("/chats/c1", "/files/c1", False),
+])
+def test_paths_related(a, b, related):
+    assert paths_related(a, b) is related
+
+def test_etag_matching():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+def test_cache_key_ignores_query_order():
+    assert cache_key("u1", "/users/me/", [("b", "2"), ("a", "1")]) == cache_key("u1", "/users/me", [("a", "1"), ("b", "2")])
+    assert cache_key("u1", "/users/me", []) != cache_key("u2", "/users/me", [])
+
+@pytest.mark.asyncio
+async def test_hit_stale_and_revalidate():
+    clock = FakeClock()
+    cache = ResponseCache(clock=clock)
+    upstream = Upstream()
+    key = cache_key("u1", "/users/me", [])
+
+    response, status = await cache.get_or_fetch(key, upstream, ttl=5, stale_while_revalidate=30)
+    assert status == CACHE_MISS
+    assert response.header("etag")
+
+    _, status = await cache.get_or_fetch(key, upstream, ttl=5, stale_while_revalidate=30)
+    assert status == CACHE_HIT
+
+    clock.now = 10
+    response, status = await cache.get_or_fetch(key, upstream, ttl=5, stale_while_revalidate=30)
+    assert status == CACHE_STALE
+    assert response.content == b'{"n": 1}'
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    response, status = await cache.get_or_fetch(key, upstream, ttl=5, stale_while_revalidate=30)
+    assert status == CACHE_HIT
+    assert response.content == b'{"n": 2}'
+
+    clock.now = 100
+    _, status = await cache.get_or_fetch(key, upstream, ttl=5, stale_while_revalidate=30)
+    assert status == CACHE_MISS
+    assert upstream.calls == 3
+
+@pytest.mark.asyncio
+async def test_uncacheable_responses_not_stored():
+    cache = ResponseCache()
+
+    async def fetch():
+        return BufferedResponse(200, [("Cache-Control", "no-store")], b"{}")
+
+    await cache.get_or_fetch(cache_key("u1", "/a", []), fetch, ttl=5)
+    assert len(cache) == 0
+
+@pytest.mark.asyncio
+async def test_write_during_fetch_discards_response():
+    """A response fetched before a write completed is not stored"""
+    cache = ResponseCache()
+
+    async def fetch():
+        cache.invalidate("/files/projects/p1")
+        return BufferedResponse(200, [], b"[]")
+
+    await cache.get_or_fetch(cache_key("u1", "/files/projects/p1", []), fetch, ttl=5)
+    assert len(cache) == 0
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    for i in range(3):
+        cache.store(cache_key("u1", f"/a/{i}", []), BufferedResponse(200, [], b"x"), ttl=5)
+
+    assert len(cache) == 2
+    assert cache.lookup(cache_key("u1", "/a/0", [])) is None
+
+@pytest.fixture
+def cached_files(monkeypatch):
+    """Enable caching on /files for the gateway"""
+    monkeypatch.setattr(main, "router", PrefixRouter([Route("/files", "file-service", cache_ttl=60)]))
+    monkeypatch.setattr(main, "response_cache", ResponseCache())
+
+def test_gateway_serves_cached_responses(client, backend, cached_files):
+    first = client.get("/api/files/projects/p1", headers=AUTH_HEADERS)
+    second = client.get("/api/files/projects/p1", headers=AUTH_HEADERS)
+
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "HIT"
+    assert second.json() == first.json()
+    assert len(backend.requests) == 1
+
+def test_gateway_conditional_get(client, backend, cached_files):
+    etag = client.get("/api/files/projects/p1", headers=AUTH_HEADERS).headers["etag"]
+
+    response = client.get("/api/files/projects/p1", headers={**AUTH_HEADERS, "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+def test_gateway_write_invalidates_listing(client, backend, cached_files):
+    """Uploading to a project clears that project's cached file listing"""
+    client.get("/api/files/projects/p1", headers=AUTH_HEADERS)
+    client.get("/api/files/projects/p2", headers=AUTH_HEADERS)
+
+    client.post("/api/files/projects/p1", content=b"data", headers=AUTH_HEADERS)
+
+    assert client.get("/api/files/projects/p1", headers=AUTH_HEADERS).headers["x-cache"] == "MISS"
+    assert client.get("/api/files/projects/p2", headers=AUTH_HEADERS).headers["x-cache"] == "HIT"
+
+def test_gateway_does_not_cache_errors(client, backend, cached_files):
+    backend.handler = lambda request: upstream_response(404, json_body={"detail": "Project not found"})
+
+    assert client.get("/api/files/projects/p1", headers=AUTH_HEADERS).status_code == 404
+    assert client.get("/api/files/projects/p1", headers=AUTH_HEADERS).status_code == 404
+    assert len(backend.requests) == 2
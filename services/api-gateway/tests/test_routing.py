@@ -0,0 +1,148 @@
+"""Tests for longest-prefix route matching"""
+import httpx
+import pytest
+
+from app import main
+from app.ratelimit import MemoryRateLimitBackend, RateLimiter
+from app.routing import PrefixRouter, RateLimit, RetryPolicy, Route, build_routes, merge_route_settings
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+def make_router():
+    return PrefixRouter(build_routes(
+        {"/users": "user-service", "/files": "file-service"},
+        {"/files/projects": {"service": "project-service", "timeout": 30}},
+    ))
+
+@pytest.mark.parametrize("path,service", [
+    ("/users", "user-service"),
+    ("/users/", "user-service"),
+    ("/users/u1/profile", "user-service"),
+    ("/files/f1", "file-service"),
+    ("/files/projects/p1", "project-service"),
+    ("/files/projects", "project-service"),
+    ("/files//projects/p1", "project-service"),
+])
+def test_longest_prefix_wins(path, service):
+    assert make_router().match(path).service == service
+
+@pytest.mark.parametrize("path", ["/usersettings", "/", "", "/chats/c1", "/file"])
+def test_matches_on_segment_boundaries(path):
+    """Prefixes only match whole path segments"""
+    assert make_router().match(path) is None
+
+def test_route_settings():
+    route = make_router().match("/files/projects/p1")
+
+    assert route.timeout == 30
+    assert route.mode is None
+    assert route.retry == RetryPolicy()
+
+def test_later_route_replaces_earlier():
+    router = PrefixRouter([Route("/users", "a"), Route("/users", "b")])
+
+    assert router.match("/users/1").service == "b"
+    assert [route.service for route in router.routes] == ["b"]
+
+def test_param_segments_match_any_segment():
+    router = PrefixRouter([
+        Route("/chats", "chat-service"),
+        Route("/chats/{id}/messages", "messages"),
+        Route("/chats/archive/messages", "archive"),
+    ])
+
+    assert router.match("/chats/c1/messages").service == "messages"
+    assert router.match("/chats/c1/messages/m1").service == "messages"
+    assert router.match("/chats/c1").service == "chat-service"
+    assert router.match("/chats/archive/messages").service == "archive"
+    # The literal branch dead-ends, the parameter branch goes deeper
+    assert router.match("/chats/archive/other").service == "chat-service"
+
+def test_documented_route_settings_inherit_the_service():
+    """The settings examples in main.py need no service of their own"""
+    router = PrefixRouter(build_routes(main.PATH_TO_SERVICE, {
+        "/users/me": {"cache_ttl": 5, "stale_while_revalidate": 30},
+        "/files/projects/{id}": {"cache_ttl": 10},
+        "/chats/{id}/messages": {"hedge": {"percentile": 95, "max_delay": 1.0}},
+        "/chats/{id}/messages/{message_id}/reactions": {"timeout": 5},
+    }))
+
+    me = router.match("/users/me")
+    assert (me.service, me.cache_ttl, me.stale_while_revalidate) == ("user-service", 5, 30)
+    assert router.match("/users/u1").cache_ttl == 0
+    project = router.match("/files/projects/p1")
+    assert (project.service, project.prefix, project.cache_ttl) == ("file-service", "/files/projects/{id}", 10)
+    messages = router.match("/chats/c1/messages")
+    assert messages.service == "chat-service"
+    assert messages.hedge.max_delay == 1.0
+    assert router.match("/chats/c1/messages/m1/reactions").service == "chat-service"
+
+def test_nested_route_inherits_the_enclosing_settings():
+    """A settings entry for part of /agent keeps the agent limits it does not override"""
+    router = PrefixRouter(build_routes(main.PATH_TO_SERVICE, merge_route_settings(
+        main.ROUTE_SETTINGS, {"/agent/process": {"mode": "streaming"}},
+    )))
+    agent = router.match("/agent/chat")
+    process = router.match("/agent/process")
+
+    assert process.prefix == "/agent/process"
+    assert process.mode == "streaming"
+    assert process.service == "agent-service"
+    assert process.timeout == 120.0
+    assert process.priority == main.PRIORITY_LOW
+    assert process.rate_limit is not None
+    assert process.rate_limit == agent.rate_limit
+    assert process.rate_limit_scope == "/agent"
+
+@pytest.mark.asyncio
+async def test_nested_route_shares_the_inherited_rate_limit_bucket():
+    router = PrefixRouter(build_routes(
+        {"/agent": "agent-service"},
+        {"/agent": {"rate_limit": {"rate": 0.01, "burst": 2}}, "/agent/process": {"mode": "streaming"}},
+    ))
+    limiter = RateLimiter(MemoryRateLimitBackend())
+
+    assert await limiter.check("u1", router.match("/agent/chat")) == 0
+    assert await limiter.check("u1", router.match("/agent/process")) == 0
+    assert await limiter.check("u1", router.match("/agent/process")) > 0
+
+def test_nested_prefix_without_enclosing_route_needs_a_service():
+    with pytest.raises(ValueError):
+        build_routes({"/users": "user-service"}, {"/tasks/{id}": {"timeout": 5}})
+
+def test_route_settings_files_merge_fields():
+    """A file entry for a prefix keeps the default fields it does not mention"""
+    merged = merge_route_settings(
+        {"/agent": {"timeout": 120.0, "rate_limit": {"rate": 0.2, "burst": 5}}},
+        {"/agent": {"timeout": 60.0}, "/users/me": {"cache_ttl": 5}},
+    )
+
+    assert merged == {
+        "/agent": {"timeout": 60.0, "rate_limit": {"rate": 0.2, "burst": 5}},
+        "/users/me": {"cache_ttl": 5},
+    }
+    route = PrefixRouter(build_routes(main.PATH_TO_SERVICE, merged)).match("/agent/process")
+    assert route.rate_limit == RateLimit(rate=0.2, burst=5)
+
+def test_invalid_mode_rejected():
+    with pytest.raises(ValueError):
+        build_routes({"/users": "user-service"}, {"/users": {"mode": "chunked"}})
+
+def test_gateway_retries_idempotent_requests(client, backend, monkeypatch):
+    """Connection errors on GETs are retried according to the route's policy"""
+    monkeypatch.setattr(main, "router", PrefixRouter([
+        Route("/users", "user-service", retry=RetryPolicy(max_retries=2, backoff=0)),
+    ]))
+    failures = [httpx.ConnectError("refused")]
+
+    def handler(request):
+        if failures:
+            raise failures.pop()
+        return upstream_response(200, json_body={"ok": True})
+
+    backend.handler = handler
+
+    assert client.get("/api/users/u1", headers=AUTH_HEADERS).status_code == 200
+    assert len(backend.requests) == 2
+
+    failures.append(httpx.ConnectError("refused"))
+    assert client.post("/api/users/u1", headers=AUTH_HEADERS).status_code == 503
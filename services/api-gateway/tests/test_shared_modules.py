@@ -0,0 +1,21 @@
+"""The shared modules copied into each service must match shared/libs/python"""
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+SYNC_SCRIPT = Path(__file__).resolve().parents[3] / "shared" / "libs" / "sync_python.py"
+
+def load_sync():
+    if not SYNC_SCRIPT.exists():
+        pytest.skip("Not run from the GrantCraft repository")
+    spec = importlib.util.spec_from_file_location("sync_python", SYNC_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_shared_module_copies_match_their_source():
+    sync = load_sync()
+
+    stale = [str(path.relative_to(sync.ROOT)) for path in sync.stale_copies()]
+    assert stale == [], "Run python shared/libs/sync_python.py and commit the copies"
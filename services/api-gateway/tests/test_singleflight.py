@@ -0,0 +1,117 @@
+"""Tests for request coalescing"""
+import asyncio
+import pytest
+import httpx
+
+from app import main
+from app.singleflight import SingleFlight
+from app.upstream import UpstreamClients
+from tests.conftest import AUTH_HEADERS, upstream_response
+
+class SlowCall:
+    def __init__(self, delay=0.05, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.calls
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_result():
+    flight = SingleFlight()
+    call = SlowCall()
+
+    results = await asyncio.gather(*[flight.do("k", call) for _ in range(10)])
+
+    assert results == [1] * 10
+    assert call.calls == 1
+    assert flight.stats() == {"calls": 1, "collapsed": 9, "in_flight": 0}
+
+@pytest.mark.asyncio
+async def test_different_keys_not_shared():
+    flight = SingleFlight()
+    call = SlowCall()
+
+    await asyncio.gather(flight.do("a", call), flight.do("b", call))
+
+    assert call.calls == 2
+
+@pytest.mark.asyncio
+async def test_errors_shared_but_not_remembered():
+    flight = SingleFlight()
+    call = SlowCall(error=ValueError("upstream down"))
+
+    results = await asyncio.gather(*[flight.do("k", call) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+    call.error = None
+    assert await flight.do("k", call) == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_others():
+    flight = SingleFlight()
+    call = SlowCall()
+
+    first = asyncio.create_task(flight.do("k", call))
+    second = asyncio.create_task(flight.do("k", call))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == 1
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+@pytest.mark.asyncio
+async def test_call_cancelled_when_all_callers_leave():
+    flight = SingleFlight()
+    call = SlowCall(delay=10)
+
+    caller = asyncio.create_task(flight.do("k", call))
+    await asyncio.sleep(0.01)
+    caller.cancel()
+    await asyncio.sleep(0.01)
+
+    assert flight.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_new_caller_does_not_join_a_cancelled_call():
+    """A caller arriving while the last caller's call is being cancelled starts a new one"""
+    flight = SingleFlight()
+    call = SlowCall()
+
+    leader = asyncio.create_task(flight.do("k", call))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    await asyncio.sleep(0)
+
+    assert await flight.do("k", call) == 2
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+@pytest.mark.asyncio
+async def test_gateway_coalesces_identical_gets(monkeypatch):
+    """Concurrent identical GETs from one user reach the backend once"""
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        await asyncio.sleep(0.05)
+        return upstream_response(200, json_body={"id": "p1"})
+
+    clients = UpstreamClients(main.SERVICE_ENDPOINTS, transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(main, "upstream_clients", clients)
+    monkeypatch.setattr(main, "single_flight", SingleFlight())
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+        responses = await asyncio.gather(*[
+            client.get("/api/projects/p1", headers=AUTH_HEADERS) for _ in range(5)
+        ] + [client.get("/api/projects/p1?full=1", headers=AUTH_HEADERS)])
+
+    assert [response.json() for response in responses] == [{"id": "p1"}] * 6
+    assert len(requests) == 2
+    assert main.single_flight.collapsed == 4
@@ -0,0 +1,156 @@
+"""Tests for the verified token cache"""
+import asyncio
+import pytest
+from fastapi import HTTPException
+
+from app.token_cache import VerifiedTokenCache, hash_token
+
+class FakeClock:
+    """Manually advanced clock"""
+    
+    def __init__(self, now=1000.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+class FakeVerifier:
+    """Counts verifications and returns a user with a fixed exp"""
+    
+    def __init__(self, exp=None, delay=0.0, error=None):
+        self.calls = []
+        self.exp = exp
+        self.delay = delay
+        self.error = error
+    
+    async def __call__(self, token, check_revoked):
+        self.calls.append((token, check_revoked))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        claims = {"uid": "user-1"}
+        if self.exp is not None:
+            claims["exp"] = self.exp
+        return {"uid": "user-1", "token": claims}
+
+def make_cache(clock, **kwargs):
+    return VerifiedTokenCache(clock=clock, wall_clock=clock, **kwargs)
+
+@pytest.mark.asyncio
+async def test_hit_after_first_verification():
+    """Second lookup is served from cache"""
+    clock = FakeClock()
+    cache = make_cache(clock)
+    verifier = FakeVerifier()
+    
+    await cache.get_or_verify("token-a", verifier)
+    user = await cache.get_or_verify("token-a", verifier)
+    
+    assert user["uid"] == "user-1"
+    assert len(verifier.calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_entry_capped_by_exp_claim():
+    """Entries expire at the token's exp even when the ttl is longer"""
+    clock = FakeClock()
+    cache = make_cache(clock, ttl=300)
+    verifier = FakeVerifier(exp=clock.now + 10)
+    
+    await cache.get_or_verify("token-a", verifier)
+    clock.now += 11
+    await cache.get_or_verify("token-a", verifier)
+    
+    assert len(verifier.calls) == 2
+
+@pytest.mark.asyncio
+async def test_lru_eviction():
+    """Least recently used tokens are evicted at max_size"""
+    clock = FakeClock()
+    cache = make_cache(clock, max_size=2)
+    verifier = FakeVerifier()
+    
+    await cache.get_or_verify("token-a", verifier)
+    await cache.get_or_verify("token-b", verifier)
+    await cache.get_or_verify("token-a", verifier)
+    await cache.get_or_verify("token-c", verifier)
+    
+    assert cache.stats()["evictions"] == 1
+    await cache.get_or_verify("token-b", verifier)
+    assert [call[0] for call in verifier.calls] == ["token-a", "token-b", "token-c", "token-b"]
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_are_collapsed():
+    """Concurrent requests with the same token share one verification"""
+    cache = VerifiedTokenCache()
+    verifier = FakeVerifier(delay=0.01)
+    
+    results = await asyncio.gather(*[cache.get_or_verify("token-a", verifier) for _ in range(5)])
+    
+    assert len(verifier.calls) == 1
+    assert all(result["uid"] == "user-1" for result in results)
+    assert cache.stats()["collapsed"] == 4
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_fail_waiters():
+    """The request that started a verification may be cancelled without failing the others"""
+    cache = VerifiedTokenCache()
+    verifier = FakeVerifier(delay=0.05)
+
+    leader = asyncio.create_task(cache.get_or_verify("token-a", verifier))
+    waiter = asyncio.create_task(cache.get_or_verify("token-a", verifier))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    await asyncio.sleep(0)
+    late = asyncio.create_task(cache.get_or_verify("token-a", verifier))
+
+    assert (await waiter)["uid"] == "user-1"
+    assert (await late)["uid"] == "user-1"
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    assert len(verifier.calls) == 1
+    # The shared verification still filled the cache
+    await cache.get_or_verify("token-a", verifier)
+    assert cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_failures_are_not_cached():
+    """Failed verifications propagate to every waiter and are retried next time"""
+    cache = VerifiedTokenCache()
+    verifier = FakeVerifier(delay=0.01, error=HTTPException(status_code=401, detail="Invalid token"))
+    
+    results = await asyncio.gather(
+        *[cache.get_or_verify("bad-token", verifier) for _ in range(3)],
+        return_exceptions=True
+    )
+    
+    assert all(isinstance(result, HTTPException) for result in results)
+    assert len(verifier.calls) == 1
+    
+    with pytest.raises(HTTPException):
+        await cache.get_or_verify("bad-token", verifier)
+    assert len(verifier.calls) == 2
+    assert cache.stats()["size"] == 0
+
+@pytest.mark.asyncio
+async def test_revocation_check_interval():
+    """Entries older than the interval are re-verified with check_revoked"""
+    clock = FakeClock()
+    cache = make_cache(clock, revocation_check_interval=60)
+    verifier = FakeVerifier()
+    
+    await cache.get_or_verify("token-a", verifier)
+    clock.now += 30
+    await cache.get_or_verify("token-a", verifier)
+    clock.now += 31
+    await cache.get_or_verify("token-a", verifier)
+    
+    assert verifier.calls == [("token-a", False), ("token-a", True)]
+    assert cache.stats()["revocation_checks"] == 1
+
+def test_keys_are_hashed():
+    """Raw tokens are never stored"""
+    assert hash_token("token-a") != "token-a"
+    assert len(hash_token("token-a")) == 64
@@ -0,0 +1,215 @@
+"""Tests for the negative token cache and per-client failure counters"""
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from app import auth
+from app.jwt_verifier import SigningKeysUnavailableError
+from app.middleware import AuthMiddleware, client_address
+from app.token_guard import FailureTracker, NegativeTokenCache
+
+class FakeClock:
+    """Manually advanced clock"""
+    
+    def __init__(self, now=1000.0):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+def test_rejected_token_expires():
+    clock = FakeClock()
+    cache = NegativeTokenCache(ttl=60, clock=clock)
+    cache.add("bad-token", 401, "Invalid token")
+
+    error = cache.get("bad-token")
+    assert (error.status_code, error.detail) == (401, "Invalid token")
+    assert cache.get("other-token") is None
+
+    clock.now += 61
+    assert cache.get("bad-token") is None
+    assert cache.stats()["size"] == 0
+
+def test_check_raises_cached_error():
+    cache = NegativeTokenCache()
+    cache.check("bad-token")
+
+    cache.add("bad-token", 401, "Token has been revoked", {"WWW-Authenticate": "Bearer"})
+    with pytest.raises(HTTPException) as exc_info:
+        cache.check("bad-token")
+    assert exc_info.value.status_code == 401
+    assert exc_info.value.detail == "Token has been revoked"
+    assert exc_info.value.headers == {"WWW-Authenticate": "Bearer"}
+    assert cache.stats()["hits"] == 1
+
+def test_cache_is_bounded():
+    cache = NegativeTokenCache(max_size=2)
+    for token in ("a", "b", "c"):
+        cache.add(token, 401, "Invalid token")
+
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_raw_tokens_are_not_stored():
+    cache = NegativeTokenCache()
+    cache.add("secret-token", 401, "Invalid token")
+
+    assert "secret-token" not in cache._entries
+
+def test_client_blocked_after_repeated_failures():
+    clock = FakeClock()
+    tracker = FailureTracker(max_failures=3, window=60, block_duration=300, clock=clock)
+
+    for _ in range(2):
+        tracker.record_failure("10.0.0.1")
+    assert tracker.blocked("10.0.0.1") == 0
+
+    tracker.record_failure("10.0.0.1")
+    assert tracker.blocked("10.0.0.1") == 300
+    assert tracker.blocked("10.0.0.2") == 0
+
+    clock.now += 301
+    assert tracker.blocked("10.0.0.1") == 0
+    assert tracker.stats()["blocks"] == 1
+
+def test_failures_outside_window_and_successes_reset_the_count():
+    clock = FakeClock()
+    tracker = FailureTracker(max_failures=3, window=60, clock=clock)
+
+    tracker.record_failure("10.0.0.1")
+    tracker.record_failure("10.0.0.1")
+    clock.now += 61
+    tracker.record_failure("10.0.0.1")
+    assert tracker.blocked("10.0.0.1") == 0
+
+    tracker.record_failure("10.0.0.1")
+    tracker.record_success("10.0.0.1")
+    tracker.record_failure("10.0.0.1")
+    assert tracker.blocked("10.0.0.1") == 0
+
+def test_tracked_clients_are_bounded():
+    tracker = FailureTracker(max_clients=2)
+    for client in ("a", "b", "c"):
+        tracker.record_failure(client)
+
+    assert tracker.stats()["tracked_clients"] == 2
+
+@pytest.fixture
+def guarded_client():
+    calls = []
+
+    async def verify(token):
+        calls.append(token)
+        if token == "bad":
+            raise HTTPException(status_code=401, detail="Invalid token")
+        return {"uid": f"user-{token}"}
+
+    app = FastAPI()
+    app.add_middleware(AuthMiddleware, verify=verify, failures=FailureTracker(max_failures=3, block_duration=30))
+
+    @app.get("/whoami")
+    async def whoami(request: Request):
+        return {"uid": request.state.user["uid"]}
+
+    client = TestClient(app)
+    client.calls = calls
+    return client
+
+def test_blocked_client_is_refused_before_verification(guarded_client):
+    for _ in range(3):
+        assert guarded_client.get("/whoami", headers={"Authorization": "Bearer bad"}).status_code == 401
+
+    response = guarded_client.get("/whoami", headers={"Authorization": "Bearer good"})
+
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many failed authentication attempts"}
+    assert response.headers["retry-after"] == "30"
+    assert guarded_client.calls == ["bad"] * 3
+
+def test_missing_tokens_do_not_count_as_failures(guarded_client):
+    for _ in range(3):
+        assert guarded_client.get("/whoami").status_code == 401
+
+    assert guarded_client.get("/whoami", headers={"Authorization": "Bearer good"}).status_code == 200
+
+def test_clients_behind_one_proxy_are_blocked_separately():
+    """Behind a proxy every request has the proxy's peer address; X-Forwarded-For tells the clients apart"""
+    async def verify(token):
+        if token == "bad":
+            raise HTTPException(status_code=401, detail="Invalid token")
+        return {"uid": f"user-{token}"}
+
+    app = FastAPI()
+    app.add_middleware(
+        AuthMiddleware,
+        verify=verify,
+        failures=FailureTracker(max_failures=3, block_duration=30),
+        trusted_proxy_hops=1,
+    )
+
+    @app.get("/whoami")
+    async def whoami(request: Request):
+        return {"uid": request.state.user["uid"]}
+
+    client = TestClient(app)  # every request comes from the same peer, "testclient"
+
+    def get(forwarded_for, token):
+        return client.get(
+            "/whoami",
+            headers={"Authorization": f"Bearer {token}", "X-Forwarded-For": forwarded_for},
+        )
+
+    for _ in range(3):
+        assert get("203.0.113.9", "bad").status_code == 401
+    assert get("203.0.113.9", "good").status_code == 429
+    # A spoofed leftmost entry does not get the abuser out of the block
+    assert get("10.0.0.1, 203.0.113.9", "good").status_code == 429
+
+    for i in range(50):
+        assert get(f"198.51.100.{i}", "good").status_code == 200
+
+def test_client_address_uses_trusted_hops():
+    scope = {"client": ("10.1.0.1", 1234), "headers": [(b"x-forwarded-for", b"1.1.1.1, 2.2.2.2, 3.3.3.3")]}
+
+    assert client_address(scope) == "10.1.0.1"
+    assert client_address(scope, trusted_proxy_hops=1) == "3.3.3.3"
+    assert client_address(scope, trusted_proxy_hops=2) == "2.2.2.2"
+    assert client_address({"client": ("10.1.0.1", 1234), "headers": []}, trusted_proxy_hops=1) is None
+
+@pytest.mark.asyncio
+async def test_gateway_remembers_invalid_tokens(monkeypatch):
+    """A token rejected by the verifier is rejected again without verifying it"""
+    calls = []
+
+    class Verifier:
+        async def verify(self, token):
+            calls.append(token)
+            raise auth.TokenVerificationError("Invalid signature")
+
+    monkeypatch.setattr(auth, "local_verifier", Verifier())
+
+    for _ in range(3):
+        with pytest.raises(HTTPException) as exc_info:
+            await auth.verify_token("forged-token")
+        assert exc_info.value.detail == "Invalid token"
+
+    assert calls == ["forged-token"]
+
+@pytest.mark.asyncio
+async def test_gateway_does_not_remember_unavailable_keys(monkeypatch):
+    """Failures that say nothing about the token are retried"""
+    calls = []
+
+    class Verifier:
+        async def verify(self, token):
+            calls.append(token)
+            raise SigningKeysUnavailableError("Token signing keys are unavailable")
+
+    monkeypatch.setattr(auth, "local_verifier", Verifier())
+
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await auth.verify_token("some-token")
+
+    assert calls == ["some-token", "some-token"]
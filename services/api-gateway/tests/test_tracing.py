@@ -0,0 +1,119 @@
+"""Tests for trace context propagation and spans"""
+import asyncio
+
+import pytest
+
+from app import tracing
+from app.tracing import InMemoryExporter, Tracer, inject, parse_traceparent, start_span, traced
+from tests.conftest import AUTH_HEADERS
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+@pytest.fixture
+def exporter(monkeypatch):
+    """Record every span with the process-wide tracer"""
+    exporter = InMemoryExporter()
+    monkeypatch.setattr(tracing, "_tracer", Tracer("api-gateway", exporter, sample_ratio=1.0))
+    return exporter
+
+def test_parse_traceparent():
+    context = parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01")
+    assert (context.trace_id, context.span_id, context.sampled) == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00").sampled is False
+
+    assert parse_traceparent(None) is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+    assert parse_traceparent(f"ff-{TRACE_ID}-{PARENT_ID}-01") is None
+
+def test_spans_nest_under_the_current_span(exporter):
+    with start_span("outer") as outer:
+        with start_span("inner") as inner:
+            pass
+
+    assert inner.context.trace_id == outer.context.trace_id
+    assert inner.parent_id == outer.context.span_id
+    assert outer.parent_id is None
+    assert [span.name for span in exporter.spans] == ["inner", "outer"]
+    assert tracing.current_span() is None
+
+def test_sampling():
+    exporter = InMemoryExporter()
+    tracer = Tracer("svc", exporter, sample_ratio=0.0)
+    with tracer.start_span("dropped") as span:
+        assert not span.recording
+    assert len(exporter.spans) == 0
+
+    # A sampled remote parent is always recorded
+    with tracer.start_span("kept", parent=parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01")) as span:
+        pass
+    assert span.context.trace_id == TRACE_ID
+    assert len(exporter.spans) == 1
+
+def test_sample_ratio_is_roughly_respected():
+    tracer = Tracer("svc", InMemoryExporter(), sample_ratio=0.25)
+    sampled = 0
+    for _ in range(2000):
+        with tracer.start_span("request") as span:
+            sampled += span.recording
+    assert 350 < sampled < 650
+
+@pytest.mark.asyncio
+async def test_traced_records_errors_and_follows_tasks(exporter):
+    @traced("child")
+    async def child():
+        await asyncio.sleep(0)
+
+    @traced("failing")
+    def failing():
+        raise ValueError("boom")
+
+    with start_span("parent") as parent:
+        await asyncio.create_task(child())
+        with pytest.raises(ValueError):
+            failing()
+
+    spans = {span.name: span for span in exporter.spans}
+    assert spans["child"].parent_id == parent.context.span_id
+    assert spans["failing"].status == tracing.STATUS_ERROR
+    assert spans["failing"].attributes["error.type"] == "ValueError"
+
+def test_inject_replaces_traceparent(exporter):
+    with start_span("call") as span:
+        headers = inject([("traceparent", f"00-{TRACE_ID}-{PARENT_ID}-01"), ("accept", "*/*")])
+    assert headers == [("accept", "*/*"), ("traceparent", span.context.traceparent())]
+
+def test_gateway_propagates_trace_to_backend(client, backend, exporter, proxy_mode):
+    response = client.get(
+        "/api/users/me",
+        headers={**AUTH_HEADERS, "traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"},
+    )
+    assert response.status_code == 200
+
+    upstream_context = parse_traceparent(backend.requests[0].headers["traceparent"])
+    assert upstream_context.trace_id == TRACE_ID
+    assert upstream_context.span_id != PARENT_ID
+
+    spans = {span.name: span for span in exporter.spans}
+    server = spans["GET /api/users"]
+    upstream = spans["GET user-service"]
+    assert server.parent_id == PARENT_ID
+    assert server.attributes["http.status_code"] == 200
+    assert upstream.parent_id == server.context.span_id
+    assert upstream.context.span_id == upstream_context.span_id
+    assert spans["auth verify_token"].parent_id == server.context.span_id
+
+def test_gateway_decides_sampling_for_incoming_traces(client, backend, monkeypatch, proxy_mode):
+    exporter = InMemoryExporter()
+    monkeypatch.setattr(tracing, "_tracer", Tracer("api-gateway", exporter, sample_ratio=0.0))
+    response = client.get(
+        "/api/users/me",
+        headers={**AUTH_HEADERS, "traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"},
+    )
+    assert response.status_code == 200
+
+    upstream_context = parse_traceparent(backend.requests[0].headers["traceparent"])
+    assert upstream_context.trace_id == TRACE_ID
+    assert upstream_context.sampled is False
+    assert not exporter.spans
@@ -0,0 +1,46 @@
+"""Tests for the pooled upstream client registry"""
+import httpx
+import pytest
+from app.upstream import UpstreamClients
+
+ENDPOINTS = {
+    "user-service": "http://user-service:8000",
+    "chat-service": "http://chat-service:8000",
+}
+
+def make_transport():
+    """Transport that answers every request with 200"""
+    return httpx.MockTransport(lambda request: httpx.Response(200, json={"url": str(request.url)}))
+
+def test_get_returns_same_client_per_service():
+    """Each service gets one long-lived client"""
+    clients = UpstreamClients(ENDPOINTS, transport=make_transport())
+    
+    assert clients.get("user-service") is clients.get("user-service")
+    assert clients.get("user-service") is not clients.get("chat-service")
+
+def test_get_unknown_service():
+    """Unknown services are rejected"""
+    clients = UpstreamClients(ENDPOINTS, transport=make_transport())
+    
+    with pytest.raises(KeyError):
+        clients.get("project-service")
+
+def test_http2_falls_back_without_h2(monkeypatch):
+    """HTTP/2 is only enabled when the h2 package is available"""
+    monkeypatch.setattr("app.upstream._http2_available", lambda: False)
+    clients = UpstreamClients(ENDPOINTS, http2=True, transport=make_transport())
+    
+    assert clients.http2 is False
+
+@pytest.mark.asyncio
+async def test_aclose_closes_clients():
+    """Shutdown closes every pooled client"""
+    clients = UpstreamClients(ENDPOINTS, transport=make_transport())
+    client = clients.get("user-service")
+    
+    response = await client.get("http://user-service:8000/users/me")
+    assert response.status_code == 200
+    
+    await clients.aclose()
+    assert client.is_closed
@@ -1,11 +1,24 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from firebase_admin import auth, credentials
-from typing import Dict, Any
-import firebase_admin
+from typing import Dict, Any, Optional
 import json
 import os
 from .config import settings
+from .lazy import Lazy, lazy_import
+from .token_guard import NegativeTokenCache
+from .identity import IDENTITY_HEADER, InternalIdentityError, create_identity_verifier_from_env
+from .jwt_verifier import (
+    ExpiredTokenError,
+    SigningKeysUnavailableError,
+    TokenVerificationError,
+    create_verifier_from_env,
+    user_data_from_claims,
+)
+
+# The Firebase Admin SDK is imported on first use
+firebase_admin = lazy_import("firebase_admin")
+auth = lazy_import("firebase_admin.auth")
+credentials = lazy_import("firebase_admin.credentials")
 
 # Initialize Firebase Admin SDK
 firebase_initialized = False
@@ -45,16 +58,52 @@ def initialize_firebase():
             detail="Could not initialize Firebase authentication"
         )
 
-# Initialize Firebase when the module is loaded
-initialize_firebase()
+# Initialized on first use or by the startup warm-up, not when the module is loaded
+firebase = Lazy("firebase", initialize_firebase)
 
 # Bearer token extractor
-security = HTTPBearer()
+# Optional, as requests from the gateway may carry an identity assertion instead
+security = HTTPBearer(auto_error=False)
+
+# Local verification against cached signing keys (FIREBASE_LOCAL_VERIFY=true)
+local_verifier = create_verifier_from_env(settings.FIREBASE_PROJECT_ID)
+
+# Users vouched for by the gateway in a signed X-Internal-Identity header are
+# trusted without verifying their Firebase token again
+identity_verifier = create_identity_verifier_from_env("chat-service")
+
+# Tokens that failed verification for good are rejected again without any
+# verification. Failures are not counted per client here: behind the gateway
+# every request comes from the gateway's address.
+rejected_tokens = NegativeTokenCache(
+    max_size=int(os.getenv("NEGATIVE_TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("NEGATIVE_TOKEN_CACHE_TTL", "60")),
+)
 
 async def verify_token(token: str) -> Dict[str, Any]:
     """
     Verify Firebase ID token and return user data
     """
+    rejected_tokens.check(token)
+    
+    if local_verifier:
+        try:
+            claims = await local_verifier.verify(token)
+        except ExpiredTokenError:
+            raise rejected_tokens.reject(token, "Token has expired")
+        except SigningKeysUnavailableError as e:
+            # Says nothing about the token, so it is not remembered
+            print(f"Error verifying token: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token"
+            )
+        except TokenVerificationError as e:
+            print(f"Error verifying token: {str(e)}")
+            raise rejected_tokens.reject(token, "Invalid token")
+        return user_data_from_claims(claims)
+    
+    await firebase.aget()
     try:
         # Verify the token
         decoded_token = auth.verify_id_token(token)
@@ -74,33 +123,41 @@ async def verify_token(token: str) -> Dict[str, Any]:
         
         return user_data
     except auth.ExpiredIdTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired"
-        )
+        raise rejected_tokens.reject(token, "Token has expired")
     except auth.RevokedIdTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has been revoked"
-        )
+        raise rejected_tokens.reject(token, "Token has been revoked")
     except auth.InvalidIdTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
+        raise rejected_tokens.reject(token, "Invalid token")
     except Exception as e:
+        # Possibly transient (Firebase unreachable, user lookup failed), so not remembered
         print(f"Error verifying token: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials"
         )
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+async def get_current_user(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+) -> Dict[str, Any]:
     """
-    Get current user from the Authorization header
+    Get current user from the gateway's identity assertion, or else the Authorization header
     """
-    token = credentials.credentials
-    return await verify_token(token)
+    if identity_verifier:
+        assertion = request.headers.get(IDENTITY_HEADER)
+        if assertion:
+            try:
+                return identity_verifier.verify(assertion)
+            except InternalIdentityError as e:
+                print(f"Rejected identity assertion: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid identity assertion"
+                )
+    
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authenticated")
+    return await verify_token(credentials.credentials)
 
 def get_user_from_header(x_user_id: str = None, x_user_email: str = None) -> Dict[str, Any]:
     """
@@ -1,11 +1,69 @@
-from google.cloud import firestore
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime
+import base64
+import json
 import os
 from .config import settings
+from .lazy import Lazy, lazy_import
+from .metrics import REGISTRY, timed
+from .tracing import SPAN_KIND_CLIENT, traced
 
-# Initialize Firestore client
-db = firestore.Client(project=settings.GCP_PROJECT_ID) if settings.GCP_PROJECT_ID else firestore.Client()
+# Latency of Firestore calls by method; failures are labelled outcome="error"
+FIRESTORE_LATENCY = REGISTRY.histogram(
+    "firestore_operation_duration_seconds",
+    "Latency of Firestore operations in seconds",
+    ("operation", "outcome"),
+)
+# Attributes of the span around each Firestore call
+FIRESTORE_SPAN = {"db.system": "firestore"}
+
+# The Firestore library is imported and the client created on first use
+firestore = lazy_import("google.cloud.firestore")
+
+def create_firestore_client():
+    return firestore.Client(project=settings.GCP_PROJECT_ID) if settings.GCP_PROJECT_ID else firestore.Client()
+
+db = Lazy("firestore", create_firestore_client)
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor is malformed"""
+
+def encode_cursor(timestamp: Optional[datetime], message_id: str) -> str:
+    """
+    Encode the position after a message as an opaque cursor
+    
+    Args:
+        timestamp: The message timestamp, None for legacy messages stored with a null timestamp
+        message_id: The message ID, which breaks ties between equal timestamps
+        
+    Returns:
+        URL-safe cursor token
+    """
+    payload = json.dumps(
+        {"t": timestamp.isoformat() if timestamp is not None else None, "id": message_id},
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    """
+    Decode a cursor created by encode_cursor
+    
+    Args:
+        cursor: The cursor token
+        
+    Returns:
+        Tuple of (timestamp, message ID)
+        
+    Raises:
+        InvalidCursorError: If the cursor is malformed
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        timestamp = datetime.fromisoformat(payload["t"]) if payload["t"] is not None else None
+        return timestamp, str(payload["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
 
 class FirestoreClient:
     """
@@ -14,10 +72,16 @@ class FirestoreClient:
     
     def __init__(self):
         """Initialize the Firestore client"""
-        self.db = db
         self.chats_collection = settings.FIRESTORE_COLLECTION_CHATS
         self.messages_collection = settings.FIRESTORE_COLLECTION_MESSAGES
     
+    @property
+    def db(self):
+        """The shared Firestore client, created on first use"""
+        return db.get()
+    
+    @traced("firestore get_chat", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="get_chat")
     async def get_chat(self, chat_id: str) -> Optional[Dict[str, Any]]:
         """
         Get a chat by ID
@@ -38,6 +102,8 @@ class FirestoreClient:
         
         return None
     
+    @traced("firestore list_chats", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="list_chats")
     async def list_chats(self, project_id: str) -> List[Dict[str, Any]]:
         """
         List chats for a project
@@ -58,6 +124,8 @@ class FirestoreClient:
         
         return chats
     
+    @traced("firestore create_chat", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="create_chat")
     async def create_chat(self, chat_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Create a new chat
@@ -83,6 +151,8 @@ class FirestoreClient:
         
         return result
     
+    @traced("firestore update_chat", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="update_chat")
     async def update_chat(self, chat_id: str, chat_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
         Update a chat
@@ -112,6 +182,8 @@ class FirestoreClient:
         
         return updated_chat
     
+    @traced("firestore delete_chat", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="delete_chat")
     async def delete_chat(self, chat_id: str) -> bool:
         """
         Delete a chat
@@ -144,6 +216,8 @@ class FirestoreClient:
         
         return True
     
+    @traced("firestore get_message", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="get_message")
     async def get_message(self, message_id: str) -> Optional[Dict[str, Any]]:
         """
         Get a message by ID
@@ -164,40 +238,66 @@ class FirestoreClient:
         
         return None
     
-    async def list_messages(self, chat_id: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    @traced("firestore list_messages", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="list_messages")
+    async def list_messages(
+        self,
+        chat_id: str,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
         """
-        List messages for a chat
+        List messages for a chat, newest first, one page at a time
+        
+        Pages are ordered by (timestamp, id) and continue after the cursor's
+        position with start_after, so a page costs the same however deep in
+        the history it is. Legacy messages with a null timestamp sort after
+        all others; messages without the field at all are not returned by a
+        query ordered on it.
         
         Args:
             chat_id: The chat ID
             limit: Maximum number of messages to return
-            offset: Number of messages to skip
+            cursor: Cursor returned with the previous page
+            offset: Number of messages to skip (deprecated, Firestore still reads the skipped messages)
             
         Returns:
-            List of message documents
+            Tuple of (message documents, cursor of the next page or None on the last page)
+            
+        Raises:
+            InvalidCursorError: If the cursor is malformed
         """
         messages_ref = (
             self.db.collection(self.messages_collection)
             .where("chatId", "==", chat_id)
             .order_by("timestamp", direction=firestore.Query.DESCENDING)
-            .limit(limit)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)
         )
+        if cursor:
+            timestamp, message_id = decode_cursor(cursor)
+            messages_ref = messages_ref.start_after({"timestamp": timestamp, "__name__": message_id})
+        elif offset > 0:
+            messages_ref = messages_ref.offset(offset)
         
-        # Handle offset by fetching all and slicing (not ideal for large datasets)
-        # In a production system, we'd use cursor pagination
+        # One extra message tells whether there is a next page
         messages = []
-        
-        for message_doc in messages_ref.stream():
+        for message_doc in messages_ref.limit(limit + 1).stream():
             message_data = message_doc.to_dict()
             message_data["id"] = message_doc.id
             messages.append(message_data)
         
-        # Apply offset in memory (not ideal for large offsets)
-        if offset > 0:
-            messages = messages[offset:] if offset < len(messages) else []
+        next_cursor = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            last = messages[-1]
+            timestamp = last.get("timestamp")
+            next_cursor = encode_cursor(timestamp if isinstance(timestamp, datetime) else None, last["id"])
         
-        return messages
+        return messages, next_cursor
     
+    @traced("firestore create_message", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="create_message")
     async def create_message(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Create a new message
@@ -227,6 +327,8 @@ class FirestoreClient:
         
         return result
     
+    @traced("firestore update_message", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="update_message")
     async def update_message(self, message_id: str, message_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
         Update a message
@@ -253,6 +355,8 @@ class FirestoreClient:
         
         return updated_message
     
+    @traced("firestore delete_message", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="delete_message")
     async def delete_message(self, message_id: str) -> bool:
         """
         Delete a message
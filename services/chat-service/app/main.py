@@ -1,12 +1,25 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional, Dict, Any
 import os
 
+from app.metrics import MetricsMiddleware, metrics_response
+from app.tracing import TracingMiddleware, configure_tracing
+from app.deadline import DeadlineMiddleware
+from app.lazy import start_warm_up
+from app.logging_config import configure_logging
+
+# JSON logs written by a background thread
+configure_logging("chat-service")
+
+# Continue traces started by the gateway
+configure_tracing("chat-service")
+
 try:
     # Use absolute imports instead of relative
     from app.config import settings
-    from app.models import Chat, Message, CreateChatRequest, CreateMessageRequest
+    from app.models import Chat, Message, MessagePage, CreateChatRequest, CreateMessageRequest
+    from app.database import InvalidCursorError
     from app.services import ChatService
     from app.auth import get_current_user
     
@@ -53,12 +66,27 @@ except Exception as e:
         allow_headers=["*"],
     )
 
+# Request deadlines from the gateway, tracing and metrics - Always available
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+# Google clients are created on first use; warm them up once the service is running
+@app.on_event("startup")
+async def warm_up_clients():
+    await start_warm_up()
+
 # Health check endpoint - Always available
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "ok", "service": "chat-service"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics"""
+    return metrics_response()
+
 # Rest of the code will only use the chat_service if it's initialized
 # Chat endpoints
 try:
@@ -122,16 +150,19 @@ try:
             raise HTTPException(status_code=500, detail=str(e))
     
     # Message endpoints
-    @app.get("/chats/{chat_id}/messages", response_model=List[Message])
+    @app.get("/chats/{chat_id}/messages", response_model=MessagePage)
     async def list_messages(
         chat_id: str,
-        limit: Optional[int] = 50,
-        offset: Optional[int] = 0,
+        limit: int = Query(50, ge=1, le=100),
+        cursor: Optional[str] = None,
+        offset: Optional[int] = Query(0, ge=0),
         user: Dict[str, Any] = Depends(get_current_user)
     ):
-        """List messages for a chat session"""
+        """List messages for a chat session, newest first. Pass `next_cursor` as `cursor` for the next page."""
         try:
-            return await chat_service.list_messages(chat_id, user["uid"], limit, offset)
+            return await chat_service.list_messages(chat_id, user["uid"], limit, cursor, offset)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
     
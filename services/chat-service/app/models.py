@@ -49,6 +49,13 @@ class Message(BaseModel):
     toolCalls: Optional[List[ToolCall]] = None
     toolResults: Optional[List[ToolResult]] = None
 
+class MessagePage(BaseModel):
+    """
+    Page of messages, newest first
+    """
+    messages: List[Message]
+    next_cursor: Optional[str] = None  # Pass as `cursor` to get the next page; None on the last page
+
 class Chat(BaseModel):
     """
     Chat model
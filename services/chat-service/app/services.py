@@ -3,7 +3,7 @@ from datetime import datetime
 import uuid
 from fastapi import HTTPException, status
 from .database import FirestoreClient
-from .models import Chat, Message, ChatDB, MessageDB, CreateChatRequest, CreateMessageRequest, MessageRole
+from .models import Chat, Message, MessagePage, ChatDB, MessageDB, CreateChatRequest, CreateMessageRequest, MessageRole
 
 class ChatService:
     """
@@ -102,7 +102,14 @@ class ChatService:
         # Delete chat from database
         return await self.db_client.delete_chat(chat_id)
     
-    async def list_messages(self, chat_id: str, user_id: str, limit: int = 50, offset: int = 0) -> List[Message]:
+    async def list_messages(
+        self,
+        chat_id: str,
+        user_id: str,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+    ) -> MessagePage:
         """
         List messages for a chat session
         
@@ -110,15 +117,16 @@ class ChatService:
             chat_id: The chat ID
             user_id: The user ID
             limit: Maximum number of messages to return
-            offset: Number of messages to skip
+            cursor: Cursor returned with the previous page
+            offset: Number of messages to skip (deprecated in favour of cursor)
             
         Returns:
-            List of message objects
+            Page of message objects
         """
         # TODO: Check if user has access to the chat's project
         
         # Get messages from database
-        message_data_list = await self.db_client.list_messages(chat_id, limit, offset)
+        message_data_list, next_cursor = await self.db_client.list_messages(chat_id, limit, cursor, offset)
         
         # Convert to API models
         messages = []
@@ -126,7 +134,7 @@ class ChatService:
             message = self._convert_message_data_to_model(message_data)
             messages.append(message)
         
-        return messages
+        return MessagePage(messages=messages, next_cursor=next_cursor)
     
     async def get_message(self, message_id: str, user_id: str) -> Optional[Message]:
         """
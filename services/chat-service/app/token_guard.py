@@ -0,0 +1,237 @@
+# Shared module, copied into each service. Edit shared/libs/python/token_guard.py
+# and run `python shared/libs/sync_python.py` to update the copies.
+"""
+Protection against invalid and abusive tokens for GrantCraft services.
+
+Verifying a token costs a signature check or a round trip to Firebase, and
+a failed verification costs as much as a successful one. Two guards keep
+clients that keep sending bad tokens from paying that cost again and again:
+
+* NegativeTokenCache remembers tokens that failed verification for good
+  (expired, revoked, forged, malformed), keyed by the token's hash. For a
+  short TTL the same token is rejected again without any verification.
+  Failures that say nothing about the token, like Firebase being
+  unreachable, must not be added.
+* FailureTracker counts failed authentications per client address. After
+  `max_failures` within `window` seconds, the client is blocked for
+  `block_duration` seconds and answered 429 before its token is looked at.
+  It belongs at the edge: behind the gateway, every request comes from the
+  gateway's address.
+
+    rejected = NegativeTokenCache()
+
+    async def verify_token(token):
+        rejected.check(token)                     # raises the cached HTTPException
+        try:
+            ...
+        except ExpiredIdTokenError:
+            raise rejected.reject(token, "Token has expired")
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .metrics import REGISTRY
+
+SHORT_CIRCUITED = REGISTRY.counter(
+    "auth_short_circuited",
+    "Authentication attempts rejected without verifying the token, by reason",
+    ("reason",),
+)
+
+
+def _token_key(token: str) -> str:
+    """Hash a token so raw credentials are never kept in memory"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class NegativeTokenCache:
+    """
+    Bounded LRU cache of tokens that failed verification.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size: Maximum number of remembered tokens (0 disables the cache)
+            ttl: Seconds a failed token is rejected without verification
+            clock: Monotonic clock
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        # Verification may run in worker threads
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, int, str, Optional[Dict[str, str]]]]" = OrderedDict()
+
+        self.hits = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[HTTPException]:
+        """
+        Look up a token.
+
+        Returns:
+            A copy of the error it failed with, or None if it is not cached
+        """
+        if self.max_size <= 0:
+            return None
+        key = _token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, status_code, detail, headers = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        SHORT_CIRCUITED.labels("rejected_token").inc()
+        return HTTPException(status_code=status_code, detail=detail, headers=headers)
+
+    def check(self, token: str) -> None:
+        """
+        Raises:
+            HTTPException: The earlier failure, if the token is cached
+        """
+        error = self.get(token)
+        if error is not None:
+            raise error
+
+    def add(self, token: str, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None) -> None:
+        """Remember that a token failed verification"""
+        if self.max_size <= 0:
+            return
+        key = _token_key(token)
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, status_code, detail, headers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def reject(
+        self,
+        token: str,
+        detail: str,
+        status_code: int = 401,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> HTTPException:
+        """Remember a failed token and build the error to raise for it"""
+        self.add(token, status_code, detail, headers)
+        return HTTPException(status_code=status_code, detail=detail, headers=headers)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "evictions": self.evictions,
+        }
+
+
+class FailureTracker:
+    """
+    Per-client counters of failed authentications.
+    """
+
+    def __init__(
+        self,
+        max_failures: int = 20,
+        window: float = 60.0,
+        block_duration: float = 300.0,
+        max_clients: int = 100000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the tracker.
+
+        Args:
+            max_failures: Failures within `window` that get a client blocked (0 disables blocking)
+            window: Seconds over which failures are counted
+            block_duration: Seconds a client stays blocked
+            max_clients: Maximum number of tracked clients; the least recently seen are forgotten
+            clock: Monotonic clock
+        """
+        self.max_failures = max_failures
+        self.window = window
+        self.block_duration = block_duration
+        self.max_clients = max_clients
+        self._clock = clock
+        self._failures: "OrderedDict[str, Deque[float]]" = OrderedDict()
+        self._blocked: Dict[str, float] = {}
+
+        self.blocks = 0
+        self.rejected = 0
+
+    def blocked(self, client: str) -> float:
+        """
+        Returns:
+            Seconds until the client is unblocked, or 0 if it is not blocked
+        """
+        until = self._blocked.get(client)
+        if until is None:
+            return 0.0
+        left = until - self._clock()
+        if left <= 0:
+            del self._blocked[client]
+            return 0.0
+        self.rejected += 1
+        SHORT_CIRCUITED.labels("blocked_client").inc()
+        return left
+
+    def record_failure(self, client: str) -> None:
+        """Count a failed authentication, blocking the client once it reaches the limit"""
+        if self.max_failures <= 0:
+            return
+        now = self._clock()
+        failures = self._failures.get(client)
+        if failures is None:
+            failures = self._failures[client] = deque()
+        self._failures.move_to_end(client)
+        failures.append(now)
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+
+        if len(failures) >= self.max_failures:
+            self._blocked[client] = now + self.block_duration
+            del self._failures[client]
+            self.blocks += 1
+
+        while len(self._failures) > self.max_clients:
+            self._failures.popitem(last=False)
+        if len(self._blocked) > self.max_clients:
+            for key in [key for key, until in self._blocked.items() if until <= now]:
+                del self._blocked[key]
+
+    def record_success(self, client: str) -> None:
+        """A successful authentication clears the client's failures"""
+        self._failures.pop(client, None)
+
+    def clear(self) -> None:
+        self._failures.clear()
+        self._blocked.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_clients": len(self._failures),
+            "blocked_clients": len(self._blocked),
+            "blocks": self.blocks,
+            "rejected": self.rejected,
+        }
@@ -1,10 +1,12 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
-from datetime import datetime
+from unittest.mock import patch, AsyncMock
+from datetime import datetime, timedelta, timezone
 
 # Import the FastAPI app
+from app import main
 from app.main import app
+from app.database import FirestoreClient, InvalidCursorError, decode_cursor, encode_cursor
 
 # Create test client
 client = TestClient(app)
@@ -22,12 +24,11 @@ def mock_auth():
         }
         yield mock
 
-# Mock Firestore client
+# Mock Firestore client (the chat service is created when the app is imported)
 @pytest.fixture
 def mock_firestore():
-    with patch("app.database.FirestoreClient") as mock:
-        mock_instance = MagicMock()
-        mock.return_value = mock_instance
+    mock_instance = AsyncMock()
+    with patch.object(main.chat_service, "db_client", mock_instance):
         yield mock_instance
 
 # Test health check endpoint
@@ -100,7 +101,7 @@ def test_create_chat(mock_auth, mock_firestore):
 # Test list messages endpoint
 def test_list_messages(mock_auth, mock_firestore):
     # Mock database response
-    mock_firestore.list_messages.return_value = [
+    mock_firestore.list_messages.return_value = ([
         {
             "id": "message-id-1",
             "chatId": "chat-id-1",
@@ -115,7 +116,7 @@ def test_list_messages(mock_auth, mock_firestore):
             "role": "assistant",
             "timestamp": datetime.utcnow()
         }
-    ]
+    ], "next-page")
     
     # Make request
     response = client.get(
@@ -126,10 +127,113 @@ def test_list_messages(mock_auth, mock_firestore):
     # Check response
     assert response.status_code == 200
     data = response.json()
-    assert len(data) == 2
-    assert data[0]["chatId"] == "chat-id-1"
-    assert data[0]["content"] == "Hello"
-    assert data[0]["role"] == "user"
-    assert data[1]["chatId"] == "chat-id-1"
-    assert data[1]["content"] == "Hi there!"
-    assert data[1]["role"] == "assistant" 
\ No newline at end of file
+    messages = data["messages"]
+    assert len(messages) == 2
+    assert messages[0]["chatId"] == "chat-id-1"
+    assert messages[0]["content"] == "Hello"
+    assert messages[0]["role"] == "user"
+    assert messages[1]["chatId"] == "chat-id-1"
+    assert messages[1]["content"] == "Hi there!"
+    assert messages[1]["role"] == "assistant"
+    assert data["next_cursor"] == "next-page"
+
+# Test message cursors
+def test_message_cursor_round_trip():
+    timestamp = datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(timestamp, "message-id-1")
+    
+    assert decode_cursor(cursor) == (timestamp, "message-id-1")
+
+def test_invalid_message_cursor():
+    with pytest.raises(InvalidCursorError):
+        decode_cursor("not-a-cursor")
+
+def test_message_cursor_with_null_timestamp():
+    assert decode_cursor(encode_cursor(None, "legacy-id")) == (None, "legacy-id")
+
+class FakeDocument:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+    
+    def to_dict(self):
+        return dict(self._data)
+
+class FakeQuery:
+    """Enough of a Firestore query to page through messages, recording the calls made"""
+    
+    def __init__(self, documents, calls):
+        self.documents = documents
+        self.calls = calls
+    
+    def _next(self, documents, call):
+        self.calls.append(call)
+        return FakeQuery(documents, self.calls)
+    
+    def where(self, field, op, value):
+        return self._next([doc for doc in self.documents if doc.to_dict().get(field) == value], ("where", field, op, value))
+    
+    def order_by(self, field, direction=None):
+        return self._next(self.documents, ("order_by", field, direction))
+    
+    def start_after(self, values):
+        # Descending (timestamp, id) with null timestamps last, as Firestore orders them
+        position = (values["timestamp"] is not None, values["timestamp"] or datetime.min, values["__name__"])
+        return self._next([doc for doc in self.documents if sort_key(doc) < position], ("start_after", values))
+    
+    def limit(self, count):
+        return self._next(self.documents[:count], ("limit", count))
+    
+    def stream(self):
+        return iter(self.documents)
+
+def sort_key(doc):
+    timestamp = doc.to_dict().get("timestamp")
+    return (timestamp is not None, timestamp or datetime.min, doc.id)
+
+class FakeDb:
+    def __init__(self, documents):
+        self.calls = []
+        self.documents = sorted(documents, key=sort_key, reverse=True)
+    
+    def collection(self, name):
+        return FakeQuery(self.documents, self.calls)
+
+@pytest.mark.asyncio
+async def test_list_messages_pages_with_cursors():
+    start = datetime(2024, 1, 1)
+    documents = [
+        FakeDocument(f"m{i}", {"chatId": "c1", "timestamp": start + timedelta(minutes=i // 2)})
+        for i in range(5)
+    ]
+    documents.append(FakeDocument("legacy", {"chatId": "c1", "timestamp": None}))
+    documents.append(FakeDocument("other", {"chatId": "c2", "timestamp": start}))
+    fake = FakeDb(documents)
+    
+    with patch.object(FirestoreClient, "db", fake):
+        client = FirestoreClient()
+        pages = []
+        cursor = None
+        while True:
+            messages, cursor = await client.list_messages("c1", limit=2, cursor=cursor)
+            pages.append([message["id"] for message in messages])
+            if cursor is None:
+                break
+    
+    # Newest first, ties broken by id, null timestamps last, nothing repeated or skipped
+    assert pages == [["m4", "m3"], ["m2", "m1"], ["m0", "legacy"]]
+    assert [call[0] for call in fake.calls[:4]] == ["where", "order_by", "order_by", "limit"]
+    assert fake.calls[1][1] == "timestamp"
+    assert fake.calls[2][1] == "__name__"
+    assert fake.calls[3] == ("limit", 3)
+    assert ("start_after", {"timestamp": start + timedelta(minutes=1), "__name__": "m3"}) in fake.calls
+
+@pytest.mark.asyncio
+async def test_last_page_has_no_cursor():
+    fake = FakeDb([FakeDocument("m1", {"chatId": "c1", "timestamp": datetime(2024, 1, 1)})])
+    
+    with patch.object(FirestoreClient, "db", fake):
+        messages, cursor = await FirestoreClient().list_messages("c1", limit=1)
+    
+    assert [message["id"] for message in messages] == ["m1"]
+    assert cursor is None
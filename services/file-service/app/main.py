@@ -3,6 +3,18 @@ from fastapi.middleware.cors import CORSMiddleware
 import os
 from dotenv import load_dotenv
 
+from app.services.metrics import MetricsMiddleware, metrics_response
+from app.services.tracing import TracingMiddleware, configure_tracing
+from app.services.deadline import DeadlineMiddleware
+from app.services.lazy import start_warm_up
+from app.services.logging_config import configure_logging
+
+# JSON logs written by a background thread
+configure_logging("file-service")
+
+# Continue traces started by the gateway
+configure_tracing("file-service")
+
 try:
     # Import routers
     from app.routers import files
@@ -43,6 +55,16 @@ except Exception as e:
         version="0.1.0",
     )
 
+# Request deadlines from the gateway, tracing and metrics, also in fallback mode
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+# Google clients are created on first use; warm them up once the service is running
+@app.on_event("startup")
+async def warm_up_clients():
+    await start_warm_up()
+
 @app.get("/health")
 async def health_check():
     """
@@ -50,6 +72,13 @@ async def health_check():
     """
     return {"status": "ok", "service": "file-service"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics for the File Service
+    """
+    return metrics_response()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
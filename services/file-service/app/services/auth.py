@@ -1,14 +1,45 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import firebase_admin
-from firebase_admin import credentials, auth
 import os
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from app.services.lazy import Lazy, lazy_import
+from app.services.token_guard import NegativeTokenCache
+from app.services.identity import IDENTITY_HEADER, InternalIdentityError, create_identity_verifier_from_env
+from app.services.jwt_verifier import (
+    ExpiredTokenError,
+    SigningKeysUnavailableError,
+    TokenVerificationError,
+    create_verifier_from_env,
+)
+
+# The Firebase Admin SDK is imported on first use
+firebase_admin = lazy_import("firebase_admin")
+auth = lazy_import("firebase_admin.auth")
+credentials = lazy_import("firebase_admin.credentials")
 
 # Initialize Firebase Admin SDK
 firebase_initialized = False
-security = HTTPBearer()
+# Optional, as requests from the gateway may carry an identity assertion instead
+security = HTTPBearer(auto_error=False)
+
+# Local verification against cached signing keys (FIREBASE_LOCAL_VERIFY=true)
+local_verifier = create_verifier_from_env()
+
+# Users vouched for by the gateway in a signed X-Internal-Identity header are
+# trusted without verifying their Firebase token again
+identity_verifier = create_identity_verifier_from_env("file-service")
+
+# Tokens that failed verification for good are rejected again without any
+# verification. Failures are not counted per client here: behind the gateway
+# every request comes from the gateway's address.
+rejected_tokens = NegativeTokenCache(
+    max_size=int(os.getenv("NEGATIVE_TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("NEGATIVE_TOKEN_CACHE_TTL", "60")),
+)
+
+# Sent with every 401
+BEARER_CHALLENGE = {"WWW-Authenticate": "Bearer"}
 
 def initialize_firebase():
     """Initialize Firebase Admin SDK"""
@@ -43,6 +74,9 @@ def initialize_firebase():
         print(f"Error initializing Firebase: {str(e)}")
         raise HTTPException(status_code=500, detail="Could not initialize Firebase authentication")
 
+# Initialized on first use or by the startup warm-up, off the event loop
+firebase = Lazy("firebase", initialize_firebase)
+
 async def verify_token(token: str) -> Dict[str, Any]:
     """
     Verify Firebase Auth token
@@ -53,20 +87,35 @@ async def verify_token(token: str) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: User data from token
     """
-    if not firebase_initialized:
-        initialize_firebase()
+    rejected_tokens.check(token)
+    
+    if local_verifier:
+        try:
+            return await local_verifier.verify(token)
+        except ExpiredTokenError:
+            raise rejected_tokens.reject(token, "Authentication token has expired", headers=BEARER_CHALLENGE)
+        except SigningKeysUnavailableError as e:
+            # Says nothing about the token, so it is not remembered
+            print(f"Token verification error: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication token",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        except TokenVerificationError as e:
+            print(f"Token verification error: {str(e)}")
+            raise rejected_tokens.reject(token, "Invalid authentication token", headers=BEARER_CHALLENGE)
+    
+    await firebase.aget()
     
     try:
         # Verify the token with Firebase
         decoded_token = auth.verify_id_token(token)
         return decoded_token
     except auth.InvalidIdTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise rejected_tokens.reject(token, "Invalid authentication token", headers=BEARER_CHALLENGE)
     except Exception as e:
+        # Possibly transient (Firebase unreachable), so not remembered
         print(f"Token verification error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -74,15 +123,33 @@ async def verify_token(token: str) -> Dict[str, Any]:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+async def get_current_user(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+) -> Dict[str, Any]:
     """
-    Get current user from the Authorization header
+    Get current user from the gateway's identity assertion, or else the Authorization header
     
     Args:
+        request: The incoming request
         credentials: HTTP authorization credentials
         
     Returns:
         Dict[str, Any]: User data
     """
-    token = credentials.credentials
-    return await verify_token(token) 
\ No newline at end of file
+    if identity_verifier:
+        assertion = request.headers.get(IDENTITY_HEADER)
+        if assertion:
+            try:
+                return identity_verifier.verify(assertion)
+            except InternalIdentityError as e:
+                print(f"Rejected identity assertion: {str(e)}")
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid identity assertion",
+                    headers=BEARER_CHALLENGE,
+                )
+    
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authenticated")
+    return await verify_token(credentials.credentials) 
\ No newline at end of file
@@ -1,19 +1,42 @@
-from google.cloud import firestore
 from datetime import datetime
 import uuid
 from typing import List, Optional, Dict, Any
 
 from app.models.file import FileCreate, FileUpdate, FileInDB
+from app.services.lazy import Lazy, lazy_import
+from app.services.metrics import REGISTRY, timed
+from app.services.tracing import SPAN_KIND_CLIENT, traced
+
+# Latency of Firestore calls by method; failures are labelled outcome="error"
+FIRESTORE_LATENCY = REGISTRY.histogram(
+    "firestore_operation_duration_seconds",
+    "Latency of Firestore operations in seconds",
+    ("operation", "outcome"),
+)
+# Attributes of the span around each Firestore call
+FIRESTORE_SPAN = {"db.system": "firestore"}
+
+# Imported on first use; the Google Cloud libraries dominate start-up time
+firestore = lazy_import("google.cloud.firestore")
 
 class DatabaseService:
     """
     Service for handling file metadata in Firestore
     """
     def __init__(self):
-        """Initialize the Firestore client"""
-        self.db = firestore.Client()
-        self.collection = self.db.collection("files")
+        """Initialize the Firestore client, which is created on first use"""
+        self._db = Lazy("firestore", lambda: firestore.Client())
+    
+    @property
+    def db(self):
+        return self._db.get()
+    
+    @property
+    def collection(self):
+        return self.db.collection("files")
     
+    @traced("firestore create_file", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="create_file")
     async def create_file(self, file_data: FileCreate, file_path: str) -> FileInDB:
         """
         Create a new file metadata entry in Firestore
@@ -67,6 +90,8 @@ class DatabaseService:
                 metadata=file_data.metadata or {},
             )
     
+    @traced("firestore get_file", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="get_file")
     async def get_file(self, file_id: str) -> Optional[FileInDB]:
         """
         Get a file by ID
@@ -92,6 +117,8 @@ class DatabaseService:
             print(f"Error getting file: {str(e)}")
             return None
     
+    @traced("firestore update_file", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="update_file")
     async def update_file(self, file_id: str, file_update: FileUpdate) -> Optional[FileInDB]:
         """
         Update a file's metadata
@@ -133,6 +160,8 @@ class DatabaseService:
             print(f"Error updating file: {str(e)}")
             return None
     
+    @traced("firestore delete_file", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="delete_file")
     async def delete_file(self, file_id: str) -> bool:
         """
         Delete a file's metadata
@@ -159,6 +188,8 @@ class DatabaseService:
             print(f"Error deleting file: {str(e)}")
             return False
     
+    @traced("firestore list_files_by_project", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="list_files_by_project")
     async def list_files_by_project(self, project_id: str) -> List[FileInDB]:
         """
         List files for a specific project
@@ -185,6 +216,8 @@ class DatabaseService:
             print(f"Error listing files by project: {str(e)}")
             return []
     
+    @traced("firestore check_file_access", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="check_file_access")
     async def check_file_access(self, file_id: str, user_id: str) -> bool:
         """
         Check if a user has access to a file based on project ownership
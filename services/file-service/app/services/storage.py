@@ -1,28 +1,57 @@
-from google.cloud import storage
 import os
 from datetime import datetime, timedelta
 import magic
 import uuid
 
+from app.services.lazy import Lazy, lazy_import
+from app.services.tracing import SPAN_KIND_CLIENT, traced
+
+# Imported on first use; the Google Cloud libraries dominate start-up time
+storage = lazy_import("google.cloud.storage")
+
+# Attributes of the span around each Cloud Storage call
+GCS_SPAN = {"storage.system": "gcs"}
+
 class StorageService:
     """
     Service for handling file blobs in Google Cloud Storage
     """
     def __init__(self):
-        """Initialize the storage client and bucket"""
+        """Initialize the storage service; the client and bucket are set up on first use"""
+        self._connection = Lazy("cloud storage", self._connect)
+    
+    def _connect(self) -> tuple:
+        """
+        Create the storage client and check the bucket (a network call)
+        
+        Returns:
+            tuple: (client, bucket, bucket_name), with no client or bucket on failure
+        """
         try:
-            self.client = storage.Client()
-            self.bucket_name = os.getenv("GCS_BUCKET_NAME", "grancraft-final-20240630-files")
-            self.bucket = self.client.bucket(self.bucket_name)
+            client = storage.Client()
+            bucket_name = os.getenv("GCS_BUCKET_NAME", "grancraft-final-20240630-files")
+            bucket = client.bucket(bucket_name)
             # Create the bucket if it doesn't exist
-            if not self.bucket.exists():
-                print(f"Warning: Bucket {self.bucket_name} does not exist. Using fallback mechanism.")
+            if not bucket.exists():
+                print(f"Warning: Bucket {bucket_name} does not exist. Using fallback mechanism.")
+            return client, bucket, bucket_name
         except Exception as e:
             print(f"Error initializing storage service: {str(e)}")
-            self.client = None
-            self.bucket = None
-            self.bucket_name = "fallback-bucket"
+            return None, None, "fallback-bucket"
+    
+    @property
+    def client(self):
+        return self._connection.get()[0]
+    
+    @property
+    def bucket(self):
+        return self._connection.get()[1]
+    
+    @property
+    def bucket_name(self) -> str:
+        return self._connection.get()[2]
     
+    @traced("gcs generate_upload_url", GCS_SPAN, SPAN_KIND_CLIENT)
     def generate_upload_url(self, user_id: str, project_id: str, file_name: str) -> tuple:
         """
         Generate a signed URL for uploading a file
@@ -55,6 +84,7 @@ class StorageService:
             dummy_path = f"users/{user_id}/projects/{project_id}/{uuid.uuid4()}_{file_name}"
             return dummy_path, "https://example.com/fallback-upload-url"
     
+    @traced("gcs generate_download_url", GCS_SPAN, SPAN_KIND_CLIENT)
     def generate_download_url(self, blob_path: str) -> str:
         """
         Generate a signed URL for downloading a file
@@ -89,6 +119,7 @@ class StorageService:
             # Fallback: Return dummy URL
             return "https://example.com/fallback-download-url"
     
+    @traced("gcs delete_file", GCS_SPAN, SPAN_KIND_CLIENT)
     def delete_file(self, blob_path: str) -> None:
         """
         Delete a file from storage
@@ -113,6 +144,7 @@ class StorageService:
         except Exception as e:
             print(f"Error deleting file: {str(e)}")
     
+    @traced("gcs get_file_metadata", GCS_SPAN, SPAN_KIND_CLIENT)
     def get_file_metadata(self, blob_path: str) -> dict:
         """
         Get metadata for a file
@@ -0,0 +1,422 @@
+# Shared module, copied into each service. Edit shared/libs/python/tracing.py
+# and run `python shared/libs/sync_python.py` to update the copies.
+"""
+Request tracing for GrantCraft services.
+
+Trace context is propagated between services with the W3C `traceparent`
+header. The gateway starts a trace for each request (or continues the
+caller's) and passes it to the backend service, which records its own spans
+around Firestore, Cloud Storage and Vertex AI calls under the same trace.
+
+The current span is kept in a context variable, so spans started anywhere
+in the handling of a request (including tasks it spawns) nest under it:
+
+    with start_span("firestore get_chat", {"db.system": "firestore"}):
+        ...
+
+    @traced("select_tools")
+    async def select_tools(...):
+        ...
+
+Finished spans go to an exporter, configured with TRACE_EXPORTER:
+
+* none   - spans are not exported (default); context is still propagated
+* memory - kept in memory, see InMemoryExporter (tests, local debugging)
+* json   - one JSON object per line on stderr or TRACE_EXPORT_FILE
+* "module:factory" - any object with an `export(span)` method
+
+TRACE_SAMPLE_RATIO sets the fraction of new traces that are recorded.
+Requests arriving with a sampled `traceparent` are always recorded, so a
+trace is either complete across services or not recorded at all. A service
+facing clients (the gateway) passes `trust_incoming_sampling=False` to
+TracingMiddleware: it keeps the caller's trace id but makes the sampling
+decision itself, so callers cannot force every request to be recorded.
+"""
+import contextvars
+import functools
+import importlib
+import inspect
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+
+SPAN_KIND_INTERNAL = "internal"
+SPAN_KIND_SERVER = "server"
+SPAN_KIND_CLIENT = "client"
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class SpanContext:
+    """Identifies a span within a trace, as carried by the traceparent header"""
+
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """
+    Parse a W3C traceparent header.
+
+    Returns:
+        The remote span context, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if match is None:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 0x01))
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    def __init__(
+        self,
+        name: str,
+        context: SpanContext,
+        parent_id: Optional[str],
+        service: str,
+        kind: str = SPAN_KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.service = service
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = STATUS_OK
+        self.start_time = time.time()
+        self.duration: Optional[float] = None
+        self._started = time.perf_counter()
+
+    @property
+    def recording(self) -> bool:
+        return self.context.sampled
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.recording:
+            self.attributes[key] = value
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.set_attribute("error.type", type(exception).__name__)
+        self.set_attribute("error.message", str(exception))
+
+    def end(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "service": self.service,
+            "kind": self.kind,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class InMemoryExporter:
+    """Keeps the most recent finished spans in memory"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def find(self, name: str) -> List[Span]:
+        return [span for span in self.spans if span.name == name]
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class JsonExporter:
+    """Writes each finished span as one JSON line"""
+
+    def __init__(self, stream=None, path: Optional[str] = None):
+        """
+        Initialize the exporter.
+
+        Args:
+            stream: Text stream to write to (defaults to stderr)
+            path: File to append to instead of a stream
+        """
+        self._stream = open(path, "a", buffering=1) if path else (stream or sys.stderr)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._stream.write(line + "\n")
+
+
+class Tracer:
+    """
+    Starts spans and hands finished, sampled spans to the exporter.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        exporter: Any = None,
+        sample_ratio: float = 1.0,
+        rand: Optional[random.Random] = None,
+    ):
+        """
+        Initialize the tracer.
+
+        Args:
+            service: Service name recorded on every span
+            exporter: Object with an `export(span)` method, or None to drop spans
+            sample_ratio: Fraction of new traces that are recorded
+            rand: Random number generator for trace and span ids
+        """
+        self.service = service
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self._random = rand or random.Random()
+        self.export_errors = 0
+
+    def _new_id(self, bits: int) -> str:
+        return f"{self._random.getrandbits(bits):0{bits // 4}x}"
+
+    def _sample(self, trace_id: str) -> bool:
+        # Decided from the trace id so every service makes the same choice for a new trace
+        if self.exporter is None or self.sample_ratio <= 0:
+            return False
+        return int(trace_id[16:], 16) < self.sample_ratio * (1 << 64)
+
+    @contextmanager
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: str = SPAN_KIND_INTERNAL,
+        parent: Optional[SpanContext] = None,
+    ) -> Iterator[Span]:
+        """
+        Start a span that becomes the current span inside the block.
+
+        Args:
+            name: Span name
+            attributes: Initial attributes
+            kind: internal, server or client
+            parent: Remote parent context; defaults to the current span
+        """
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current is not None else None
+
+        if parent is not None:
+            context = SpanContext(parent.trace_id, self._new_id(64), parent.sampled)
+        else:
+            trace_id = self._new_id(128)
+            context = SpanContext(trace_id, self._new_id(64), self._sample(trace_id))
+
+        span = Span(name, context, parent.span_id if parent else None, self.service, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            if span.recording and self.exporter is not None:
+                try:
+                    self.exporter.export(span)
+                except Exception as e:
+                    self.export_errors += 1
+                    logger.warning(f"Failed to export span {name}: {str(e)}")
+
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+# Tracer used by start_span and traced; replaced by configure_tracing
+_tracer = Tracer("unknown")
+
+
+def load_exporter(path: str) -> Any:
+    """
+    Create an exporter from "none", "memory", "json" or a "module:factory" import path.
+    """
+    if not path or path == "none":
+        return None
+    if path == "memory":
+        return InMemoryExporter()
+    if path == "json":
+        return JsonExporter(path=os.getenv("TRACE_EXPORT_FILE") or None)
+    module_name, _, attribute = path.partition(":")
+    factory = getattr(importlib.import_module(module_name), attribute)
+    return factory()
+
+
+def configure_tracing(service: str, exporter: Any = None, sample_ratio: Optional[float] = None) -> Tracer:
+    """
+    Set up the process-wide tracer, reading TRACE_EXPORTER and TRACE_SAMPLE_RATIO
+    for anything not given.
+
+    Returns:
+        The configured tracer
+    """
+    global _tracer
+    if exporter is None:
+        try:
+            exporter = load_exporter(os.getenv("TRACE_EXPORTER", "none"))
+        except Exception as e:
+            logger.error(f"Error creating trace exporter, spans will not be exported: {str(e)}")
+            exporter = None
+    if sample_ratio is None:
+        sample_ratio = float(os.getenv("TRACE_SAMPLE_RATIO", "0.1"))
+    _tracer = Tracer(service, exporter, sample_ratio)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(
+    name: str,
+    attributes: Optional[Dict[str, Any]] = None,
+    kind: str = SPAN_KIND_INTERNAL,
+    parent: Optional[SpanContext] = None,
+):
+    """Start a span with the process-wide tracer"""
+    return _tracer.start_span(name, attributes, kind, parent)
+
+
+def traced(name: str, attributes: Optional[Dict[str, Any]] = None, kind: str = SPAN_KIND_INTERNAL) -> Callable:
+    """
+    Decorator running a plain or async function inside a span.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(name, attributes, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(name, attributes, kind):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def inject(headers: Sequence[Tuple[str, str]], span: Optional[Span] = None) -> List[Tuple[str, str]]:
+    """
+    Headers for an outgoing request carrying the span's (or the current span's) context.
+
+    Any traceparent already in `headers` is replaced.
+    """
+    span = span or _current_span.get()
+    result = [(key, value) for key, value in headers if key.lower() != TRACEPARENT_HEADER]
+    if span is not None:
+        result.append((TRACEPARENT_HEADER, span.context.traceparent()))
+    return result
+
+
+def _route_template(scope: Scope) -> Optional[str]:
+    route = scope.get("route")
+    return getattr(route, "path", None)
+
+
+class TracingMiddleware:
+    """
+    Runs every HTTP request inside a server span, continuing the caller's trace
+    when the request carries a traceparent header.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        route_label: Callable[[Scope], Optional[str]] = _route_template,
+        excluded_paths: Sequence[str] = ("/metrics",),
+        trust_incoming_sampling: bool = True,
+    ):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application
+            route_label: Returns the route of a finished request, used in the span name
+            excluded_paths: Paths that are not traced
+            trust_incoming_sampling: Follow the sampled flag of an incoming traceparent;
+                when False the trace id is kept but the tracer decides sampling
+        """
+        self.app = app
+        self.route_label = route_label
+        self.excluded_paths = set(excluded_paths)
+        self.trust_incoming_sampling = trust_incoming_sampling
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        parent = parse_traceparent(Headers(scope=scope).get(TRACEPARENT_HEADER))
+        if parent is not None and not self.trust_incoming_sampling:
+            parent = SpanContext(parent.trace_id, parent.span_id, _tracer._sample(parent.trace_id))
+        attributes = {"http.method": scope["method"], "http.target": scope["path"]}
+        with start_span(scope["method"], attributes, SPAN_KIND_SERVER, parent) as span:
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = STATUS_ERROR
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = self.route_label(scope)
+                if route:
+                    span.name = f"{scope['method']} {route}"
+                    span.set_attribute("http.route", route)
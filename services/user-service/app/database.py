@@ -2,9 +2,23 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import json
-from google.cloud import firestore
 from .config import FIRESTORE_COLLECTION_USERS
+from .lazy import Lazy, lazy_import
 from .models import UserDB, UserSettingsDB
+from .metrics import REGISTRY, timed
+from .tracing import SPAN_KIND_CLIENT, traced
+
+# Latency of Firestore calls by method; failures are labelled outcome="error"
+FIRESTORE_LATENCY = REGISTRY.histogram(
+    "firestore_operation_duration_seconds",
+    "Latency of Firestore operations in seconds",
+    ("operation", "outcome"),
+)
+# Attributes of the span around each Firestore call
+FIRESTORE_SPAN = {"db.system": "firestore"}
+
+# Imported on first use; the Google Cloud libraries dominate start-up time
+firestore = lazy_import("google.cloud.firestore")
 
 class FirestoreClient:
     """
@@ -12,10 +26,19 @@ class FirestoreClient:
     """
     
     def __init__(self):
-        """Initialize the Firestore client"""
-        self.db = firestore.Client()
-        self.users_collection = self.db.collection(FIRESTORE_COLLECTION_USERS)
+        """Initialize the Firestore client, which is created on first use"""
+        self._db = Lazy("firestore", lambda: firestore.Client())
+    
+    @property
+    def db(self):
+        return self._db.get()
+    
+    @property
+    def users_collection(self):
+        return self.db.collection(FIRESTORE_COLLECTION_USERS)
     
+    @traced("firestore get_user", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="get_user")
     async def get_user(self, user_id: str) -> Optional[UserDB]:
         """
         Get a user by ID
@@ -50,6 +73,8 @@ class FirestoreClient:
         
         return UserDB(**user_data)
     
+    @traced("firestore create_user", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="create_user")
     async def create_user(self, user_data: Dict[str, Any]) -> UserDB:
         """
         Create a new user
@@ -78,6 +103,8 @@ class FirestoreClient:
         
         return UserDB(**user_data)
     
+    @traced("firestore update_user", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="update_user")
     async def update_user(self, user_id: str, update_data: Dict[str, Any]) -> Optional[UserDB]:
         """
         Update a user
@@ -114,6 +141,8 @@ class FirestoreClient:
         
         return UserDB(**updated_data)
     
+    @traced("firestore delete_user", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="delete_user")
     async def delete_user(self, user_id: str) -> bool:
         """
         Delete a user
@@ -133,6 +162,8 @@ class FirestoreClient:
         doc_ref.delete()
         return True
     
+    @traced("firestore list_users", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="list_users")
     async def list_users(self, limit: int = 50, offset: int = 0) -> List[UserDB]:
         """
         List users with pagination
@@ -169,6 +200,8 @@ class FirestoreClient:
         
         return users
     
+    @traced("firestore update_user_settings", FIRESTORE_SPAN, SPAN_KIND_CLIENT)
+    @timed(FIRESTORE_LATENCY, operation="update_user_settings")
     async def update_user_settings(self, user_id: str, settings_data: Dict[str, Any]) -> Optional[UserDB]:
         """
         Update user settings
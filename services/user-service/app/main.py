@@ -5,6 +5,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from .config import API_PREFIX, SERVICE_NAME, DEBUG
 from .auth import get_current_user, get_user_from_header
 from .services import UserService
+from .metrics import MetricsMiddleware, metrics_response
+from .tracing import TracingMiddleware, configure_tracing
+from .deadline import DeadlineMiddleware
+from .lazy import start_warm_up
+from .logging_config import configure_logging
 from .models import (
     User,
     UserResponse,
@@ -13,6 +18,12 @@ from .models import (
     UpdateUserSettingsRequest
 )
 
+# JSON logs written by a background thread
+configure_logging(SERVICE_NAME)
+
+# Continue traces started by the gateway
+configure_tracing(SERVICE_NAME)
+
 # Create FastAPI app
 app = FastAPI(
     title=f"GrantCraft {SERVICE_NAME}",
@@ -30,6 +41,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Honour request deadlines set by the gateway, trace requests and record
+# per-route latency, in-flight requests and status codes
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+# Google clients are created on first use; warm them up once the service is running
+@app.on_event("startup")
+async def warm_up_clients():
+    await start_warm_up()
+
 # Create service instance
 user_service = UserService()
 
@@ -51,6 +73,13 @@ async def health_check():
     """
     return {"status": "ok", "service": SERVICE_NAME}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics
+    """
+    return metrics_response()
+
 # User endpoints
 @app.get(f"{API_PREFIX}/users/me", response_model=UserResponse)
 async def get_current_user_profile(current_user: Dict[str, Any] = Depends(get_current_user)):
@@ -0,0 +1,208 @@
+# Shared module, copied into each service. Edit shared/libs/python/identity.py
+# and run `python shared/libs/sync_python.py` to update the copies.
+"""
+Signed identity assertions between GrantCraft services.
+
+The gateway verifies the user's Firebase ID token once and forwards the
+user to the backend services in an X-Internal-Identity header. The header
+holds a short-lived compact token signed with a key shared by the gateway
+and the services (HMAC-SHA256):
+
+    base64url(JSON claims) "." base64url(signature)
+
+The claims carry the user (sub, email, email_verified, name, picture),
+the service the assertion is for (aud), and issue and expiry times. A
+service that checks the assertion trusts the gateway's verification and
+does not verify the Firebase token again or look the user up in Firebase.
+
+Keys come from INTERNAL_IDENTITY_KEY. During a key rotation, the old key
+goes in INTERNAL_IDENTITY_PREVIOUS_KEY on the services, so assertions
+signed with either key are accepted. Without a key nothing is minted or
+checked, and services fall back to verifying the bearer token.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_HEADER = "X-Internal-Identity"
+IDENTITY_ISSUER = "api-gateway"
+
+# Seconds an assertion is valid; it only has to outlive the call to the service
+DEFAULT_IDENTITY_TTL = 60.0
+
+
+class InternalIdentityError(Exception):
+    """Raised when an identity assertion is malformed, forged, expired or meant for another service"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(key: bytes, payload: str) -> str:
+    return _b64encode(hmac.new(key, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+class IdentitySigner:
+    """
+    Mints identity assertions for verified users.
+    """
+
+    def __init__(
+        self,
+        key: bytes,
+        ttl: float = DEFAULT_IDENTITY_TTL,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Initialize the signer.
+
+        Args:
+            key: Shared signing key
+            ttl: Seconds each assertion is valid
+            clock: Wall clock
+        """
+        self._key = key
+        self.ttl = ttl
+        self._clock = clock
+
+    def mint(self, user_data: Dict[str, Any], audience: str) -> str:
+        """
+        Create an assertion of `user_data` for one service.
+
+        Args:
+            user_data: The verified user, as returned by verify_token
+            audience: Name of the service the assertion is sent to
+
+        Returns:
+            The compact signed assertion
+        """
+        now = int(self._clock())
+        claims = {
+            "iss": IDENTITY_ISSUER,
+            "aud": audience,
+            "sub": user_data["uid"],
+            "email": user_data.get("email"),
+            "email_verified": user_data.get("email_verified", False),
+            "name": user_data.get("display_name"),
+            "picture": user_data.get("photo_url"),
+            "iat": now,
+            "exp": now + int(self.ttl),
+        }
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{_sign(self._key, payload)}"
+
+
+class IdentityVerifier:
+    """
+    Checks identity assertions minted by the gateway.
+    """
+
+    def __init__(
+        self,
+        keys: Sequence[bytes],
+        audience: str,
+        leeway: float = 5.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Initialize the verifier.
+
+        Args:
+            keys: Accepted signing keys, current key first
+            audience: Name of this service
+            leeway: Seconds of clock difference tolerated on exp and iat
+            clock: Wall clock
+        """
+        self._keys: List[bytes] = list(keys)
+        self.audience = audience
+        self.leeway = leeway
+        self._clock = clock
+
+    def verify(self, assertion: str) -> Dict[str, Any]:
+        """
+        Check an assertion and return the user it vouches for.
+
+        Returns:
+            User data in the same shape as verify_token returns
+
+        Raises:
+            InternalIdentityError: If the assertion is not valid for this service
+        """
+        payload, _, signature = assertion.partition(".")
+        if not payload or not signature:
+            raise InternalIdentityError("Malformed identity assertion")
+        if not any(hmac.compare_digest(_sign(key, payload), signature) for key in self._keys):
+            raise InternalIdentityError("Invalid identity assertion signature")
+
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            raise InternalIdentityError("Malformed identity assertion")
+        if not isinstance(claims, dict) or not claims.get("sub"):
+            raise InternalIdentityError("Identity assertion has no subject")
+
+        now = self._clock()
+        if claims.get("iss") != IDENTITY_ISSUER:
+            raise InternalIdentityError("Identity assertion has the wrong issuer")
+        if claims.get("aud") != self.audience:
+            raise InternalIdentityError("Identity assertion is for another service")
+        if not isinstance(claims.get("exp"), (int, float)) or claims["exp"] + self.leeway < now:
+            raise InternalIdentityError("Identity assertion has expired")
+        if not isinstance(claims.get("iat"), (int, float)) or claims["iat"] - self.leeway > now:
+            raise InternalIdentityError("Identity assertion is issued in the future")
+
+        return {
+            "uid": claims["sub"],
+            "email": claims.get("email"),
+            "email_verified": claims.get("email_verified", False),
+            "display_name": claims.get("name"),
+            "photo_url": claims.get("picture"),
+            "token": claims,
+        }
+
+
+def _env_key(name: str) -> Optional[bytes]:
+    value = os.getenv(name, "")
+    return value.encode("utf-8") if value else None
+
+
+def create_signer_from_env() -> Optional[IdentitySigner]:
+    """
+    Create a signer if INTERNAL_IDENTITY_KEY is set.
+
+    Returns:
+        A signer, or None if identity assertions are not configured
+    """
+    key = _env_key("INTERNAL_IDENTITY_KEY")
+    if key is None:
+        return None
+    return IdentitySigner(key, ttl=float(os.getenv("INTERNAL_IDENTITY_TTL", str(DEFAULT_IDENTITY_TTL))))
+
+
+def create_identity_verifier_from_env(audience: str) -> Optional[IdentityVerifier]:
+    """
+    Create a verifier if INTERNAL_IDENTITY_KEY is set.
+
+    Args:
+        audience: Name of this service
+
+    Returns:
+        A verifier, or None if identity assertions are not configured
+    """
+    keys = [key for key in (_env_key("INTERNAL_IDENTITY_KEY"), _env_key("INTERNAL_IDENTITY_PREVIOUS_KEY")) if key]
+    if not keys:
+        return None
+    logger.info("Accepting internal identity assertions for %s", audience)
+    return IdentityVerifier(keys, audience)
@@ -0,0 +1,348 @@
+# Shared module, copied into each service. Edit shared/libs/python/jwt_verifier.py
+# and run `python shared/libs/sync_python.py` to update the copies.
+"""
+Local verification of Firebase ID tokens.
+
+Google publishes the certificates used to sign Firebase ID tokens and
+rotates them every few hours. This module fetches and caches them,
+honouring the Cache-Control max-age of the response, and refreshes them in
+the background before they expire. Tokens are then verified in-process
+(signature, aud, iss, exp, iat, sub) so steady-state auth needs no network I/O.
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import re
+import time
+import urllib.request
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from google.auth import crypt
+
+logger = logging.getLogger(__name__)
+
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+FIREBASE_ISSUER_PREFIX = "https://securetoken.google.com/"
+
+# Used when the key endpoint does not send a usable max-age
+DEFAULT_KEYS_MAX_AGE = 3600.0
+
+_MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+# fetch() -> (certificates by key id, max-age in seconds)
+KeyFetcher = Callable[[], Tuple[Dict[str, str], float]]
+
+
+class TokenVerificationError(Exception):
+    """Raised when an ID token is malformed, forged or issued for another project"""
+
+
+class ExpiredTokenError(TokenVerificationError):
+    """Raised when an ID token has expired"""
+
+
+class SigningKeysUnavailableError(TokenVerificationError):
+    """Raised when no signing keys could be fetched; says nothing about the token itself"""
+
+
+def parse_max_age(cache_control: Optional[str]) -> float:
+    """
+    Parse the max-age directive of a Cache-Control header.
+
+    Args:
+        cache_control: The Cache-Control header value
+
+    Returns:
+        max-age in seconds, or DEFAULT_KEYS_MAX_AGE if absent
+    """
+    if cache_control:
+        match = _MAX_AGE_PATTERN.search(cache_control)
+        if match:
+            return float(match.group(1))
+    return DEFAULT_KEYS_MAX_AGE
+
+
+def fetch_certificates(url: str, timeout: float = 5.0) -> Tuple[Dict[str, str], float]:
+    """
+    Download the signing certificates (blocking).
+
+    Args:
+        url: Certificate endpoint returning {key id: PEM certificate}
+        timeout: Request timeout in seconds
+
+    Returns:
+        Tuple of (certificates by key id, max-age in seconds)
+    """
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        certificates = json.loads(response.read().decode("utf-8"))
+        max_age = parse_max_age(response.headers.get("Cache-Control"))
+    return certificates, max_age
+
+
+class PublicKeyCache:
+    """
+    Cache of token signing keys.
+
+    - Keys are kept for the max-age sent by the key endpoint
+    - Within `refresh_margin` seconds of expiry a background refresh is started
+      while the current keys keep being served
+    - An unknown key id forces a refresh, at most once per `min_refresh_interval`
+    - If a refresh fails the previous keys stay in use
+    """
+
+    def __init__(
+        self,
+        url: str = FIREBASE_CERTS_URL,
+        fetch: Optional[KeyFetcher] = None,
+        refresh_margin: float = 300.0,
+        min_refresh_interval: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the key cache.
+
+        Args:
+            url: Certificate endpoint
+            fetch: Optional blocking fetch function (defaults to an HTTP GET of `url`)
+            refresh_margin: Seconds before expiry at which a background refresh starts
+            min_refresh_interval: Minimum seconds between forced refreshes
+            clock: Monotonic clock
+        """
+        self.url = url
+        self._fetch = fetch or (lambda: fetch_certificates(url))
+        self.refresh_margin = refresh_margin
+        self.min_refresh_interval = min_refresh_interval
+        self._clock = clock
+
+        self._verifiers: Dict[str, crypt.Verifier] = {}
+        self._expires_at = 0.0
+        self._last_refresh = float("-inf")
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    @property
+    def expires_in(self) -> float:
+        """Seconds until the cached keys expire"""
+        return self._expires_at - self._clock()
+
+    async def refresh(self) -> None:
+        """Fetch the keys now, sharing one fetch between concurrent callers"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = self._clock()
+        async with self._lock:
+            # Another caller refreshed while we were waiting
+            if self._last_refresh >= started:
+                return
+            self._last_refresh = self._clock()
+            try:
+                certificates, max_age = await asyncio.to_thread(self._fetch)
+                verifiers = {
+                    key_id: crypt.RSAVerifier.from_string(certificate)
+                    for key_id, certificate in certificates.items()
+                }
+            except Exception as e:
+                self.refresh_failures += 1
+                logger.error(f"Failed to refresh token signing keys: {str(e)}")
+                if not self._verifiers:
+                    raise SigningKeysUnavailableError("Token signing keys are unavailable") from e
+                return
+
+            self._verifiers = verifiers
+            self._expires_at = self._clock() + max_age
+            self.refreshes += 1
+
+    def _refresh_in_background(self) -> None:
+        """Start a background refresh unless one is already running"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+
+    async def _background_refresh(self) -> None:
+        try:
+            await self.refresh()
+        except TokenVerificationError:
+            pass
+
+    async def get_verifier(self, key_id: str) -> Optional[crypt.Verifier]:
+        """
+        Get the verifier for a key id.
+
+        Args:
+            key_id: The `kid` from the token header
+
+        Returns:
+            The verifier, or None if the key is unknown after a refresh
+        """
+        expires_in = self.expires_in
+        if not self._verifiers or expires_in <= 0:
+            await self.refresh()
+        elif expires_in <= self.refresh_margin:
+            self._refresh_in_background()
+
+        verifier = self._verifiers.get(key_id)
+        if verifier is None and self._clock() - self._last_refresh >= self.min_refresh_interval:
+            # Keys may have been rotated before the cached set expired
+            await self.refresh()
+            verifier = self._verifiers.get(key_id)
+        return verifier
+
+    async def aclose(self) -> None:
+        """Cancel any background refresh"""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+
+
+def _b64decode(segment: str) -> bytes:
+    """Decode an unpadded base64url segment"""
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+class FirebaseTokenVerifier:
+    """
+    Verifies Firebase ID tokens locally against cached signing keys.
+    """
+
+    def __init__(
+        self,
+        project_id: str,
+        key_cache: Optional[PublicKeyCache] = None,
+        clock_skew: float = 0.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Initialize the verifier.
+
+        Args:
+            project_id: Firebase project ID expected in `aud` and `iss`
+            key_cache: Signing key cache (defaults to Google's public keys)
+            clock_skew: Seconds of clock skew tolerated for exp/iat
+            clock: Wall clock
+        """
+        self.project_id = project_id
+        self.issuer = f"{FIREBASE_ISSUER_PREFIX}{project_id}"
+        self.key_cache = key_cache or PublicKeyCache()
+        self.clock_skew = clock_skew
+        self._clock = clock
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Verify an ID token and return its claims.
+
+        Args:
+            token: The encoded ID token
+
+        Returns:
+            The decoded claims, with `uid` set to the subject
+
+        Raises:
+            ExpiredTokenError: If the token has expired
+            TokenVerificationError: If the token is invalid for any other reason
+        """
+        try:
+            header_segment, payload_segment, signature_segment = token.split(".")
+            header = json.loads(_b64decode(header_segment))
+            claims = json.loads(_b64decode(payload_segment))
+            signature = _b64decode(signature_segment)
+        except (ValueError, TypeError, AttributeError) as e:
+            raise TokenVerificationError("Malformed token") from e
+
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise TokenVerificationError("Malformed token")
+        if header.get("alg") != "RS256":
+            raise TokenVerificationError("Unexpected token algorithm")
+
+        key_id = header.get("kid")
+        if not key_id:
+            raise TokenVerificationError("Token has no key id")
+
+        verifier = await self.key_cache.get_verifier(key_id)
+        if verifier is None:
+            raise TokenVerificationError("Token signed with an unknown key")
+
+        signing_input = f"{header_segment}.{payload_segment}".encode("ascii")
+        if not verifier.verify(signing_input, signature):
+            raise TokenVerificationError("Invalid token signature")
+
+        self._check_claims(claims)
+        claims["uid"] = claims["sub"]
+        return claims
+
+    def _check_claims(self, claims: Dict[str, Any]) -> None:
+        """Validate the registered claims of a Firebase ID token"""
+        now = self._clock()
+
+        if claims.get("aud") != self.project_id:
+            raise TokenVerificationError("Token has an incorrect audience")
+        if claims.get("iss") != self.issuer:
+            raise TokenVerificationError("Token has an incorrect issuer")
+
+        subject = claims.get("sub")
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise TokenVerificationError("Token has an invalid subject")
+
+        exp = claims.get("exp")
+        iat = claims.get("iat")
+        if not isinstance(exp, (int, float)) or not isinstance(iat, (int, float)):
+            raise TokenVerificationError("Token is missing exp or iat")
+        if exp <= now - self.clock_skew:
+            raise ExpiredTokenError("Token has expired")
+        if iat > now + self.clock_skew:
+            raise TokenVerificationError("Token was issued in the future")
+
+        auth_time = claims.get("auth_time")
+        if isinstance(auth_time, (int, float)) and auth_time > now + self.clock_skew:
+            raise TokenVerificationError("Token has an invalid auth_time")
+
+
+def user_data_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the user data dictionary used by the services from token claims.
+
+    Args:
+        claims: Verified token claims
+
+    Returns:
+        User data in the same shape as the Firebase Admin based lookup
+    """
+    return {
+        "uid": claims["uid"],
+        "email": claims.get("email"),
+        "email_verified": claims.get("email_verified", False),
+        "display_name": claims.get("name"),
+        "photo_url": claims.get("picture"),
+        "token": claims
+    }
+
+
+def create_verifier_from_env(project_id: Optional[str] = None) -> Optional[FirebaseTokenVerifier]:
+    """
+    Create a local verifier if FIREBASE_LOCAL_VERIFY is enabled.
+
+    Args:
+        project_id: Firebase project ID (defaults to FIREBASE_PROJECT_ID)
+
+    Returns:
+        A verifier, or None if local verification is disabled or not configured
+    """
+    if os.getenv("FIREBASE_LOCAL_VERIFY", "false").lower() != "true":
+        return None
+
+    project_id = project_id or os.getenv("FIREBASE_PROJECT_ID", "")
+    if not project_id:
+        logger.warning("FIREBASE_LOCAL_VERIFY is enabled but FIREBASE_PROJECT_ID is not set. Using Firebase Admin SDK")
+        return None
+
+    key_cache = PublicKeyCache(
+        url=os.getenv("FIREBASE_CERTS_URL", FIREBASE_CERTS_URL),
+        refresh_margin=float(os.getenv("FIREBASE_KEYS_REFRESH_MARGIN", "300")),
+    )
+    return FirebaseTokenVerifier(
+        project_id,
+        key_cache=key_cache,
+        clock_skew=float(os.getenv("FIREBASE_CLOCK_SKEW_SECONDS", "0")),
+    )
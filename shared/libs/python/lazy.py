@@ -0,0 +1,177 @@
+# Shared module, copied into each service. Edit shared/libs/python/lazy.py
+# and run `python shared/libs/sync_python.py` to update the copies.
+"""
+Lazy initialization for GrantCraft services.
+
+Cloud Run starts instances on demand, so everything done at import time is
+paid by the request that triggered the cold start. Clients of Google
+services and the Google libraries themselves are therefore set up on first
+use instead:
+
+    firestore = lazy_import("google.cloud.firestore")   # imported on first attribute access
+    firestore_client = Lazy("firestore", lambda: firestore.Client())
+
+    firestore_client.get()           # built on first call, then cached
+    await firestore_client.aget()    # same, building in a worker thread
+
+Every Lazy registers itself, and `start_warm_up()` (called from a startup
+event) builds them all in the background once the service is up, so most
+of them are ready before the first request needs them. WARM_UP_MODE
+selects how:
+
+* background - warm up after startup without delaying it (default)
+* blocking   - warm up before the service accepts requests
+* off        - only build on first use
+
+A failed build is not cached. The next use tries again. Build times are
+exported as the `lazy_init_duration_seconds` metric.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import threading
+import time
+from types import ModuleType
+from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+WARM_UP_BACKGROUND = "background"
+WARM_UP_BLOCKING = "blocking"
+WARM_UP_OFF = "off"
+
+INIT_DURATION = REGISTRY.gauge(
+    "lazy_init_duration_seconds",
+    "Time taken to build each lazily initialized component",
+    ("component",),
+)
+
+
+class LazyModule(ModuleType):
+    """Module proxy that imports the real module on first attribute access"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_module: Optional[ModuleType] = None
+
+    def _load(self) -> ModuleType:
+        if self._lazy_module is None:
+            self._lazy_module = importlib.import_module(self.__name__)
+        return self._lazy_module
+
+    def __getattr__(self, attribute: str) -> Any:
+        if attribute.startswith("_lazy_"):
+            raise AttributeError(attribute)
+        return getattr(self._load(), attribute)
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Defer importing module `name` until one of its attributes is used"""
+    return LazyModule(name)
+
+
+class Lazy(Generic[T]):
+    """
+    A value built by `factory` on first use.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T], warm_up: bool = True):
+        """
+        Initialize the lazy value.
+
+        Args:
+            name: Component name, used in logs and metrics
+            factory: Builds the value; may block
+            warm_up: Build it in `start_warm_up` as well as on first use
+        """
+        self.name = name
+        self._factory = factory
+        self._value: Optional[T] = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self.duration: Optional[float] = None
+        if warm_up:
+            _registry.append(self)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def get(self) -> T:
+        """The value, built on the calling thread if needed"""
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                started = time.perf_counter()
+                self._value = self._factory()
+                self.duration = time.perf_counter() - started
+                self._ready = True
+                INIT_DURATION.labels(self.name).set(self.duration)
+                logger.info("Initialized %s in %.0f ms", self.name, self.duration * 1000)
+        return self._value
+
+    async def aget(self) -> T:
+        """The value, built in a worker thread if needed so the event loop is not blocked"""
+        if self._ready:
+            return self._value
+        return await asyncio.to_thread(self.get)
+
+    def reset(self) -> None:
+        """Drop the value so the next use builds it again"""
+        with self._lock:
+            self._value = None
+            self._ready = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self._ready,
+            "init_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+        }
+
+
+# Lazy values built by start_warm_up, in creation order
+_registry: List[Lazy] = []
+
+
+async def warm_up(components: Optional[List[Lazy]] = None) -> None:
+    """Build `components` (default: all registered) in worker threads, logging failures"""
+    for component in list(_registry if components is None else components):
+        if component.ready:
+            continue
+        try:
+            await component.aget()
+        except Exception as e:
+            logger.warning("Warm-up of %s failed, it will be retried on first use: %s", component.name, e)
+
+
+_warm_up_task: Optional[asyncio.Task] = None
+
+
+async def start_warm_up(mode: Optional[str] = None) -> Optional[asyncio.Task]:
+    """
+    Warm up the registered components per WARM_UP_MODE. Call from a startup event.
+
+    Returns:
+        The background task in background mode, otherwise None
+    """
+    global _warm_up_task
+    mode = (mode or os.getenv("WARM_UP_MODE", WARM_UP_BACKGROUND)).lower()
+    if mode == WARM_UP_OFF:
+        return None
+    if mode == WARM_UP_BLOCKING:
+        await warm_up()
+        return None
+    # Keep a reference so the task is not garbage collected while it runs
+    _warm_up_task = asyncio.get_running_loop().create_task(warm_up())
+    return _warm_up_task
+
+
+def components() -> Dict[str, Dict[str, Any]]:
+    """State of the registered components, for health endpoints"""
+    return {component.name: component.stats() for component in _registry}
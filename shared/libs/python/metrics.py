@@ -0,0 +1,435 @@
+# Shared module, copied into each service. Edit shared/libs/python/metrics.py
+# and run `python shared/libs/sync_python.py` to update the copies.
+"""
+Prometheus-style metrics for GrantCraft services.
+
+A small in-process registry of counters, gauges and histograms rendered in
+the Prometheus text exposition format, plus an ASGI middleware recording
+per-route request latency, in-flight requests and status codes. Each
+service mounts the registry at `/metrics`:
+
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return metrics_response()
+
+Label cardinality is bounded in two ways: requests are labelled with the
+route template (`/chats/{chat_id}`) rather than the raw path, and every
+metric keeps at most `max_series` label combinations. Further combinations
+are folded into a single series whose label values are all `other`.
+"""
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Label value used once a metric has reached its series limit
+OVERFLOW_LABEL = "other"
+
+# Route label for requests that did not match any route (404s, probes)
+UNMATCHED_ROUTE = "unmatched"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    """Base class of a metric family with a fixed set of label names"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), max_series: int = 1000):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        self._overflowed = False
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any, **labels: Any):
+        """
+        Get the series for a combination of label values.
+
+        Label values may be given positionally, in the order of `labelnames`, or by name.
+        """
+        if labels:
+            values = tuple(labels[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(value) for value in values)
+
+        child = self._children.get(key)
+        if child is not None:
+            return child
+        with self._lock:
+            child = self._children.get(key)
+            if child is not None:
+                return child
+            if len(self._children) >= self.max_series:
+                if not self._overflowed:
+                    self._overflowed = True
+                    logger.warning(f"Metric {self.name} reached {self.max_series} series, folding new labels into '{OVERFLOW_LABEL}'")
+                key = (OVERFLOW_LABEL,) * len(self.labelnames)
+                child = self._children.get(key)
+                if child is not None:
+                    return child
+            child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        """The series of a metric without labels"""
+        return self.labels()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+            self._overflowed = False
+
+    def samples(self) -> List[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        """(suffixed name, label names, label values, value) for every sample"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for name, names, values, value in self.samples():
+            lines.append(f"{name}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class _Value:
+    """A single counter or gauge series"""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+
+class _CounterValue(_Value):
+    """A single counter series"""
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        super().inc(amount)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def samples(self):
+        return [
+            (f"{self.name}_total" if not self.name.endswith("_total") else self.name, self.labelnames, key, child.value)
+            for key, child in list(self._children.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default().dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def samples(self):
+        return [(self.name, self.labelnames, key, child.value) for key, child in list(self._children.items())]
+
+
+class _HistogramValue:
+    """A single histogram series"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the duration of the block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        max_series: int = 1000,
+    ):
+        super().__init__(name, documentation, labelnames, max_series)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def samples(self):
+        samples = []
+        bucket_names = self.labelnames + ("le",)
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(child.buckets, child.counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", bucket_names, key + (_format_value(bound),), cumulative))
+            samples.append((f"{self.name}_bucket", bucket_names, key + ("+Inf",), child.count))
+            samples.append((f"{self.name}_sum", self.labelnames, key, child.sum))
+            samples.append((f"{self.name}_count", self.labelnames, key, child.count))
+        return samples
+
+
+class Registry:
+    """
+    Collection of metrics rendered together.
+
+    Metrics are created through `counter`, `gauge` and `histogram`, which
+    return the existing metric if one with the same name was already registered.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Counter:
+        return self._register(Counter, name, documentation, labelnames, **kwargs)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames, **kwargs)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, **kwargs)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """The registry in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by the service
+REGISTRY = Registry()
+
+
+def metrics_response(registry: Registry = REGISTRY) -> Response:
+    """Response for a `/metrics` endpoint"""
+    return Response(registry.render(), media_type=CONTENT_TYPE_LATEST)
+
+
+def timed(histogram: Histogram, **labels: str) -> Callable:
+    """
+    Decorator observing the duration of a function in `histogram`.
+
+    Works for plain and async functions. An `outcome` label, if the histogram
+    has one, is set to "success" or "error" depending on whether the call raised.
+    """
+    with_outcome = "outcome" in histogram.labelnames
+
+    def series(outcome: str):
+        if with_outcome:
+            return histogram.labels(**labels, outcome=outcome)
+        return histogram.labels(**labels)
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    result = await func(*args, **kwargs)
+                    outcome = "success"
+                    return result
+                finally:
+                    series(outcome).observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = func(*args, **kwargs)
+                outcome = "success"
+                return result
+            finally:
+                series(outcome).observe(time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+def route_template(scope: Scope) -> Optional[str]:
+    """The path template of the route that handled a request, once routing has run"""
+    route = scope.get("route")
+    return getattr(route, "path", None)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, in-flight requests and status codes of HTTP requests.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        registry: Registry = REGISTRY,
+        route_label: Callable[[Scope], Optional[str]] = route_template,
+        excluded_paths: Sequence[str] = ("/metrics",),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application
+            registry: Registry the request metrics are created in
+            route_label: Returns the route label of a finished request; must return
+                values from a bounded set (route templates, not raw paths)
+            excluded_paths: Paths that are not recorded
+            buckets: Latency histogram buckets in seconds
+        """
+        self.app = app
+        self.route_label = route_label
+        self.excluded_paths = set(excluded_paths)
+        self.requests = registry.counter(
+            "http_requests", "HTTP requests by method, route and status code",
+            ("method", "route", "status"),
+        )
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency in seconds until the response is sent",
+            ("method", "route"), buckets=buckets,
+        )
+        self.in_flight = registry.gauge(
+            "http_requests_in_flight", "HTTP requests currently being served", ("method",),
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"] if scope["method"] in KNOWN_METHODS else OVERFLOW_LABEL
+        status_code = 500
+        in_flight = self.in_flight.labels(method)
+        in_flight.inc()
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            in_flight.dec()
+            route = self.route_label(scope) or UNMATCHED_ROUTE
+            self.requests.labels(method, route, status_code).inc()
+            self.latency.labels(method, route).observe(duration)
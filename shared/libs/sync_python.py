@@ -0,0 +1,80 @@
+"""
+Copy the shared Python modules into the services.
+
+Each service is built as its own Docker image from its own directory, so
+the modules in shared/libs/python are copied into every service that uses
+them rather than installed. The copies must not be edited: change the
+module here and run
+
+    python shared/libs/sync_python.py            # update every copy
+    python shared/libs/sync_python.py --check    # exit 1 if a copy differs
+
+The api-gateway test suite runs the check, so a copy that drifts fails CI.
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[2]
+SOURCE_DIR = ROOT / "shared" / "libs" / "python"
+SERVICES_DIR = ROOT / "services"
+
+OBSERVABILITY = ["metrics", "tracing", "deadline", "logging_config", "lazy"]
+AUTH = ["jwt_verifier", "token_guard", "identity"]
+
+# Service -> (package directory the modules are copied into, modules)
+TARGETS: Dict[str, Tuple[str, List[str]]] = {
+    "api-gateway": ("app", OBSERVABILITY + AUTH),
+    "user-service": ("app", OBSERVABILITY + AUTH),
+    "chat-service": ("app", OBSERVABILITY + AUTH),
+    "file-service": ("app/services", OBSERVABILITY + AUTH),
+    "agent-service": ("app", OBSERVABILITY),
+}
+
+
+def copies() -> List[Tuple[Path, Path]]:
+    """Every (source, copy) pair"""
+    pairs = []
+    for service, (package, modules) in TARGETS.items():
+        for module in modules:
+            pairs.append((SOURCE_DIR / f"{module}.py", SERVICES_DIR / service / package / f"{module}.py"))
+    return pairs
+
+
+def stale_copies() -> List[Path]:
+    """Copies that are missing or differ from their source"""
+    return [
+        target for source, target in copies()
+        if not target.exists() or target.read_bytes() != source.read_bytes()
+    ]
+
+
+def sync() -> List[Path]:
+    """Overwrite every stale copy with its source, returning the updated copies"""
+    updated = []
+    for source, target in copies():
+        if not target.exists() or target.read_bytes() != source.read_bytes():
+            target.write_bytes(source.read_bytes())
+            updated.append(target)
+    return updated
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="Only report copies that differ from shared/libs/python")
+    args = parser.parse_args()
+
+    if args.check:
+        stale = stale_copies()
+        for target in stale:
+            print(f"{target.relative_to(ROOT)} differs from shared/libs/python/{target.name}")
+        return 1 if stale else 0
+
+    for target in sync():
+        print(f"Updated {target.relative_to(ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())